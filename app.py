@@ -1,37 +1,56 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from models import db, Project, Note, Task, Subtask
 from datetime import datetime, UTC
 from markupsafe import escape
 from hmac import compare_digest
-import bleach
+import click
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
 from dataclasses import dataclass, field
 import json
 import random
-from backend.inference import LLMInference
+from backend import response_cache, llm_client, resilience
+from backend.router import router, AUTO_MODEL
+from backend.llm_config import MODELS
+import functools
+import logging
 import os
+import threading
+if TYPE_CHECKING:
+    from core.chat_manager import ChatManager
+from core import queries, migrations, bulk, search, http_cache, projects, sqlite_profile, metrics, logging_config, jobs, fast_json, archive, shared_state
 
-# Import ChatManager from the new module
-from core.chat_manager import ChatManager
+# Logi strukturalne (LOG_LEVEL, LOG_FORMAT=text|json)
+logging_config.configure()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Konfiguracja bazy danych
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///rafpad.db'
+# Konfiguracja bazy danych (profil SQLite: WAL, pragmy, pula połączeń)
+sqlite_settings = sqlite_profile.SQLiteProfile.from_env()
+sqlite_profile.configure(app, sqlite_settings)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 
 # Inicjalizacja bazy danych
 db.init_app(app)
+with app.app_context():
+    sqlite_profile.install(db.engine, sqlite_settings)
+    # Metryki: opóźnienia tras, liczba i czas zapytań SQL na żądanie
+    metrics.init_app(app, db.engine)
+
+# Kompresja odpowiedzi (gzip/brotli)
+http_cache.init_app(app)
 
 # Dodaj rate limiting z poprawną konfiguracją
+# Liczniki w pamięci procesu albo, przy SHARED_STATE_URL, wspólne dla wszystkich
+# workerów (core/shared_state.py)
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    storage_uri="memory://",  # Explicit storage configuration
+    storage_uri=shared_state.limiter_storage_uri(),
     default_limits=["200 per day", "50 per hour"]
 )
 
@@ -49,18 +68,46 @@ class ChatMessage:
             'timestamp': self.timestamp.isoformat()
         }
 
-# Inicjalizacja chat managera
-chat_manager = ChatManager()
-
-# Zmień before_first_request na before_request z flagą
-_is_first_request = True
-
-@app.before_request
-def initialize_on_first_request():
-    global _is_first_request
-    if _is_first_request:
-        # Removed initialize_model call since it's no longer needed
-        _is_first_request = False
+# Chat manager (klient LLM, sesje czatu) tworzony leniwie przy pierwszym użyciu,
+# żeby start procesu nie czekał na SDK openai i magazyn sesji
+_chat_manager = None
+_chat_manager_lock = threading.Lock()
+
+def get_chat_manager() -> 'ChatManager':
+    global _chat_manager
+    if _chat_manager is None:
+        with _chat_manager_lock:
+            if _chat_manager is None:
+                # Import tutaj: core.chat_manager ładuje klienta LLM (openai, httpx)
+                from core.chat_manager import ChatManager
+                _chat_manager = ChatManager(sanitize=sanitize_input)
+    return _chat_manager
+
+def _chat_stat(read):
+    # Metryki czatu bez tworzenia chat managera tylko na potrzeby scrapera
+    return lambda: read(_chat_manager) if _chat_manager is not None else 0
+
+metrics.REGISTRY.gauge('llm_in_flight', 'LLM completions currently running.',
+                       lambda: llm_client.stats()['in_flight'])
+metrics.REGISTRY.gauge('chat_sessions_in_memory', 'Chat sessions held in memory.',
+                       _chat_stat(lambda manager: manager.sessions.stats()['in_memory']))
+metrics.REGISTRY.gauge('llm_singleflight_waiters', 'Chat requests waiting on an identical in-flight request.',
+                       _chat_stat(lambda manager: manager.inflight.stats()['waiters']))
+metrics.REGISTRY.callback_counter('llm_singleflight_coalesced_total', 'Chat requests served by an identical in-flight request.',
+                                  _chat_stat(lambda manager: manager.inflight.stats()['coalesced']))
+metrics.REGISTRY.gauge('llm_circuit_state', 'LLM circuit breaker state (0 closed, 1 half-open, 2 open).',
+                       lambda: resilience.STATE_CODES[resilience.upstream.breaker.state])
+metrics.REGISTRY.callback_counter('llm_circuit_rejected_total', 'LLM calls failed fast by the open circuit breaker.',
+                                  lambda: resilience.upstream.breaker.stats()['rejected'])
+metrics.REGISTRY.callback_counter('llm_retries_total', 'LLM attempts retried after a transient failure.',
+                                  lambda: resilience.upstream.stats()['retries'])
+metrics.REGISTRY.callback_counter('llm_hedged_total', 'LLM calls that sent a hedged second request.',
+                                  lambda: resilience.upstream.stats()['hedged'])
+metrics.REGISTRY.gauge('jobs_in_flight', 'Background jobs currently running.',
+                       lambda: jobs.queue.stats()['in_flight'])
+
+# Archiwizacja usuniętych wierszy i odzyskiwanie miejsca (core/archive.py)
+jobs.queue.register('compact', archive.run_compact_job)
 
 @app.route('/')
 def index():
@@ -68,13 +115,9 @@ def index():
 
 # API dla projektów
 @app.route('/api/projects', methods=['GET'])
+@http_cache.conditional(http_cache.projects_validators)
 def get_projects():
-    projects = Project.query.all()
-    return jsonify([{
-        'id': p.id,
-        'tag': p.tag,
-        'name': p.name
-    } for p in projects])
+    return fast_json.json_response(queries.list_projects())
 
 @app.route('/api/projects', methods=['POST'])
 def create_project():
@@ -90,16 +133,19 @@ def create_project():
 
 # API dla notatek
 @app.route('/api/notes', methods=['GET'])
+@http_cache.conditional(http_cache.notes_validators)
 def get_notes():
-    notes = Note.query.filter_by(deleted_at=None).all()
-    return jsonify([{
-        'id': n.id,
-        'content': n.content,
-        'category': n.category,
-        'project_tag': n.project.tag,
-        'created_at': n.created_at.isoformat(),
-        'updated_at': n.updated_at.isoformat()
-    } for n in notes])
+    try:
+        params = queries.ListParams.from_args(request.args, queries.NOTE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Core select() -> dicts -> orjson, without ORM objects (core/queries.py)
+    notes, next_cursor = queries.list_notes(params)
+    response = fast_json.json_response(notes)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/api/notes', methods=['POST'])
 @limiter.limit("100 per day")
@@ -108,26 +154,18 @@ def create_note():
         data = request.json
         content = sanitize_input(data.get('content', ''))
         
-        # Znajdź projekt po tagu lub stwórz nowy
-        project_tag = data.get('project_tag', '#inbox')
-        project = Project.query.filter_by(tag=project_tag).first()
-        if not project and project_tag != '#inbox':
-            # Stwórz nowy projekt
-            project = Project(tag=project_tag, name=project_tag.replace('#', ''))
-            db.session.add(project)
-            try:
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                return jsonify({'error': f'Failed to create project: {str(e)}'}), 400
-        
-        if not project:
-            project = Project.query.filter_by(tag='#inbox').first()
+        # Znajdź projekt po tagu lub stwórz nowy (w tej samej transakcji co notatka)
+        project_tag = data.get('project_tag') or projects.DEFAULT_TAG
+        try:
+            project_id = projects.get_or_create(project_tag)
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Failed to create project: {str(e)}'}), 400
         
         note = Note(
             content=content,
             category=data.get('category'),
-            project_id=project.id
+            project_id=project_id
         )
         
         db.session.add(note)
@@ -137,7 +175,7 @@ def create_note():
                 'id': note.id,
                 'content': note.content,
                 'category': note.category,
-                'project_tag': note.project.tag,
+                'project_tag': project_tag,
                 'created_at': note.created_at.isoformat()
             }), 201
         except Exception as e:
@@ -148,45 +186,23 @@ def create_note():
 
 # API dla zadań
 @app.route('/api/tasks', methods=['GET'])
+@http_cache.conditional(http_cache.tasks_validators)
 def get_tasks():
-    tasks = Task.query.filter_by(deleted_at=None).all()
-    return jsonify([{
-        'id': t.id,
-        'content': t.content,
-        'category': t.category,
-        'priority': t.priority,
-        'deadline': t.deadline.isoformat() if t.deadline else None,
-        'is_completed': t.is_completed,
-        'project_tag': t.project.tag,
-        'created_at': t.created_at.isoformat(),
-        'updated_at': t.updated_at.isoformat(),
-        'subtasks': [{
-            'id': s.id,
-            'content': s.content,
-            'is_completed': s.is_completed
-        } for s in t.subtasks]
-    } for t in tasks])
+    try:
+        params = queries.ListParams.from_args(request.args, queries.TASK_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    tasks, next_cursor = queries.list_tasks(params)
+    response = fast_json.json_response(tasks)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
     data = request.json
     
-    # Znajdź projekt po tagu lub stwórz nowy
-    project_tag = data.get('project_tag', '#inbox')
-    project = Project.query.filter_by(tag=project_tag).first()
-    if not project and project_tag != '#inbox':
-        # Stwórz nowy projekt
-        project = Project(tag=project_tag, name=project_tag.replace('#', ''))
-        db.session.add(project)
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': f'Failed to create project: {str(e)}'}), 400
-    
-    if not project:
-        project = Project.query.filter_by(tag='#inbox').first()
-    
     # Konwersja deadline string na datetime jeśli istnieje
     deadline = None
     if data.get('deadline'):
@@ -195,12 +211,20 @@ def create_task():
         except ValueError:
             return jsonify({'error': 'Invalid deadline format'}), 400
     
+    # Znajdź projekt po tagu lub stwórz nowy (w tej samej transakcji co zadanie)
+    project_tag = data.get('project_tag') or projects.DEFAULT_TAG
+    try:
+        project_id = projects.get_or_create(project_tag)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to create project: {str(e)}'}), 400
+    
     task = Task(
         content=data['content'],
         category=data.get('category'),
         priority=data.get('priority'),
         deadline=deadline,
-        project_id=project.id
+        project_id=project_id
     )
     
     # Dodaj podzadania jeśli istnieją
@@ -218,7 +242,7 @@ def create_task():
             'category': task.category,
             'priority': task.priority,
             'deadline': task.deadline.isoformat() if task.deadline else None,
-            'project_tag': task.project.tag,
+            'project_tag': project_tag,
             'created_at': task.created_at.isoformat(),
             'subtasks': [{
                 'id': s.id,
@@ -230,75 +254,178 @@ def create_task():
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
+def _bulk_response(results):
+    created = sum(1 for r in results if r['status'] == 'created')
+    return jsonify({
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }), 201 if created else 400
+
+# Masowe dodawanie: lista obiektów lub {"items": [...]}, wszystko w jednej transakcji
+@app.route('/api/tasks/bulk', methods=['POST'])
+def bulk_create_tasks():
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+    try:
+        return _bulk_response(bulk.bulk_create_tasks(items))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/notes/bulk', methods=['POST'])
+def bulk_create_notes():
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+    try:
+        return _bulk_response(bulk.bulk_create_notes(items, sanitize=sanitize_input))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/add_ai_task', methods=['POST'])
 def add_ai_task():
     '''
     Endpoint to add new task created by AI (LLM).
-    Recevies a prompt in JSON format, uses LLM to generate task content,
-    then adds the task to the database.
+    Recevies a prompt in JSON format and queues a background job that uses LLM
+    to generate task content and adds the task to the database.
+    Responds 202 with the job id; poll /api/jobs/<id> for the created task_id.
     '''
     task_data = request.json
     if not task_data or 'prompt' not in task_data:
         return jsonify({'error': 'Prompt is required'}), 400
     
-    prompt = task_data['prompt']
-    generated_content = chat_manager.generate_task_content_with_LLM(prompt)
-    if not generated_content:
-        return jsonify({'error': 'Failed to generate task content'}), 500
-    
-    project_tag = task_data.get('project_tag', '#inbox') #default project
-    category = task_data.get('category', '')
-    priority = task_data.get('priority', '')
     deadline_str = task_data.get('deadline', None) # Deadline as string from JSON
-    deadline = None # Initialize deadline as None
 
-    #Converts string deadline to datetime object
+    # Validate the deadline now, so a bad request fails here and not in the job
     if deadline_str:
         try:
-            deadline = datetime.fromisoformat(deadline_str)
+            datetime.fromisoformat(deadline_str)
         except ValueError:
             return jsonify({'error': 'Invalid deadline format'}), 400
     
-    # Search for project with given project_tag or make a new one if it doesn't exist (if project_tag is not #inbox)
-    project = Project.query.filter_by(tag=project_tag).first()
-    if not project and project_tag != '#inbox':
-        project = Project(tag=project_tag, name=project_tag.replace('#', ''))
-        db.session.add(project)
-        try:
-            db.session.commit() # Commit the project to the database to retrieve its ID
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'error': f'Failed to create project: {str(e)}'}), 400
-    
-    if not project: # If project still doesn't exist (for example #imbox not found)
-        project = Project.query.filter_by(tag='#inbox').first()
-        if not project: # Emergency create #inbox project
-            project = Project(tag='#inbox', name='Inbox')
-            db.session.add(project)
-            db.session.commit()
-
-    # Create new task with generated content    
-    task = Task(
-        content=generated_content,
-        category=category,
-        priority=priority,
-        deadline=deadline,
-        project_id=project.id # Use the project ID to link the task to the project
+    job_id = jobs.queue.submit('ai_task', {
+        'prompt': task_data['prompt'],
+        'project_tag': task_data.get('project_tag', '#inbox'), #default project
+        'category': task_data.get('category', ''),
+        'priority': task_data.get('priority', ''),
+        'deadline': deadline_str,
+    })
+    return jsonify({
+        'message': 'AI task queued',
+        'job_id': job_id,
+        'status_url': f'/api/jobs/{job_id}'
+    }), 202, {'Location': f'/api/jobs/{job_id}'}
 
-    )
+def run_ai_task_job(payload):
+    '''
+    Job handler for 'ai_task': generate the task content with LLM and store the task.
+    Raises on failure so the job queue can retry it.
+    '''
+    generated_content = get_chat_manager().generate_task_content_with_LLM(payload['prompt'])
+    if not generated_content:
+        raise ValueError('Failed to generate task content')
 
-    db.session.add(task)
+    deadline = datetime.fromisoformat(payload['deadline']) if payload.get('deadline') else None
     try:
+        # Resolve project_tag through the tag cache, creating the project in this transaction if needed
+        project_id = projects.get_or_create(payload.get('project_tag') or projects.DEFAULT_TAG)
+
+        # Create new task with generated content
+        task = Task(
+            content=generated_content,
+            category=payload.get('category', ''),
+            priority=payload.get('priority', ''),
+            deadline=deadline,
+            project_id=project_id # Use the project ID to link the task to the project
+        )
+        db.session.add(task)
         db.session.commit()
-        return jsonify({
-            'message': 'AI task added successfully',
-            'task_id': task.id # Return the task ID to the client
-        }), 201
-    except Exception as e:
+    except Exception:
         db.session.rollback()
+        raise
+    return {'task_id': task.id, 'project_tag': payload.get('project_tag') or projects.DEFAULT_TAG}
+
+jobs.queue.register('ai_task', run_ai_task_job)
+
+# Status zadania w tle (kolejka core/jobs.py)
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@limiter.limit("120 per minute")  # Odpytywanie w pętli
+def get_job(job_id):
+    job = jobs.queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
+# Endpointy administracyjne: wymagają nagłówka X-Admin-Token równego ADMIN_TOKEN
+# (bez ustawionego ADMIN_TOKEN są wyłączone)
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.environ.get('ADMIN_TOKEN', '')
+        if not token:
+            return jsonify({'error': 'Admin API is disabled (set ADMIN_TOKEN)'}), 403
+        if not compare_digest(request.headers.get('X-Admin-Token', '').encode(), token.encode()):
+            return jsonify({'error': 'Invalid admin token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# Archiwum usuniętych elementów (przenoszonych przez kompaktowanie)
+@app.route('/api/admin/archive/<string:element_type>', methods=['GET'])
+@admin_required
+def get_archived(element_type):
+    if element_type not in archive.TABLES:
+        return jsonify({'error': 'Invalid element type'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    return jsonify(archive.list_archived(element_type, limit, offset))
+
+@app.route('/api/admin/archive/<string:element_type>/<int:element_id>/restore', methods=['POST'])
+@admin_required
+def restore_archived(element_type, element_id):
+    if element_type not in archive.TABLES:
+        return jsonify({'error': 'Invalid element type'}), 400
+    try:
+        return jsonify(archive.restore(element_type, element_id))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except archive.RestoreConflict as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/admin/compact', methods=['POST'])
+@admin_required
+def compact_database():
+    '''Queue a compaction job; optional JSON body {"retention_days": N}.'''
+    data = request.get_json(silent=True) or {}
+    retention_days = data.get('retention_days')
+    if retention_days is not None and (not isinstance(retention_days, int) or retention_days < 0):
+        return jsonify({'error': 'retention_days must be a non-negative integer'}), 400
+    job_id = jobs.queue.submit('compact', {'retention_days': retention_days}, max_attempts=1)
+    return jsonify({
+        'message': 'Compaction queued',
+        'job_id': job_id,
+        'status_url': f'/api/jobs/{job_id}'
+    }), 202, {'Location': f'/api/jobs/{job_id}'}
+
+# Wyszukiwanie pełnotekstowe (FTS5) w notatkach, zadaniach i podzadaniach
+@app.route('/api/search', methods=['GET'])
+def search_elements():
+    query = request.args.get('q', '')
+    kinds = [k.strip() for k in request.args.get('type', '').split(',') if k.strip()]
+    try:
+        limit = int(request.args.get('limit', 20))
+        offset = int(request.args.get('offset', 0))
+        results = search.search(query, project_tag=request.args.get('project_tag') or None,
+                                kinds=kinds or None, limit=limit, offset=offset)
+    except ValueError as e:
         return jsonify({'error': str(e)}), 400
-
-
+    return jsonify({
+        'query': query,
+        'results': results,
+        'next_offset': offset + len(results) if len(results) == min(max(limit, 1), search.MAX_RESULTS) else None
+    })
 
 # Endpoint do przenoszenia notatek między projektami
 @app.route('/api/notes/<int:note_id>/move', methods=['PATCH'])
@@ -310,12 +437,12 @@ def move_note(note_id):
         return jsonify({'error': 'New project tag is required'}), 400
         
     note = Note.query.get_or_404(note_id)
-    new_project = Project.query.filter_by(tag=new_project_tag).first()
+    new_project_id = projects.resolve(new_project_tag)
     
-    if not new_project:
+    if new_project_id is None:
         return jsonify({'error': 'Target project not found'}), 404
         
-    note.project_id = new_project.id
+    note.project_id = new_project_id
     note.updated_at = datetime.utcnow()
     
     try:
@@ -324,7 +451,7 @@ def move_note(note_id):
             'id': note.id,
             'content': note.content,
             'category': note.category,
-            'project_tag': note.project.tag,
+            'project_tag': new_project_tag,
             'updated_at': note.updated_at.isoformat()
         })
     except Exception as e:
@@ -341,12 +468,12 @@ def move_task(task_id):
         return jsonify({'error': 'New project tag is required'}), 400
         
     task = Task.query.get_or_404(task_id)
-    new_project = Project.query.filter_by(tag=new_project_tag).first()
+    new_project_id = projects.resolve(new_project_tag)
     
-    if not new_project:
+    if new_project_id is None:
         return jsonify({'error': 'Target project not found'}), 404
         
-    task.project_id = new_project.id
+    task.project_id = new_project_id
     task.updated_at = datetime.utcnow()
     
     try:
@@ -356,7 +483,7 @@ def move_task(task_id):
             'content': task.content,
             'category': task.category,
             'priority': task.priority,
-            'project_tag': task.project.tag,
+            'project_tag': new_project_tag,
             'updated_at': task.updated_at.isoformat()
         })
     except Exception as e:
@@ -379,6 +506,9 @@ def soft_delete_element(element_type, element_id):
     element = Model.query.get_or_404(element_id)
     
     element.deleted_at = datetime.utcnow()
+    if Model is Subtask:
+        # Subtasks have no updated_at; touch the task so its ETag changes
+        element.task.updated_at = element.deleted_at
     
     try:
         db.session.commit()
@@ -389,16 +519,10 @@ def soft_delete_element(element_type, element_id):
 
 # Endpoint do pobierania pojedynczej notatki
 @app.route('/api/notes/<int:note_id>', methods=['GET'])
+@http_cache.conditional(http_cache.note_validators)
 def get_note(note_id):
-    note = Note.query.get_or_404(note_id)
-    return jsonify({
-        'id': note.id,
-        'content': note.content,
-        'category': note.category,
-        'project_tag': note.project.tag,
-        'created_at': note.created_at.isoformat(),
-        'updated_at': note.updated_at.isoformat()
-    })
+    note = queries.get_note_or_404(note_id)
+    return jsonify(queries.note_to_dict(note))
 
 # Endpoint do aktualizacji notatki
 @app.route('/api/notes/<int:note_id>', methods=['PUT'])
@@ -408,9 +532,9 @@ def update_note(note_id):
     
     # Znajdź projekt po tagu lub zostaw obecny
     if 'project_tag' in data:
-        project = Project.query.filter_by(tag=data['project_tag']).first()
-        if project:
-            note.project_id = project.id
+        project_id = projects.resolve(data['project_tag'])
+        if project_id is not None:
+            note.project_id = project_id
     
     # Aktualizuj pozostałe pola
     if 'content' in data:
@@ -435,23 +559,10 @@ def update_note(note_id):
 
 # Endpoint do pobierania pojedynczego zadania
 @app.route('/api/tasks/<int:task_id>', methods=['GET'])
+@http_cache.conditional(http_cache.task_validators)
 def get_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    return jsonify({
-        'id': task.id,
-        'content': task.content,
-        'category': task.category,
-        'priority': task.priority,
-        'deadline': task.deadline.isoformat() if task.deadline else None,
-        'project_tag': task.project.tag,
-        'created_at': task.created_at.isoformat(),
-        'updated_at': task.updated_at.isoformat(),
-        'subtasks': [{
-            'id': s.id,
-            'content': s.content,
-            'is_completed': s.is_completed
-        } for s in task.subtasks]
-    })
+    task = queries.get_task_or_404(task_id)
+    return jsonify(queries.task_to_dict(task))
 
 # Endpoint do aktualizacji zadania
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
@@ -461,9 +572,9 @@ def update_task(task_id):
     
     # Znajdź projekt po tagu lub zostaw obecny
     if 'project_tag' in data:
-        project = Project.query.filter_by(tag=data['project_tag']).first()
-        if project:
-            task.project_id = project.id
+        project_id = projects.resolve(data['project_tag'])
+        if project_id is not None:
+            task.project_id = project_id
     
     # Aktualizuj pozostałe pola
     if 'content' in data:
@@ -498,13 +609,12 @@ def update_task(task_id):
 # Tworzenie bazy danych i domyślnego projektu #inbox
 def init_db():
     with app.app_context():
-        db.create_all()
-        # Sprawdź czy #inbox już istnieje
-        inbox = Project.query.filter_by(tag='#inbox').first()
-        if not inbox:
-            inbox = Project(tag='#inbox', name='Inbox')
-            db.session.add(inbox)
-            db.session.commit()
+        sqlite_profile.self_check(db.engine, sqlite_settings)
+        migrations.ensure_schema(db)
+        # Wczytaj tagi projektów do cache i upewnij się, że #inbox istnieje
+        projects.warm()
+        projects.get_or_create(projects.DEFAULT_TAG)
+        db.session.commit()
 
 # Dodaj walidację danych
 def validate_content(content):
@@ -515,7 +625,8 @@ def validate_content(content):
     return content.strip()
 
 def sanitize_input(text):
-    # Usuń niebezpieczne tagi HTML
+    # Usuń niebezpieczne tagi HTML (bleach importowany dopiero przy pierwszym zapisie)
+    import bleach
     return bleach.clean(text, tags=[], strip=True)
 
 # Nowe endpointy dla czatu
@@ -530,21 +641,58 @@ def chat():
         return jsonify({'error': 'Missing message or session_id'}), 400
     
     try:
-        response = chat_manager.generate_response(message, session_id)
+        response = get_chat_manager().generate_response(message, session_id)
         return jsonify({
             'response': response,
-            'history': chat_manager.get_chat_history(session_id)
+            'history': get_chat_manager().get_chat_history(session_id)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _sse_event(event: str, data: dict) -> str:
+    """Format a single Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+@limiter.limit("50 per minute")
+def chat_stream():
+    """Stream the chat answer as Server-Sent Events.
+
+    Events: ``reasoning`` / ``delta`` with ``{"content": ...}`` while tokens
+    arrive, then ``done`` with the final response (after any tool calls) and history.
+    """
+    data = request.json
+    message = data.get('message')
+    session_id = data.get('session_id')
+    
+    if not message or not session_id:
+        return jsonify({'error': 'Missing message or session_id'}), 400
+    
+    def generate():
+        try:
+            for kind, text in get_chat_manager().generate_response_stream(message, session_id):
+                if kind == 'done':
+                    yield _sse_event('done', {
+                        'response': text,
+                        'history': get_chat_manager().get_chat_history(session_id)
+                    })
+                else:
+                    yield _sse_event('reasoning' if kind == 'reasoning' else 'delta', {'content': text})
+        except Exception as e:
+            yield _sse_event('error', {'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering so tokens reach the browser immediately
+    })
+
 @app.route('/api/chat/history', methods=['GET'])
 def get_chat_history():
     session_id = request.args.get('session_id')
     if not session_id:
         return jsonify({'error': 'Missing session_id'}), 400
     
-    history = chat_manager.get_chat_history(session_id)
+    history = get_chat_manager().get_chat_history(session_id)
     return jsonify({'history': history})
 
 @app.route('/api/chat/clear', methods=['POST'])
@@ -553,18 +701,14 @@ def clear_chat():
     if not session_id:
         return jsonify({'error': 'Missing session_id'}), 400
     
-    chat_manager.clear_chat_history(session_id)
+    get_chat_manager().clear_chat_history(session_id)
     return jsonify({'message': 'Chat history cleared'})
 
 @app.route('/api/chat/test', methods=['GET'])
 def test_chat():
     try:
-        if chat_manager.model is None:
-            chat_manager.initialize_model()
-        response = chat_manager.generate_response(
-            "Hello, how are you?",
-            "test_session"
-        )
+        # Bez sesji i historii: sonda niczego nie dopisuje do historii czatu
+        response = get_chat_manager().llm.generate_response("Hello, how are you?")
         return jsonify({
             'status': 'success',
             'response': response
@@ -601,7 +745,7 @@ def create_from_chat():
             })
         
         # Generuj odpowiedź z kontekstem
-        response = chat_manager.generate_response(message, session_id, context)
+        response = get_chat_manager().generate_response(message, session_id, context)
         
         return jsonify({
             'response': response,
@@ -610,35 +754,67 @@ def create_from_chat():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/chat/cache/stats', methods=['GET'])
+def get_llm_cache_stats():
+    """Hit/miss statistics of the LLM response cache and of request coalescing"""
+    cache = response_cache.get_cache()
+    single_flight = get_chat_manager().inflight.stats()
+    if cache is None:
+        return jsonify({'enabled': False, 'single_flight': single_flight})
+    return jsonify({'enabled': True, **cache.stats(), 'single_flight': single_flight})
+
+# Stan połączenia z LLM: circuit breaker, ponowienia, zapytania zabezpieczające (hedging)
+@app.route('/api/chat/upstream', methods=['GET'])
+def get_llm_upstream_status():
+    return jsonify({**resilience.stats(), 'pool': llm_client.stats()})
+
+# Automatyczny wybór modelu: stan modeli, liczba decyzji, ostatnie decyzje i progi
+@app.route('/api/chat/router', methods=['GET'])
+def get_router_status():
+    return jsonify(router.stats())
+
+# Metryki w formacie Prometheus (dla scrapera, bez limitu zapytań)
+@app.route('/metrics', methods=['GET'])
+@limiter.exempt
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # Nowe endpointy dla zarządzania modelami
 @app.route('/api/chat/models', methods=['GET'])
 def get_available_models():
-    """Zwraca listę dostępnych modeli"""
-    return jsonify(chat_manager.llm.get_available_models())
+    """Zwraca listę dostępnych modeli (z trybem automatycznym)"""
+    return jsonify({**MODELS, 'auto': AUTO_MODEL})
 
 @app.route('/api/chat/model', methods=['PUT'])
 def switch_model():
-    """Przełącza aktualny model"""
+    """Przełącza model dla sesji (session_id) lub domyślny model bez sesji"""
     data = request.json
     model_type = data.get('model_type')
     
     if not model_type:
         return jsonify({'error': 'Missing model_type parameter'}), 400
         
-    if chat_manager.llm.switch_model(model_type):
-        return jsonify({
-            'message': f'Successfully switched to {model_type} model',
-            'model_info': chat_manager.llm.MODELS[model_type]
-        })
-    else:
+    try:
+        if model_type == 'auto':
+            # Model wybierany osobno dla każdego pytania (backend/router.py)
+            get_chat_manager().update_config(data.get('session_id'), auto_route=True)
+        else:
+            get_chat_manager().update_config(data.get('session_id'), model_type=model_type, auto_route=False)
+    except ValueError:
         return jsonify({'error': 'Invalid model type'}), 400
+    return jsonify({
+        'message': f'Successfully switched to {model_type} model',
+        'model_info': AUTO_MODEL if model_type == 'auto' else MODELS[model_type]
+    })
 
 # Endpoint to save AI settings
 @app.route('/api/chat/settings', methods=['POST'])
 def save_chat_settings():
-    """Save AI settings.
+    """Save AI settings for a chat session.
 
     Expected JSON fields:
+    - session_id: chat session the settings apply to; without it they become
+      the default for sessions that have no settings of their own
     - temperature: float between 0 and 2 (controls randomness)
     - maxTokens: integer between 1 and 4096 (max response length)
     - apiKey: string, API key for authentication
@@ -651,36 +827,31 @@ def save_chat_settings():
     """
     data = request.json
     try:
-        temperature = float(data.get('temperature', 0.7))
-        max_tokens = int(data.get('maxTokens', 512))
-        
-        if not 0 <= temperature <= 2:
-            return jsonify({'error': 'Temperature must be between 0 and 2'}), 400
-        if not 1 <= max_tokens <= 4096:
-            return jsonify({'error': 'Max tokens must be between 1 and 4096'}), 400
-        
-        # Update settings in chat manager
-        chat_manager.llm.temperature = temperature
-        chat_manager.llm.max_tokens = max_tokens
-        
-        chat_manager.user_identity = data.get('userIdentity', '')
-        chat_manager.short_term_plans = data.get('shortTermPlans', '')
-        chat_manager.long_term_plans = data.get('longTermPlans', '')
-        chat_manager.response_tone = data.get('responseTone', '')
-        chat_manager.response_length = data.get('responseLength', '')
-        chat_manager.llm_subject_area = data.get('llmSubjectArea', '')
+        # A new immutable config replaces the session's one; requests already
+        # running keep the snapshot they started with
+        config = get_chat_manager().update_config(
+            data.get('session_id'),
+            temperature=float(data.get('temperature', 0.7)),
+            max_tokens=int(data.get('maxTokens', 512)),
+            user_identity=data.get('userIdentity', ''),
+            short_term_plans=data.get('shortTermPlans', ''),
+            long_term_plans=data.get('longTermPlans', ''),
+            response_tone=data.get('responseTone', ''),
+            response_length=data.get('responseLength', ''),
+            llm_subject_area=data.get('llmSubjectArea', ''),
+        )
         
         return jsonify({
             'message': 'Settings saved successfully',
             'settings': {
-                'temperature': temperature,
-                'maxTokens': max_tokens,
-                'userIdentity': chat_manager.user_identity,
-                'shortTermPlans': chat_manager.short_term_plans,
-                'longTermPlans': chat_manager.long_term_plans,
-                'responseTone': chat_manager.response_tone,
-                'responseLength': chat_manager.response_length,
-                'llmSubjectArea': chat_manager.llm_subject_area
+                'temperature': config.temperature,
+                'maxTokens': config.max_tokens,
+                'userIdentity': config.user_identity,
+                'shortTermPlans': config.short_term_plans,
+                'longTermPlans': config.long_term_plans,
+                'responseTone': config.response_tone,
+                'responseLength': config.response_length,
+                'llmSubjectArea': config.llm_subject_area
 
             }
         })
@@ -689,28 +860,73 @@ def save_chat_settings():
     except Exception as e:
         return jsonify({'error': f'Failed to save settings: {str(e)}'}), 500
 
-# Dodaj inicjalizację chat managera przy starcie aplikacji
+# Inicjalizacja aplikacji: schemat bazy, cache projektów i kolejka zadań
+# (chat manager powstaje leniwie, patrz get_chat_manager)
 def create_app():
     with app.app_context():
-        # Inicjalizacja bazy danych
-        db.create_all()
+        # Inicjalizacja bazy danych: create_all i migracje tylko gdy
+        # PRAGMA user_version jest starsza niż najnowsza migracja
+        sqlite_profile.self_check(db.engine, sqlite_settings)
+        migrations.ensure_schema(db)
         
-        # Sprawdź czy #inbox już istnieje
-        inbox = Project.query.filter_by(tag='#inbox').first()
-        if not inbox:
-            print("Creating default #inbox project...")
-            inbox = Project(tag='#inbox', name='Inbox')
-            db.session.add(inbox)
+        # Wczytaj tagi projektów do cache (tag -> id); #inbox sprawdzany już z cache
+        projects.warm()
+        if projects.resolve(projects.DEFAULT_TAG) is None:
             try:
+                projects.get_or_create(projects.DEFAULT_TAG)
                 db.session.commit()
-                print("Default #inbox project created successfully")
+                logger.info("db.inbox_created")
             except Exception as e:
                 db.session.rollback()
-                print(f"Error creating default #inbox project: {str(e)}")
-        
-        # Removed chat_manager.initialize_model() call since it's not needed
+                logger.error("db.inbox_create_failed", extra={"error": str(e)})
+
+    # Uruchom kolejkę zadań w tle i wznów niedokończone zadania
+    jobs.queue.init_app(app)
+    # Okresowe kompaktowanie (ARCHIVE_INTERVAL_HOURS=0 wyłącza)
+    if archive.INTERVAL_HOURS > 0:
+        jobs.queue.schedule('compact', archive.INTERVAL_HOURS * 3600)
     return app
 
+# Komendy CLI do utrzymania bazy: flask --app app upgrade-db / check-query-plans / compact-db
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Upgrade the existing database (instance/rafpad.db) in place."""
+    applied = migrations.upgrade(db.engine)
+    with db.engine.connect() as connection:
+        version = migrations.get_version(connection)
+    if applied:
+        print(f"Applied migrations: {applied}")
+    print(f"Schema version: {version} (latest {migrations.LATEST_VERSION})")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Verify with EXPLAIN QUERY PLAN that the list endpoints use their indexes."""
+    with db.engine.connect() as connection:
+        results = migrations.check_query_plans(connection)
+    failed = False
+    for name, uses_index, plan in results:
+        print(f"[{'OK' if uses_index else 'MISSING INDEX'}] {name}")
+        for line in plan:
+            print(f"    {line}")
+        failed = failed or not uses_index
+    if failed:
+        raise SystemExit(1)
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index from notes, tasks and subtasks."""
+    print(f"Indexed rows: {search.rebuild_index()}")
+
+@app.cli.command('compact-db')
+@click.option('--days', type=int, default=None, help='Retention in days (default ARCHIVE_RETENTION_DAYS).')
+@click.option('--full-vacuum', is_flag=True, help='Rewrite the whole file with VACUUM (needs exclusive access).')
+def compact_db_command(days, full_vacuum):
+    """Archive rows soft deleted longer than the retention period, then vacuum."""
+    result = archive.compact(days, full_vacuum=full_vacuum)
+    print(f"Archived: {result['archived']} (deleted before {result['cutoff']})")
+    if 'free_pages_after' in result:
+        print(f"Free pages: {result['free_pages_before']} -> {result['free_pages_after']}")
+
 if __name__ == '__main__':
     create_app()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Token-budgeted context window for chat requests.
+
+Instead of always sending the last N messages, the builder packs the most
+recent messages that fit the model's prompt budget and collapses everything
+older into a short rolling summary. The summary is extractive (no extra LLM
+call) and cached by conversation prefix, so extending a conversation by a turn
+only summarizes the messages that newly fell out of the window.
+
+Token counts are estimated from character length; no tokenizer is shipped for
+the DeepSeek models, and a conservative estimate is enough to bound cost.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Total prompt budget (system + summary + history + prompt) per model
+MODEL_BUDGETS = {
+    "deepseek-chat": 4000,
+    "deepseek-reasoner": 3000,
+}
+DEFAULT_BUDGET = 3000
+SUMMARY_BUDGET = 300
+MESSAGE_OVERHEAD = 4  # role and separators
+CHARS_PER_TOKEN = 3.5
+SUMMARY_LINE_CHARS = 160
+
+_whitespace = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def _summary_line(message: Dict[str, str]) -> str:
+    role = "Użytkownik" if message["role"] == "user" else "Asystent"
+    text = _whitespace.sub(" ", message["content"]).strip()
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS].rstrip() + "…"
+    return f"- {role}: {text}"
+
+
+class ContextBuilder:
+    def __init__(self, budget_tokens: int, summary_tokens: int = SUMMARY_BUDGET, cache_size: int = 256):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, system_prompt: str, history: Optional[List[Dict[str, str]]], prompt: str) -> List[Dict[str, str]]:
+        """Return the message list for a request, without the final user prompt."""
+        messages = [{"role": "system", "content": system_prompt}]
+        history = [
+            {"role": "user" if msg["role"] == "user" else "assistant", "content": msg["content"]}
+            for msg in (history or [])
+        ]
+        used = message_tokens(messages[0]) + estimate_tokens(prompt) + MESSAGE_OVERHEAD
+        available = self.budget_tokens - used
+
+        # Walk backwards and keep the newest messages that fit
+        kept: List[Dict[str, str]] = []
+        for msg in reversed(history):
+            cost = message_tokens(msg)
+            # Keep room for the summary if anything will be collapsed
+            reserve = self.summary_tokens if len(kept) + 1 < len(history) else 0
+            if cost + reserve > available:
+                break
+            kept.append(msg)
+            available -= cost
+        kept.reverse()
+
+        collapsed = history[:len(history) - len(kept)]
+        if collapsed:
+            summary = self.summarize(collapsed)
+            messages.append({
+                "role": "system",
+                "content": "Podsumowanie wcześniejszej rozmowy:\n" + summary
+            })
+        return messages + kept
+
+    def summarize(self, collapsed: List[Dict[str, str]]) -> str:
+        """Rolling extractive summary of the collapsed turns, reusing cached prefixes."""
+        digests = self._prefix_digests(collapsed)
+        with self._lock:
+            if digests[-1] in self._summaries:
+                self._summaries.move_to_end(digests[-1])
+                return "\n".join(self._summaries[digests[-1]])
+            # Find the longest already summarized prefix
+            base, start = [], 0
+            for cut in range(len(collapsed) - 1, 0, -1):
+                cached = self._summaries.get(digests[cut - 1])
+                if cached is not None:
+                    base, start = cached, cut
+                    break
+
+        lines = self._fit(list(base) + [_summary_line(m) for m in collapsed[start:]])
+        with self._lock:
+            self._summaries[digests[-1]] = lines
+            self._summaries.move_to_end(digests[-1])
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return "\n".join(lines)
+
+    def _fit(self, lines: List[str]) -> List[str]:
+        # Keep the newest lines within the summary budget
+        total, kept = 0, []
+        for line in reversed(lines):
+            cost = estimate_tokens(line) + 1
+            if total + cost > self.summary_tokens:
+                kept.append("- …")
+                break
+            kept.append(line)
+            total += cost
+        kept.reverse()
+        return kept
+
+    @staticmethod
+    def _prefix_digests(messages: List[Dict[str, str]]) -> List[str]:
+        digests, running = [], hashlib.sha256()
+        for msg in messages:
+            running.update(msg["role"].encode() + b"\x00" + msg["content"].encode() + b"\x01")
+            digests.append(running.copy().hexdigest())
+        return digests
+
+
+_builders: Dict[Tuple[str, int], ContextBuilder] = {}
+_builders_lock = threading.Lock()
+
+
+def get_context_builder(model: str) -> ContextBuilder:
+    """Shared builder for a model; LLM_CONTEXT_BUDGET overrides the per-model budget."""
+    budget = int(os.environ.get("LLM_CONTEXT_BUDGET", MODEL_BUDGETS.get(model, DEFAULT_BUDGET)))
+    key = (model, budget)
+    with _builders_lock:
+        builder = _builders.get(key)
+        if builder is None:
+            builder = _builders[key] = ContextBuilder(budget)
+    return builder
@@ -1,95 +1,54 @@
-from openai import OpenAI
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import Callable, List, Dict, Optional, Iterator, Tuple
+import json
+import logging
 import os
+import time
+
+from backend.llm_client import attempt_timeout, get_client, completion_slot
+from backend import response_cache, resilience
+from backend.router import router
+from backend.context_builder import get_context_builder
+from backend.llm_config import LLMConfig, MODELS
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+# Runs a batch of tool calls ({"id", "name", "arguments"}) and returns one result
+# dict per call with "tool_call_id" and a user-facing "message" (core/tools.py)
+ToolRunner = Callable[[List[Dict]], List[Dict]]
 
 class LLMInference:
-    MODELS = {
-        "chat": {
-            "name": "deepseek-chat",
-            "description": "DeepSeek-V3 - Model konwersacyjny"
-        },
-        "reasoner": {
-            "name": "deepseek-reasoner",
-            "description": "DeepSeek-R1 - Model rozumowania"
-        }
-    }
-
-    def __init__(self, api_key: str, model_type: str = "chat"):
-        self.client = OpenAI(
-            api_key=os.environ.get("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com/v1"
-        )
-        self.model_type = model_type
-        self.model = self.MODELS[model_type]["name"]
-        
-        # Domyślne ustawienia
-        self.temperature = 0.7
-        self.max_tokens = 512
-        self.top_p = 0.9
-        self.frequency_penalty = 0.0
-        self.presence_penalty = 0.0
-        
-        # Ustawienia personalizacji
-        self.user_identity = ""
-        self.short_term_plans = ""
-        self.long_term_plans = ""
-        self.response_tone = ""
-        self.response_length = ""
-        self.llm_focus_type = ""
-        self.llm_subject_area = ""
-        
-        # Inicjalizacja promptu systemowego na końcu
-        self.system_prompt = self._get_system_prompt()
-    
-    def _get_system_prompt(self) -> str:
-        """Returns the appropriate system prompt based on the model and settings."""
-        base_prompt = ""
-        if self.model_type == "chat":
-            base_prompt = ("Jesteś pomocnym asystentem. Odpowiadasz w języku polskim w sposób zwięzły i na temat. Pamiętasz o kontekście rozmowy.\n\n"
-                           "Dostępne narzędzia:\n"
-                           "[add_task]: Użyj tego narzędzia, aby dodać nowe zadanie. Formatuj polecenie jako: [add_task]: \"treść zadania\".\n"
-                           "Przykład: Jeśli chcesz dodać zadanie 'kupić mleko', odpowiedz: [add_task]: \"kupić mleko\".")
-        else:
-            base_prompt = (
-                "Jesteś pomocnym asystentem specjalizującym się w rozumieniu i rozwiązywaniu problemów. "
-                "Zawsze odpowiadasz w języku polskim, krok po kroku wyjaśniając swój tok myślenia.\n\n"
-                "Dla każdego problemu:\n"
-                "1. **Analiza:** Najpierw analizujesz i opisujesz problem.\n"
-                "2. **Dekompozycja:** Rozkładasz go na mniejsze części.\n"
-                "3. **Rozwiązanie:** Rozwiązujesz każdą część osobno.\n"
-                "4. **Synteza:** Łączysz rozwiązania w całość.\n"
-                "5. **Weryfikacja:** Sprawdzasz poprawność i podsumowujesz."
-            )
-        # Add personalization if set
-        personalizations = []
-        if self.user_identity:
-            personalizations.append(f"Tożsamość użytkownika: {self.user_identity}")
-        if self.short_term_plans:
-            personalizations.append(f"Krótkoterminowe plany: {self.short_term_plans}")
-        if self.long_term_plans:
-            personalizations.append(f"Długoterminowe plany: {self.long_term_plans}")
-        if self.response_tone:
-            personalizations.append(f"Ton odpowiedzi: {self.response_tone}")
-        if self.response_length:
-            personalizations.append(f"Długość odpowiedzi: {self.response_length}")
-        if self.llm_focus_type:
-            personalizations.append(f"Typ skupienia: {self.llm_focus_type}")
-        if self.llm_subject_area:
-            personalizations.append(f"Obszar tematyczny: {self.llm_subject_area}")
-        
-        if personalizations:
-            base_prompt += "\n\nUstawienia personalizacji:\n" + "\n".join(personalizations)
-        
-        return base_prompt
+    MODELS = MODELS
+
+    def __init__(self, api_key: str, model_type: str = "chat", base_url: str = None):
+        # Shared, pooled client (see backend/llm_client.py), built on first use
+        self._api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
+        self._base_url = base_url
+        # Default configuration (model, sampling, personalization); requests may
+        # pass their own immutable config instead (see backend/llm_config.py)
+        self.config = LLMConfig(model_type=model_type)
+
+    @property
+    def client(self):
+        return get_client(self._api_key, self._base_url)
+
+    @property
+    def model_type(self) -> str:
+        return self.config.model_type
+
+    @property
+    def model(self) -> str:
+        return self.config.model
+
+    @property
+    def system_prompt(self) -> str:
+        return self.config.system_prompt
 
     def switch_model(self, model_type: str) -> bool:
-        """Przełącza model na inny typ"""
+        """Przełącza domyślny model na inny typ"""
         if model_type not in self.MODELS:
             return False
-        self.model_type = model_type
-        self.model = self.MODELS[model_type]["name"]
-        self.system_prompt = self._get_system_prompt()
+        self.config = self.config.replace(model_type=model_type)
         return True
 
     def get_available_models(self) -> Dict[str, Dict[str, str]]:
@@ -100,78 +59,301 @@ class LLMInference:
         """Initialize the OpenAI client"""
         try:
             # Test connection with a simple request
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": "Test connection"}
-                ],
-                max_tokens=10,
-                stream=False
-            )
-            print("Model DeepSeek zainicjalizowany pomyślnie")
+            with completion_slot():
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": "Test connection"}
+                    ],
+                    max_tokens=10,
+                    stream=False
+                )
+            logger.info("Model DeepSeek zainicjalizowany pomyślnie", extra={"model": self.model})
             return True
         except Exception as e:
-            print(f"Błąd inicjalizacji modelu: {str(e)}")
+            logger.error("Błąd inicjalizacji modelu", extra={"model": self.model, "error": str(e)})
             return False
     
-    def format_history(self, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
-        """Formatuje historię rozmowy w format OpenAI"""
-        messages = [{"role": "system", "content": self.system_prompt}]
-        if history:
-            for msg in history[-5:]:  # Ostatnie 5 wiadomości
-                messages.append({
-                    "role": "user" if msg['role'] == "user" else "assistant",
-                    "content": msg['content']
-                })
-        return messages
+    def format_history(self, history: List[Dict[str, str]], prompt: str = "",
+                       config: Optional[LLMConfig] = None) -> List[Dict[str, str]]:
+        """Formatuje historię rozmowy w format OpenAI (w ramach budżetu tokenów modelu)"""
+        config = config or self.config
+        return get_context_builder(config.model).build(config.system_prompt, history, prompt)
     
-    def generate_response(self, prompt: str, history=None, context=None) -> str:
-        """Generate response using the model"""
-        try:
-            print(f"\n[LLM] Generowanie odpowiedzi dla: '{prompt[:50]}...'")
-            
-            # Przygotuj wiadomości z historią
-            messages = self.format_history(history) if history else [
-                {"role": "system", "content": self.system_prompt}
-            ]
-            
-            # Dla modelu reasoner dodaj wskazówkę o strukturze odpowiedzi
-            if self.model_type == "reasoner" and not any(word in prompt.lower() for word in ['cześć', 'hej', 'witaj']):
-                prompt = f"""Proszę rozwiąż ten problem zgodnie z podaną strukturą:
+    def _prepare_messages(self, prompt: str, history=None, config: Optional[LLMConfig] = None) -> List[Dict[str, str]]:
+        """Build the message list (system prompt, history, user prompt) for a request"""
+        config = config or self.config
+        # Dla modelu reasoner dodaj wskazówkę o strukturze odpowiedzi
+        if config.model_type == "reasoner" and not any(word in prompt.lower() for word in ['cześć', 'hej', 'witaj']):
+            prompt = f"""Proszę rozwiąż ten problem zgodnie z podaną strukturą:
 
 {prompt}
 
 Pamiętaj o użyciu nagłówków: ANALIZA, ROZWIĄZANIE (z krokami), PODSUMOWANIE."""
+        
+        # Przygotuj wiadomości z historią, spakowaną do budżetu tokenów
+        messages = self.format_history(history, prompt, config)
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def request_key(self, prompt: str, history=None, session_id: str = "", config: Optional[LLMConfig] = None) -> str:
+        """Identify a request by session, model, messages and sampling parameters.
+
+        Used to coalesce identical requests that are in flight at the same
+        time (see backend/single_flight.py); the history is taken as given,
+        before it is packed into the token budget.
+        """
+        config = config or self.config
+        messages = [{"role": "system", "content": config.system_prompt}]
+        messages.extend({"role": m["role"], "content": m["content"]} for m in history or [])
+        messages.append({"role": "user", "content": prompt})
+        return f"{session_id}:{response_cache.make_key(config.model, messages, config.completion_params)}"
+
+    def generate_response(self, prompt: str, history=None, context=None, config: Optional[LLMConfig] = None,
+                          tools: Optional[List[Dict]] = None, run_tools: Optional[ToolRunner] = None) -> str:
+        """Generate response using the model (with ``config``, or the default one)
+
+        With ``tools`` (OpenAI-style definitions) and ``run_tools`` the model may
+        answer with tool calls: all of them are passed to ``run_tools`` at once
+        and their results go back in a single follow-up request, whose answer
+        is returned.
+        """
+        config = config or self.config
+        model = config.model
+        start_time = None
+        try:
+            logger.info("llm.request", extra={"model": model, "mode": "complete", "prompt": prompt[:50]})
             
-            messages.append({"role": "user", "content": prompt})
-            
-            print("[LLM] Wysyłanie zapytania do API...")
-            start_time = datetime.now()
+            messages = self._prepare_messages(prompt, history, config)
+            params = config.completion_params
+            tool_params = {"tools": tools} if tools and run_tools else {}
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                top_p=self.top_p,
-                frequency_penalty=self.frequency_penalty,
-                presence_penalty=self.presence_penalty,
-                stream=False
-            )
+            cache = response_cache.get_cache()
+            cache_key = response_cache.make_key(model, messages, params) if cache else None
+            if cache:
+                cached = cache.get(cache_key, params)
+                if cached is not None:
+                    logger.info("llm.cache_hit", extra={"model": model, "mode": "complete"})
+                    metrics.observe_llm_call(model, "complete", "cached")
+                    return cached
             
-            generation_time = (datetime.now() - start_time).total_seconds()
-            print(f"[LLM] Czas generowania: {generation_time:.2f}s")
+            def request(request_messages: List[Dict], extra: Dict):
+                def attempt(timeout: float):
+                    with completion_slot():
+                        return self.client.chat.completions.create(
+                            messages=request_messages,
+                            stream=False,
+                            timeout=attempt_timeout(timeout),
+                            **extra,
+                            **params
+                        )
+                return attempt
+
+            start_time = time.perf_counter()
+            # Retries, hedging and the circuit breaker (backend/resilience.py)
+            response = resilience.upstream.call(request(messages, tool_params))
+            message = response.choices[0].message
+            self._observe_ok(config, "complete", time.perf_counter() - start_time,
+                             getattr(response, "usage", None), response_text=message.content)
             
-            response_text = response.choices[0].message.content
-            print(f"[LLM] Odpowiedź: '{response_text[:50]}...'\n")
+            calls = self._tool_calls(message) if tool_params else []
+            if calls:
+                results = run_tools(calls)
+                follow_up = messages + self._tool_messages(message.content, calls, results)
+                start_time = time.perf_counter()
+                try:
+                    # Tools stay declared (same prompt prefix) but may not be called again
+                    response = resilience.upstream.call(request(follow_up, {**tool_params, "tool_choice": "none"}))
+                except Exception as e:
+                    # The tools already ran: report their results rather than a failure
+                    self._observe_error(config, "complete", e, time.perf_counter() - start_time)
+                    return self._tool_summary(results)
+                response_text = response.choices[0].message.content
+                self._observe_ok(config, "complete", time.perf_counter() - start_time,
+                                 getattr(response, "usage", None), response_text=response_text)
+                # Not cached: a cached answer would skip the tools next time
+                return response_text or self._tool_summary(results)
             
+            response_text = message.content
+            if cache and response_text:
+                cache.set(cache_key, model, response_text, params)
             return response_text
             
         except Exception as e:
-            print(f"[LLM] BŁĄD generowania odpowiedzi: {str(e)}")
+            duration = time.perf_counter() - start_time if start_time is not None else None
+            self._observe_error(config, "complete", e, duration)
+            if resilience.is_unavailable(e):
+                raise resilience.UpstreamUnavailable(str(e)) from e
             return "Przepraszam, wystąpił błąd podczas generowania odpowiedzi."
 
+    def generate_response_stream(self, prompt: str, history=None, context=None, config: Optional[LLMConfig] = None,
+                                 tools: Optional[List[Dict]] = None,
+                                 run_tools: Optional[ToolRunner] = None) -> Iterator[Tuple[str, str]]:
+        """Generate response incrementally.
+
+        Yields ``(kind, text)`` pairs where kind is ``"content"`` for answer
+        tokens or ``"reasoning"`` for the reasoner model's chain of thought,
+        which arrives before the answer. Tool calls (see generate_response)
+        are collected from the stream, run together, and the follow-up
+        answer is streamed after them.
+        """
+        config = config or self.config
+        model = config.model
+        start_time = None
+        state = {}
+        try:
+            logger.info("llm.request", extra={"model": model, "mode": "stream", "prompt": prompt[:50]})
+            messages = self._prepare_messages(prompt, history, config)
+            params = config.completion_params
+            tool_params = {"tools": tools} if tools and run_tools else {}
+            
+            cache = response_cache.get_cache()
+            cache_key = response_cache.make_key(model, messages, params) if cache else None
+            if cache:
+                cached = cache.get(cache_key, params)
+                if cached is not None:
+                    logger.info("llm.cache_hit", extra={"model": model, "mode": "stream"})
+                    metrics.observe_llm_call(model, "stream", "cached")
+                    yield "content", cached
+                    return
+            
+            def request(request_messages: List[Dict], extra: Dict):
+                def open_stream(timeout: float):
+                    # The slot is held until the stream is fully consumed
+                    with completion_slot():
+                        yield from self.client.chat.completions.create(
+                            messages=request_messages,
+                            stream=True,
+                            timeout=attempt_timeout(timeout),
+                            # Usage arrives in a final chunk without choices
+                            extra_body={"stream_options": {"include_usage": True}},
+                            **extra,
+                            **params
+                        )
+                return open_stream
+
+            def relay(stream, calls: Dict[int, Dict]):
+                # Yields the tokens and records usage, time to first token and tool call fragments
+                for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        state["usage"] = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    self._collect_tool_calls(calls, delta)
+                    reasoning = getattr(delta, "reasoning_content", None)
+                    for kind, text in (("reasoning", reasoning), ("content", delta.content)):
+                        if not text:
+                            continue
+                        if state["first_token"] is None:
+                            state["first_token"] = time.perf_counter() - start_time
+                        if kind == "content":
+                            state["parts"].append(text)
+                        yield kind, text
+
+            start_time = time.perf_counter()
+            state.update(usage=None, first_token=None, parts=[])
+            calls = {}
+            # Retried until the first chunk arrives, behind the circuit breaker
+            yield from relay(resilience.upstream.stream(request(messages, tool_params)), calls)
+            self._observe_ok(config, "stream", time.perf_counter() - start_time, state["usage"], state["first_token"])
+            
+            if calls and tool_params:
+                calls = [calls[index] for index in sorted(calls)]
+                results = run_tools(calls)
+                follow_up = messages + self._tool_messages("".join(state["parts"]), calls, results)
+                start_time = time.perf_counter()
+                state.update(usage=None, first_token=None, parts=[])
+                try:
+                    yield from relay(resilience.upstream.stream(
+                        request(follow_up, {**tool_params, "tool_choice": "none"})), {})
+                except Exception as e:
+                    self._observe_error(config, "stream", e, time.perf_counter() - start_time)
+                    # The tools already ran: report their results rather than a failure
+                    yield "content", ("\n\n" if state["parts"] else "") + self._tool_summary(results)
+                    return
+                self._observe_ok(config, "stream", time.perf_counter() - start_time,
+                                 state["usage"], state["first_token"])
+                if not state["parts"]:
+                    yield "content", self._tool_summary(results)
+                return
+            
+            if cache and state["parts"]:
+                cache.set(cache_key, model, "".join(state["parts"]), params)
+            
+        except Exception as e:
+            duration = time.perf_counter() - start_time if start_time is not None else None
+            self._observe_error(config, "stream", e, duration)
+            # Nothing shown yet: let the caller answer from its fallback instead
+            if state.get("first_token") is None and resilience.is_unavailable(e):
+                raise resilience.UpstreamUnavailable(str(e)) from e
+            yield "content", "Przepraszam, wystąpił błąd podczas generowania odpowiedzi."
+
+    # Tool calls
+
+    @staticmethod
+    def _tool_calls(message) -> List[Dict]:
+        """Tool calls of a complete response as ``{"id", "name", "arguments"}`` dicts."""
+        return [{"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                for call in getattr(message, "tool_calls", None) or []]
+
+    @staticmethod
+    def _collect_tool_calls(calls: Dict[int, Dict], delta) -> None:
+        """Merge streamed tool call fragments (name and arguments arrive in pieces) by index."""
+        for call in getattr(delta, "tool_calls", None) or []:
+            entry = calls.setdefault(call.index, {"id": None, "name": "", "arguments": ""})
+            entry["id"] = call.id or entry["id"]
+            if call.function is not None:
+                entry["name"] += call.function.name or ""
+                entry["arguments"] += call.function.arguments or ""
+
+    @staticmethod
+    def _tool_messages(content: Optional[str], calls: List[Dict], results: List[Dict]) -> List[Dict]:
+        """The assistant's tool call turn and one tool message per result, for the follow-up request."""
+        messages = [{"role": "assistant", "content": content or "", "tool_calls": [
+            {"id": call["id"], "type": "function",
+             "function": {"name": call["name"], "arguments": call["arguments"]}}
+            for call in calls
+        ]}]
+        messages.extend({"role": "tool", "tool_call_id": result["tool_call_id"],
+                         "content": json.dumps(result, ensure_ascii=False, default=str)}
+                        for result in results)
+        return messages
+
+    @staticmethod
+    def _tool_summary(results: List[Dict]) -> str:
+        return "\n".join(result["message"] for result in results)
+
+    @staticmethod
+    def _observe_ok(config: LLMConfig, mode: str, duration: float, usage=None,
+                    first_token: Optional[float] = None, response_text: Optional[str] = None) -> None:
+        metrics.observe_llm_call(config.model, mode, "ok", duration, first_token, usage)
+        # The router budgets time to the first token: that is what the user waits for
+        router.observe(config.model_type, first_token if first_token is not None else duration, ok=True)
+        extra = {
+            "model": config.model, "mode": mode, "duration_s": round(duration, 3),
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+        }
+        if mode == "stream":
+            extra["ttft_s"] = round(first_token, 3) if first_token is not None else None
+        else:
+            extra["response"] = (response_text or "")[:50]
+        logger.info("llm.response", extra=extra)
+
+    @staticmethod
+    def _observe_error(config: LLMConfig, mode: str, error: Exception, duration: Optional[float]) -> None:
+        model = config.model
+        # "rejected": failed fast on the open circuit breaker, upstream not called
+        outcome = "rejected" if isinstance(error, resilience.CircuitOpenError) else "error"
+        metrics.observe_llm_call(model, mode, outcome, duration)
+        if outcome == "error":
+            router.observe(config.model_type, duration, ok=False)
+        log = logger.warning if outcome == "rejected" else logger.error
+        log("llm.error", extra={"model": model, "mode": mode, "outcome": outcome,
+                                "error_type": type(error).__name__, "error": str(error)})
+
     def _format_prompt_with_context(self, prompt: str, context: dict) -> str:
         """Format prompt with additional context"""
         if context.get('type') == 'task':
@@ -0,0 +1,143 @@
+"""Process-wide registry of OpenAI-compatible clients.
+
+All ``LLMInference`` instances share one pooled HTTP client per
+``(api_key, base_url)`` so keep-alive connections are reused, and every
+completion runs inside ``completion_slot()`` which bounds how many calls are
+in flight against the upstream API at once.
+
+The ``openai`` SDK and ``httpx`` are imported when the first client is built,
+not with this module: they are the largest part of the app's import time and
+a process that never talks to the LLM should not pay for them.
+
+Configuration (environment variables):
+    LLM_BASE_URL            upstream URL, e.g. a local OpenAI-compatible stand-in
+    LLM_CONNECT_TIMEOUT     seconds to establish a connection (default 5)
+    LLM_READ_TIMEOUT        seconds to wait for data from upstream (default 120)
+    LLM_MAX_CONNECTIONS     connection pool size (default 20)
+    LLM_MAX_KEEPALIVE       idle keep-alive connections kept open (default 10)
+    LLM_MAX_CONCURRENCY     completions in flight at once (default 8)
+    LLM_QUEUE_TIMEOUT       seconds to wait for a free slot (default 30)
+    LLM_MAX_RETRIES         SDK-level retries (default 0; retries, hedging and the
+                            circuit breaker live in backend/resilience.py)
+"""
+import os
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import OpenAI
+
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
+
+
+class LLMBusyError(RuntimeError):
+    """Raised when no completion slot frees up within the queue timeout."""
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+_clients: Dict[Tuple[str, str], "OpenAI"] = {}
+_clients_lock = threading.Lock()
+
+_max_concurrency = _env_int("LLM_MAX_CONCURRENCY", 8)
+_slots = threading.BoundedSemaphore(_max_concurrency)
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def get_base_url(base_url: Optional[str] = None) -> str:
+    return base_url or os.environ.get("LLM_BASE_URL", DEFAULT_BASE_URL)
+
+
+def _build_client(api_key: str, base_url: str) -> "OpenAI":
+    import httpx
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=_env_int("LLM_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=_env_int("LLM_MAX_KEEPALIVE", 10),
+            keepalive_expiry=30.0,
+        ),
+        timeout=httpx.Timeout(
+            connect=_env_float("LLM_CONNECT_TIMEOUT", 5.0),
+            read=_env_float("LLM_READ_TIMEOUT", 120.0),
+            write=10.0,
+            pool=_env_float("LLM_QUEUE_TIMEOUT", 30.0),
+        ),
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        max_retries=_env_int("LLM_MAX_RETRIES", 0),
+    )
+
+
+def attempt_timeout(seconds: float) -> "httpx.Timeout":
+    """Timeout of one attempt with ``seconds`` left before its deadline.
+
+    Passed per request, it replaces the client's timeout, so the connect
+    bound is kept here: at most LLM_CONNECT_TIMEOUT to connect, and nothing
+    past the deadline.
+    """
+    import httpx
+
+    return httpx.Timeout(seconds, connect=min(seconds, _env_float("LLM_CONNECT_TIMEOUT", 5.0)))
+
+
+def get_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> "OpenAI":
+    """Return the shared client for this key and URL, creating it on first use."""
+    api_key = api_key or os.environ.get("DEEPSEEK_API_KEY") or ""
+    base_url = get_base_url(base_url)
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _build_client(api_key, base_url)
+                _clients[key] = client
+    return client
+
+
+def close_clients() -> None:
+    """Close all pooled connections (e.g. on shutdown or in tests)."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+@contextmanager
+def completion_slot(timeout: Optional[float] = None):
+    """Hold one of the bounded upstream slots for the duration of a completion."""
+    global _in_flight
+    timeout = _env_float("LLM_QUEUE_TIMEOUT", 30.0) if timeout is None else timeout
+    if not _slots.acquire(timeout=timeout):
+        raise LLMBusyError(f"No free LLM slot after {timeout:.0f}s")
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+        _slots.release()
+
+
+def stats() -> Dict[str, int]:
+    """Current pool usage, for monitoring."""
+    return {
+        "clients": len(_clients),
+        "in_flight": _in_flight,
+        "max_concurrency": _max_concurrency,
+    }
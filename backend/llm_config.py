@@ -0,0 +1,224 @@
+"""Immutable LLM configurations: model, sampling parameters and personalization.
+
+A config is a frozen snapshot. Changing a setting builds a new config with
+:meth:`LLMConfig.replace` and swaps the reference, so a request that already
+took a config keeps a consistent view while another user changes theirs, and
+nothing needs a lock around reads.
+
+The system prompt is compiled once per distinct (model, personalization)
+combination and shared by every config with the same values. The fixed,
+per-model instructions always come first and personalization is appended
+after them, so the start of the prompt is byte-identical across users and
+settings and the upstream prefix cache keeps hitting.
+
+Per-session configs are kept in process memory by :class:`ConfigStore`, or
+with ``SHARED_STATE_URL`` set (core/shared_state.py) in the shared backend by
+:class:`SharedConfigStore`, so a setting changed through one worker applies
+on all of them.
+"""
+import dataclasses
+import json
+import threading
+from collections import OrderedDict
+from functools import cached_property, lru_cache
+from typing import Dict, Optional, Tuple
+
+from core import shared_state
+
+MODELS = {
+    "chat": {
+        "name": "deepseek-chat",
+        "description": "DeepSeek-V3 - Model konwersacyjny"
+    },
+    "reasoner": {
+        "name": "deepseek-reasoner",
+        "description": "DeepSeek-R1 - Model rozumowania"
+    }
+}
+
+BASE_PROMPTS = {
+    "chat": ("Jesteś pomocnym asystentem. Odpowiadasz w języku polskim w sposób zwięzły i na temat. Pamiętasz o kontekście rozmowy.\n\n"
+             "Masz narzędzia do zarządzania zadaniami i notatkami użytkownika (add_task, add_note, move, complete). "
+             "Używaj ich, gdy użytkownik o to prosi; kilka operacji zgłaszaj naraz, w jednej odpowiedzi."),
+    "reasoner": (
+        "Jesteś pomocnym asystentem specjalizującym się w rozumieniu i rozwiązywaniu problemów. "
+        "Zawsze odpowiadasz w języku polskim, krok po kroku wyjaśniając swój tok myślenia.\n\n"
+        "Dla każdego problemu:\n"
+        "1. **Analiza:** Najpierw analizujesz i opisujesz problem.\n"
+        "2. **Dekompozycja:** Rozkładasz go na mniejsze części.\n"
+        "3. **Rozwiązanie:** Rozwiązujesz każdą część osobno.\n"
+        "4. **Synteza:** Łączysz rozwiązania w całość.\n"
+        "5. **Weryfikacja:** Sprawdzasz poprawność i podsumowujesz."
+    ),
+}
+
+# (field, label) in the order they appear in the system prompt
+PERSONALIZATION_FIELDS = (
+    ("user_identity", "Tożsamość użytkownika"),
+    ("short_term_plans", "Krótkoterminowe plany"),
+    ("long_term_plans", "Długoterminowe plany"),
+    ("response_tone", "Ton odpowiedzi"),
+    ("response_length", "Długość odpowiedzi"),
+    ("llm_focus_type", "Typ skupienia"),
+    ("llm_subject_area", "Obszar tematyczny"),
+)
+
+
+@lru_cache(maxsize=256)
+def compile_system_prompt(model_type: str, personalization: Tuple[str, ...]) -> str:
+    """Build the system prompt; ``personalization`` follows PERSONALIZATION_FIELDS."""
+    lines = [f"{label}: {value}" for (_, label), value in zip(PERSONALIZATION_FIELDS, personalization) if value]
+    prompt = BASE_PROMPTS.get(model_type, BASE_PROMPTS["reasoner"])
+    if lines:
+        prompt += "\n\nUstawienia personalizacji:\n" + "\n".join(lines)
+    return prompt
+
+
+@dataclasses.dataclass(frozen=True)
+class LLMConfig:
+    model_type: str = "chat"
+    temperature: float = 0.7
+    max_tokens: int = 512
+    top_p: float = 0.9
+    frequency_penalty: float = 0.0
+    presence_penalty: float = 0.0
+    # Pick chat or reasoner per prompt (backend/router.py); model_type is the last routed one
+    auto_route: bool = False
+
+    user_identity: str = ""
+    short_term_plans: str = ""
+    long_term_plans: str = ""
+    response_tone: str = ""
+    response_length: str = ""
+    llm_focus_type: str = ""
+    llm_subject_area: str = ""
+
+    def __post_init__(self):
+        if self.model_type not in MODELS:
+            raise ValueError(f"Invalid model type: {self.model_type}")
+        if not 0 <= self.temperature <= 2:
+            raise ValueError("Temperature must be between 0 and 2")
+        if not 1 <= self.max_tokens <= 4096:
+            raise ValueError("Max tokens must be between 1 and 4096")
+
+    @property
+    def model(self) -> str:
+        return MODELS[self.model_type]["name"]
+
+    @property
+    def personalization(self) -> Tuple[str, ...]:
+        return tuple(getattr(self, name) or "" for name, _ in PERSONALIZATION_FIELDS)
+
+    @cached_property
+    def system_prompt(self) -> str:
+        return compile_system_prompt(self.model_type, self.personalization)
+
+    @cached_property
+    def completion_params(self) -> Dict:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+        }
+
+    def replace(self, **changes) -> "LLMConfig":
+        """Return a new config with ``changes`` applied (validated)."""
+        return dataclasses.replace(self, **changes)
+
+    def to_json(self) -> str:
+        return json.dumps(dataclasses.asdict(self), ensure_ascii=False, sort_keys=True)
+
+
+_FIELDS = frozenset(field.name for field in dataclasses.fields(LLMConfig))
+
+
+@lru_cache(maxsize=1024)
+def config_from_json(data: str) -> LLMConfig:
+    """Inverse of :meth:`LLMConfig.to_json` (shared, so equal settings share one config)."""
+    return LLMConfig(**{name: value for name, value in json.loads(data).items() if name in _FIELDS})
+
+
+class ConfigStore:
+    """Per-session configs; sessions without their own config use the default.
+
+    Bounded like the session store: the least recently used session configs
+    are dropped first, after which that session falls back to the default.
+    """
+
+    def __init__(self, default: Optional[LLMConfig] = None, max_sessions: int = 1000):
+        self.default = default or LLMConfig()
+        self.max_sessions = max_sessions
+        self._configs: "OrderedDict[str, LLMConfig]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str]) -> LLMConfig:
+        if not session_id:
+            return self.default
+        with self._lock:
+            config = self._configs.get(session_id)
+            if config is None:
+                return self.default
+            self._configs.move_to_end(session_id)
+            return config
+
+    def update(self, session_id: Optional[str], **changes) -> LLMConfig:
+        """Apply changes to a session's config (or the default without a session)."""
+        with self._lock:
+            if not session_id:
+                self.default = self.default.replace(**changes)
+                return self.default
+            config = self._configs.get(session_id, self.default).replace(**changes)
+            self._configs[session_id] = config
+            self._configs.move_to_end(session_id)
+            while len(self._configs) > self.max_sessions:
+                self._configs.popitem(last=False)
+            return config
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._configs)
+
+
+class SharedConfigStore:
+    """Per-session configs in a shared-state backend, one value per session.
+
+    Same interface as :class:`ConfigStore`; the default config is shared as
+    well. Every read goes to the backend, so a change made by one worker is
+    seen by the next request on any other.
+    """
+
+    def __init__(self, backend, default: Optional[LLMConfig] = None):
+        self.backend = backend
+        self.local_default = default or LLMConfig()
+
+    @staticmethod
+    def _key(session_id: Optional[str]) -> str:
+        return f"llm_config:{session_id}" if session_id else "llm_config"
+
+    def _read(self, session_id: Optional[str]) -> Optional[LLMConfig]:
+        data = self.backend.value_get(self._key(session_id))
+        return config_from_json(data) if data is not None else None
+
+    @property
+    def default(self) -> LLMConfig:
+        return self._read(None) or self.local_default
+
+    def get(self, session_id: Optional[str]) -> LLMConfig:
+        return (self._read(session_id) if session_id else None) or self.default
+
+    def update(self, session_id: Optional[str], **changes) -> LLMConfig:
+        """Apply changes to a session's config (or the default without a session)."""
+        config = self.get(session_id).replace(**changes)
+        self.backend.value_set(self._key(session_id), config.to_json())
+        return config
+
+
+def create_config_store(default: LLMConfig, max_sessions: int = 1000):
+    """Build the config store matching the session store (core/session_store.py)."""
+    backend = shared_state.get_backend()
+    if backend is not None:
+        return SharedConfigStore(backend, default)
+    return ConfigStore(default, max_sessions=max_sessions)
@@ -0,0 +1,349 @@
+"""Resilience for upstream LLM calls: retries, hedged requests and a circuit breaker.
+
+Every completion goes through :data:`upstream` (one per process, since all
+``LLMInference`` instances share the same upstream):
+
+* **Deadline-aware retries.** A call gets ``LLM_DEADLINE`` seconds in total.
+  Transient failures (connection errors, timeouts, 408/409/429/5xx) are
+  retried with full-jitter exponential backoff, and each attempt is given
+  only the time that is left, so a retry never runs past the deadline.
+  Other errors (400, 401, ...) are raised at once. SDK-level retries are off
+  by default (``LLM_MAX_RETRIES``, backend/llm_client.py) so the two layers
+  do not multiply.
+* **Hedged requests** (optional, non-streamed completions). When an attempt
+  has not answered after ``LLM_HEDGE_AFTER`` (seconds, or ``p95``/``p99`` of
+  recent successful latencies), an identical second request is sent and the
+  first answer wins. Hedges are skipped when all completion slots are busy
+  and limited to ``LLM_HEDGE_MAX_RATIO`` of the calls, so they cut the tail
+  without adding load when the upstream is already saturated.
+* **Circuit breaker.** After ``LLM_BREAKER_FAILURES`` transient failures in a
+  row the breaker opens and calls fail at once with :class:`CircuitOpenError`
+  (the chat answers from its fallback responses) for ``LLM_BREAKER_RESET``
+  seconds. Then a single probe call is let through (half-open): success
+  closes the breaker, failure opens it again.
+
+:func:`Resilience.stats` (breaker state, retries, hedges, rejections) is
+exported as metrics and at ``/api/chat/upstream``.
+
+Configuration (environment variables):
+    LLM_DEADLINE             seconds for a call including retries (default 60)
+    LLM_RETRY_ATTEMPTS       attempts per call (default 3)
+    LLM_RETRY_BASE_DELAY     first backoff ceiling in seconds, doubled per retry (default 0.5)
+    LLM_RETRY_MAX_DELAY      backoff ceiling in seconds (default 8)
+    LLM_HEDGE_AFTER          seconds, p95 or p99; 0 disables hedging (default 0)
+    LLM_HEDGE_MAX_RATIO      largest share of calls that may be hedged (default 0.1)
+    LLM_BREAKER_FAILURES     consecutive transient failures that open the breaker (default 5)
+    LLM_BREAKER_RESET        seconds the breaker stays open before a probe (default 30)
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from backend import llm_client
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+# openai/httpx exception names, matched by name so the SDK is not imported here
+RETRYABLE_ERRORS = frozenset({
+    'APIConnectionError', 'APITimeoutError', 'ConnectError', 'ReadTimeout', 'ConnectTimeout',
+    'RemoteProtocolError', 'ReadError', 'TimeoutError',
+})
+
+# Successful latencies kept for the p95/p99 hedge threshold, and the minimum before hedging
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream is considered unhealthy; the call was not attempted."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """No attempt succeeded before the call's deadline."""
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Raised by LLMInference when the LLM cannot answer now; callers use their fallback."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed attempt is worth retrying (and counts against the breaker)."""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def is_unavailable(error: BaseException) -> bool:
+    """Whether an error means "no answer right now" rather than a bad request."""
+    return (isinstance(error, (CircuitOpenError, DeadlineExceeded, llm_client.LLMBusyError))
+            or is_transient(error))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; in half-open state only one probe at a time."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def release(self) -> None:
+        """End a call that says nothing about upstream health (frees the half-open probe)."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("llm.breaker_closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats['opened'] += 1
+                    logger.warning("llm.breaker_opened", extra={"failures": self._failures})
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures, **self._stats}
+
+
+class Resilience:
+    def __init__(self, deadline: float = 60.0, attempts: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 8.0, hedge_after: str = '0', hedge_max_ratio: float = 0.1,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.deadline = deadline
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = str(hedge_after).lower()
+        self.hedge_max_ratio = hedge_max_ratio
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {'calls': 0, 'retries': 0, 'hedged': 0, 'hedge_wins': 0, 'deadline_exceeded': 0}
+
+    @classmethod
+    def from_env(cls) -> 'Resilience':
+        return cls(
+            deadline=float(os.environ.get('LLM_DEADLINE', 60)),
+            attempts=int(os.environ.get('LLM_RETRY_ATTEMPTS', 3)),
+            base_delay=float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5)),
+            max_delay=float(os.environ.get('LLM_RETRY_MAX_DELAY', 8)),
+            hedge_after=os.environ.get('LLM_HEDGE_AFTER', '0'),
+            hedge_max_ratio=float(os.environ.get('LLM_HEDGE_MAX_RATIO', 0.1)),
+            breaker=CircuitBreaker(int(os.environ.get('LLM_BREAKER_FAILURES', 5)),
+                                   float(os.environ.get('LLM_BREAKER_RESET', 30))),
+        )
+
+    # Public API
+
+    def call(self, attempt: Callable[[float], T]) -> T:
+        """Run ``attempt(timeout)`` with retries, hedging and the breaker.
+
+        ``attempt`` performs one upstream request that must give up after
+        ``timeout`` seconds. Raises :class:`CircuitOpenError`,
+        :class:`DeadlineExceeded` or the last attempt's error.
+        """
+        return self._run(lambda remaining: self._hedged(attempt, remaining), record_latency=True)
+
+    def stream(self, open_stream: Callable[[float], Iterator[T]]) -> Iterator[T]:
+        """Like :meth:`call` for a streamed response, without hedging.
+
+        An attempt succeeds once its first item arrives; failures before that
+        are retried. After the first item nothing can be retried, so a later
+        error is raised to the caller (and counted by the breaker).
+        """
+        def first_item(remaining: float):
+            iterator = iter(open_stream(remaining))
+            try:
+                return iterator, (next(iterator),)
+            except StopIteration:
+                return iterator, ()
+
+        iterator, head = self._run(first_item)
+        yield from head
+        try:
+            yield from iterator
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            raise
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            stats = dict(self._stats)
+            samples = sorted(self._latencies)
+        stats['breaker'] = self.breaker.stats()
+        stats['p95_s'] = round(self._percentile(samples, 0.95), 3) if samples else None
+        stats['hedge_after_s'] = self._hedge_delay(samples)
+        return stats
+
+    # Internals
+
+    def _run(self, attempt: Callable[[float], T], record_latency: bool = False) -> T:
+        deadline = time.monotonic() + self.deadline
+        with self._lock:
+            self._stats['calls'] += 1
+        last_error: Optional[BaseException] = None
+        for number in range(1, self.attempts + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                raise CircuitOpenError('LLM upstream circuit is open') from last_error
+            start = time.perf_counter()
+            try:
+                result = attempt(remaining)
+            except llm_client.LLMBusyError:
+                # Local overload, not an upstream failure
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # The upstream answered; the request itself is wrong
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                last_error = e
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (number - 1)))
+                logger.warning("llm.attempt_failed", extra={
+                    "attempt": number, "error_type": type(e).__name__, "error": str(e),
+                    "retry_in_s": round(delay, 3) if number < self.attempts else None})
+                if number == self.attempts or time.monotonic() + delay >= deadline:
+                    break
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            if record_latency:
+                # Complete-response latencies only; they calibrate the hedge threshold
+                with self._lock:
+                    self._latencies.append(time.perf_counter() - start)
+            return result
+        if last_error is not None and time.monotonic() < deadline:
+            # Out of attempts (or no time left for another backoff)
+            raise last_error
+        with self._lock:
+            self._stats['deadline_exceeded'] += 1
+        raise DeadlineExceeded(f'LLM call did not succeed within {self.deadline:.0f}s') from last_error
+
+    @staticmethod
+    def _percentile(samples, fraction: float) -> float:
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def _hedge_delay(self, samples=None) -> Optional[float]:
+        """Seconds after which to hedge, or None when hedging is off or not yet calibrated."""
+        if self.hedge_after in ('p95', 'p99'):
+            if samples is None:
+                with self._lock:
+                    samples = sorted(self._latencies)
+            if len(samples) < MIN_LATENCY_SAMPLES:
+                return None
+            return round(self._percentile(samples, 0.95 if self.hedge_after == 'p95' else 0.99), 3)
+        delay = float(self.hedge_after or 0)
+        return delay if delay > 0 else None
+
+    def _may_hedge(self) -> bool:
+        stats = llm_client.stats()
+        if stats['in_flight'] >= stats['max_concurrency']:
+            return False
+        if self.breaker.state != CLOSED:
+            return False
+        with self._lock:
+            if self._stats['hedged'] + 1 > self.hedge_max_ratio * self._stats['calls']:
+                return False
+            self._stats['hedged'] += 1
+            return True
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Room for a primary and a hedge per completion slot
+                self._executor = ThreadPoolExecutor(max_workers=2 * llm_client.stats()['max_concurrency'],
+                                                    thread_name_prefix='llm-hedge')
+            return self._executor
+
+    def _hedged(self, attempt: Callable[[float], T], remaining: float) -> T:
+        delay = self._hedge_delay()
+        if delay is None or delay >= remaining:
+            return attempt(remaining)
+        pool = self._pool()
+        start = time.monotonic()
+        primary = pool.submit(attempt, remaining)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._may_hedge():
+            return primary.result(timeout=max(0.0, remaining - (time.monotonic() - start)))
+        logger.info("llm.hedge_sent", extra={"after_s": delay})
+        hedge = pool.submit(attempt, remaining - delay)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            left = remaining - (time.monotonic() - start)
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self._stats['hedge_wins'] += 1
+                    # The slower request keeps running in the pool; its answer is dropped
+                    return future.result()
+                error = future.exception()
+        if error is not None:
+            raise error
+        raise TimeoutError('LLM attempt timed out')
+
+
+upstream = Resilience.from_env()
+
+
+def stats() -> Dict[str, object]:
+    return upstream.stats()
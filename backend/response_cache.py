@@ -0,0 +1,190 @@
+"""Cache of LLM responses: in-memory LRU in front of a SQLite store with TTL.
+
+Keys are derived from everything that shapes the answer: model, a hash of the
+system prompt, the normalized message list and the sampling parameters.
+Sampled requests (temperature > 0) are not cached unless explicitly allowed,
+since repeating them is expected to give a different answer.
+
+The message list includes the session history, and every answered exchange
+is appended to it, so a prompt repeated within one session never hits. Hits
+come from identical first turns of fresh sessions (the same opening question
+from many users) and from calls without history, such as the
+``/api/chat/test`` probe, as long as they are not sampled. Answers that ran
+tools are never cached.
+
+Configuration (environment variables):
+    LLM_CACHE_ENABLED        "0" disables the cache (default enabled)
+    LLM_CACHE_PATH           SQLite file (default instance/llm_cache.db)
+    LLM_CACHE_TTL            seconds an entry stays valid (default 86400)
+    LLM_CACHE_SIZE           entries kept in memory (default 512)
+    LLM_CACHE_ALLOW_SAMPLED  "1" also caches requests with temperature > 0
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "instance", "llm_cache.db")
+
+_whitespace = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _whitespace.sub(" ", text or "").strip()
+
+
+def make_key(model: str, messages: List[Dict[str, str]], params: Dict) -> str:
+    """Build the cache key for a completion request."""
+    system = [m["content"] for m in messages if m["role"] == "system"]
+    conversation = [(m["role"], _normalize(m["content"])) for m in messages if m["role"] != "system"]
+    payload = {
+        "model": model,
+        "system": hashlib.sha256("\n".join(system).encode()).hexdigest(),
+        "messages": conversation,
+        "temperature": params.get("temperature"),
+        "top_p": params.get("top_p"),
+        "max_tokens": params.get("max_tokens"),
+        "frequency_penalty": params.get("frequency_penalty"),
+        "presence_penalty": params.get("presence_penalty"),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_PATH, ttl: float = 86400, max_entries: int = 512,
+                 allow_sampled: bool = False):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.allow_sampled = allow_sampled
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_expires ON llm_cache (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads, keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def is_cacheable(self, params: Dict) -> bool:
+        if self.allow_sampled:
+            return True
+        return not params.get("temperature")
+
+    def get(self, key: str, params: Dict) -> Optional[str]:
+        """Return the cached response or None. Counts a bypass for sampled requests."""
+        if not self.is_cacheable(params):
+            self._count("bypassed")
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+        conn = self._connection()
+        row = conn.execute("SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._count("misses")
+            return None
+        self._remember(key, row[0], row[1])
+        self._count("disk_hits")
+        return row[0]
+
+    def set(self, key: str, model: str, response: str, params: Dict) -> None:
+        if not self.is_cacheable(params):
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, response, expires_at)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, expires_at),
+            )
+        self._count("stores")
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """Delete expired rows from the SQLite store. Returns the number removed."""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Return the process-wide cache, or None when disabled."""
+    global _cache
+    if os.environ.get("LLM_CACHE_ENABLED", "1") == "0":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    path=os.environ.get("LLM_CACHE_PATH", DEFAULT_PATH),
+                    ttl=float(os.environ.get("LLM_CACHE_TTL", 86400)),
+                    max_entries=int(os.environ.get("LLM_CACHE_SIZE", 512)),
+                    allow_sampled=os.environ.get("LLM_CACHE_ALLOW_SAMPLED", "0") == "1",
+                )
+    return _cache
@@ -0,0 +1,192 @@
+"""Automatic routing of chat prompts between deepseek-chat and deepseek-reasoner.
+
+Sessions whose config has ``auto_route`` set (``PUT /api/chat/model`` with
+``model_type: "auto"``) have each prompt classified by cheap heuristics and
+sent to the cheapest model that is adequate for it:
+
+* a likely tool call (adding, moving or completing a task or note) goes to
+  ``chat``: only the chat model is offered the tools (core/tools.py);
+* reasoning cues (why/explain/solve/step by step, arithmetic, code) and long
+  prompts add to a score, and a score of ``ROUTER_REASONER_SCORE`` or more
+  goes to ``reasoner``;
+* everything else (greetings, short questions) goes to ``chat``.
+
+The router also keeps rolling health per model from the calls LLMInference
+reports (time to the first answer token and whether the call failed). When
+the chosen model is degraded (error rate above ``ROUTER_MAX_ERROR_RATE`` or
+p95 above its latency budget) and the other one is not, traffic shifts to
+the other model; a likely tool call never shifts to the reasoner.
+
+Every decision is counted by model and reason and the latest ones (features,
+no prompt text) are kept for ``GET /api/chat/router``, to tune the
+thresholds against real traffic.
+
+Configuration (environment variables):
+    ROUTER_REASONER_SCORE     heuristic score that selects the reasoner (default 2)
+    ROUTER_LONG_PROMPT        characters from which a prompt counts as long (default 600)
+    ROUTER_WINDOW             recent calls per model kept for health (default 100)
+    ROUTER_MIN_SAMPLES        calls before a model can be considered degraded (default 10)
+    ROUTER_MAX_ERROR_RATE     error rate above which a model is degraded (default 0.2)
+    ROUTER_CHAT_P95           chat latency budget in seconds, first token (default 10)
+    ROUTER_REASONER_P95       reasoner latency budget in seconds, first token (default 60)
+"""
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from backend.llm_config import LLMConfig
+from core import metrics
+
+# Listed next to MODELS by GET /api/chat/models
+AUTO_MODEL = {"name": "auto", "description": "Automatyczny wybór modelu dla każdego pytania"}
+
+TOOL_PATTERN = re.compile(
+    r'\b(dodaj|zapisz|utwórz|przypomnij|przenieś|przenies|oznacz|ukończ|ukoncz|add|create|remind|move|mark|complete)\b'
+    r'.{0,40}\b(zadani\w*|notatk\w*|task\w*|notes?|todo)\b', re.IGNORECASE)
+REASONING_PATTERN = re.compile(
+    r'\b(dlaczego|wyjaśnij|wyjasnij|udowodnij|oblicz|policz|rozwiąż|rozwiaz\w*|przeanalizuj|porównaj|porownaj|'
+    r'zaplanuj|zoptymalizuj|strategi\w*|algorytm\w*|krok po kroku|why|explain|prove|calculate|solve|analy[sz]e|'
+    r'compare|optimi[sz]e|step by step|algorithm\w*|trade-?offs?)\b', re.IGNORECASE)
+MATH_PATTERN = re.compile(r'\d\s*[-+*/^=<>]\s*\d|[∑∫√]')
+CODE_PATTERN = re.compile(r'```|\bdef \w+\(|\bclass \w+|\bSELECT\b.+\bFROM\b|[{};]\s*$', re.MULTILINE)
+
+
+class ModelHealth:
+    """Rolling latency and error stats of one model over its last ``window`` calls."""
+
+    def __init__(self, window: int = 100):
+        self._calls = deque(maxlen=window)  # (seconds or None, ok)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: Optional[float], ok: bool) -> None:
+        with self._lock:
+            self._calls.append((seconds, ok))
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            calls = list(self._calls)
+        latencies = sorted(seconds for seconds, ok in calls if ok and seconds is not None)
+        errors = sum(1 for _, ok in calls if not ok)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3)
+
+        return {
+            'samples': len(calls),
+            'error_rate': round(errors / len(calls), 3) if calls else 0.0,
+            'p50_s': percentile(0.5),
+            'p95_s': percentile(0.95),
+        }
+
+
+class Router:
+    def __init__(self, reasoner_score: int = 2, long_prompt: int = 600, window: int = 100,
+                 min_samples: int = 10, max_error_rate: float = 0.2,
+                 p95_budgets: Optional[Dict[str, float]] = None, recent: int = 50):
+        self.reasoner_score = reasoner_score
+        self.long_prompt = long_prompt
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.p95_budgets = p95_budgets or {'chat': 10.0, 'reasoner': 60.0}
+        self.health = {model_type: ModelHealth(window) for model_type in self.p95_budgets}
+        self._decisions = Counter()
+        self._recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'Router':
+        return cls(
+            reasoner_score=int(os.environ.get('ROUTER_REASONER_SCORE', 2)),
+            long_prompt=int(os.environ.get('ROUTER_LONG_PROMPT', 600)),
+            window=int(os.environ.get('ROUTER_WINDOW', 100)),
+            min_samples=int(os.environ.get('ROUTER_MIN_SAMPLES', 10)),
+            max_error_rate=float(os.environ.get('ROUTER_MAX_ERROR_RATE', 0.2)),
+            p95_budgets={'chat': float(os.environ.get('ROUTER_CHAT_P95', 10)),
+                         'reasoner': float(os.environ.get('ROUTER_REASONER_P95', 60))},
+        )
+
+    # Classification
+
+    def classify(self, prompt: str) -> Tuple[str, str, Dict[str, object]]:
+        """Return (model_type, reason, features) for a prompt, ignoring model health."""
+        features = {
+            'length': len(prompt),
+            'tool': bool(TOOL_PATTERN.search(prompt)),
+            'reasoning_cues': len(REASONING_PATTERN.findall(prompt)),
+            'math': bool(MATH_PATTERN.search(prompt)),
+            'code': bool(CODE_PATTERN.search(prompt)),
+        }
+        if features['tool']:
+            return 'chat', 'tool_call', features
+        score = min(features['reasoning_cues'], 2) + features['math'] + features['code']
+        if len(prompt) >= self.long_prompt:
+            score += 1
+        features['score'] = score
+        if score >= self.reasoner_score:
+            return 'reasoner', 'reasoning', features
+        return 'chat', 'simple', features
+
+    # Health
+
+    def observe(self, model_type: str, seconds: Optional[float], ok: bool) -> None:
+        """Record one finished call (LLMInference reports every upstream call)."""
+        health = self.health.get(model_type)
+        if health is not None:
+            health.record(seconds, ok)
+
+    def degraded(self, model_type: str, snapshot: Optional[Dict] = None) -> bool:
+        snapshot = snapshot or self.health[model_type].snapshot()
+        if snapshot['samples'] < self.min_samples:
+            return False
+        if snapshot['error_rate'] > self.max_error_rate:
+            return True
+        return snapshot['p95_s'] is not None and snapshot['p95_s'] > self.p95_budgets[model_type]
+
+    # Routing
+
+    def route(self, prompt: str, config: LLMConfig) -> LLMConfig:
+        """Pick the model for one prompt; returns the config to use for it."""
+        model_type, reason, features = self.classify(prompt)
+        other = 'reasoner' if model_type == 'chat' else 'chat'
+        if self.degraded(model_type) and not self.degraded(other) and not (other == 'reasoner' and features['tool']):
+            reason = f'shifted_from_{model_type}'
+            model_type = other
+        metrics.llm_router_decisions.inc(model=model_type, reason=reason)
+        with self._lock:
+            self._decisions[(model_type, reason)] += 1
+            self._recent.append({'at': round(time.time(), 3), 'model_type': model_type,
+                                 'reason': reason, **features})
+        return routed_config(config, model_type)
+
+    def stats(self) -> Dict[str, object]:
+        health = {}
+        for model_type, model_health in self.health.items():
+            snapshot = model_health.snapshot()
+            health[model_type] = {**snapshot, 'degraded': self.degraded(model_type, snapshot),
+                                  'p95_budget_s': self.p95_budgets[model_type]}
+        with self._lock:
+            decisions: List[Dict] = [{'model_type': m, 'reason': r, 'count': c}
+                                     for (m, r), c in self._decisions.most_common()]
+            recent = list(self._recent)
+        return {
+            'thresholds': {'reasoner_score': self.reasoner_score, 'long_prompt': self.long_prompt,
+                           'min_samples': self.min_samples, 'max_error_rate': self.max_error_rate},
+            'health': health,
+            'decisions': decisions,
+            'recent': recent,
+        }
+
+
+@lru_cache(maxsize=1024)
+def routed_config(config: LLMConfig, model_type: str) -> LLMConfig:
+    """The session's config with the routed model (shared, so its prompt stays compiled)."""
+    return config.replace(model_type=model_type)
+
+
+router = Router.from_env()
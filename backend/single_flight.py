@@ -0,0 +1,138 @@
+"""Single-flight coalescing of identical in-flight requests.
+
+The first caller for a key (the leader) does the work; callers that arrive
+with the same key while it is running (followers) wait for it and get the
+same result or exception instead of starting their own call. Nothing is kept
+once the call finishes: the next caller for the key starts a new one (repeats
+are the response cache's job, see response_cache.py).
+
+Streams are coalesced as well: followers replay the events the leader has
+produced so far and then receive the rest as they arrive. If the leader's
+consumer goes away mid-stream, followers get :class:`AbandonedError`.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Tuple
+
+
+class AbandonedError(RuntimeError):
+    """The leader stopped before finishing, so there is no result to share."""
+
+
+class _Call:
+    __slots__ = ("cond", "events", "done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events: list = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run ``fn`` once for all concurrent callers with the same key."""
+        call, leader = self._join(key)
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                self._finish(key, call)
+            return call.result
+
+        try:
+            with call.cond:
+                while not call.done:
+                    call.cond.wait()
+        finally:
+            self._leave(call)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterable]) -> Iterator:
+        """Iterate ``fn()`` once for all concurrent consumers with the same key."""
+        # Joined on first iteration, so a generator that is never started holds no key
+        call, leader = self._join(key)
+        if leader:
+            yield from self._lead(key, call, fn)
+        else:
+            yield from self._follow(call)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "in_flight": len(self._calls),
+                "waiters": sum(call.waiters for call in self._calls.values()),
+            }
+
+    # Internals
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats["coalesced"] += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            self._stats["leaders"] += 1
+            return call, True
+
+    def _leave(self, call: _Call) -> None:
+        with self._lock:
+            call.waiters -= 1
+
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            # Later callers start a new call instead of joining a finished one
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        with call.cond:
+            call.done = True
+            call.cond.notify_all()
+
+    def _lead(self, key: Hashable, call: _Call, fn: Callable[[], Iterable]) -> Iterator:
+        finished = False
+        try:
+            for event in fn():
+                with call.cond:
+                    call.events.append(event)
+                    call.cond.notify_all()
+                yield event
+            finished = True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            if not finished and call.error is None:
+                call.error = AbandonedError("The leading request stopped before the stream ended")
+            self._finish(key, call)
+
+    def _follow(self, call: _Call) -> Iterator:
+        index = 0
+        try:
+            while True:
+                with call.cond:
+                    while index >= len(call.events) and not call.done:
+                        call.cond.wait()
+                    pending = call.events[index:]
+                    done = call.done
+                index += len(pending)
+                yield from pending
+                if done and index >= len(call.events):
+                    break
+        finally:
+            self._leave(call)
+        if call.error is not None:
+            raise call.error
@@ -0,0 +1,214 @@
+"""Local OpenAI-compatible stand-in for the DeepSeek API.
+
+Serves ``POST /v1/chat/completions`` (plain and streamed) and ``GET
+/v1/models`` on 127.0.0.1 with a configurable time to first token and token
+rate, so chat benchmarks measure this application rather than the network.
+Answers are deterministic filler text and always report ``usage``.
+
+Faults can be injected to exercise retries, hedging and the circuit breaker
+(backend/resilience.py): a share of requests fails with 503 (``error_rate``)
+and a share is slowed down by ``slow_latency`` seconds (``slow_rate``).
+
+When a request offers ``tools`` (core/tools.py), a user message with
+``zadanie: ...`` or ``notatka: ...`` clauses (separated by ``;``) is answered
+with one add_task / add_note call per clause, streamed in fragments like the
+real API; the follow-up request with the tool results gets filler text.
+
+Run standalone:
+    python -m benchmarks.fake_llm --port 8765 --latency 0.2 --tokens-per-second 50
+    python -m benchmarks.fake_llm --error-rate 0.2 --slow-rate 0.05 --slow-latency 3
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+TOOL_CLAUSE = re.compile(r'(zadanie|notatka):\s*([^;]+)', re.IGNORECASE)
+WORDS = ('zadanie', 'notatka', 'projekt', 'plan', 'termin', 'spotkanie', 'raport', 'pomysł')
+
+
+class FakeLLMConfig:
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 50.0, completion_tokens: int = 40,
+                 error_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 2.0, seed: int = 0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.errors = 0
+        self.slowed = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def fault(self) -> str:
+        """Decide the fate of one request: 'error', 'slow' or ''."""
+        with self._lock:
+            roll = self._random.random()
+            if roll < self.error_rate:
+                self.errors += 1
+                return 'error'
+            if roll < self.error_rate + self.slow_rate:
+                self.slowed += 1
+                return 'slow'
+            return ''
+
+
+def _tokens(count: int):
+    return [WORDS[i % len(WORDS)] + ' ' for i in range(count)]
+
+
+def _tool_calls(request: dict) -> list:
+    """add_task / add_note calls for the clauses of the last user message, if tools may be called."""
+    messages = request.get('messages') or [{}]
+    if not request.get('tools') or request.get('tool_choice') == 'none' or messages[-1].get('role') != 'user':
+        return []
+    return [
+        {'id': f'call_{index}', 'type': 'function', 'function': {
+            'name': 'add_task' if kind.lower() == 'zadanie' else 'add_note',
+            'arguments': json.dumps({'content': text.strip()}, ensure_ascii=False)}}
+        for index, (kind, text) in enumerate(TOOL_CLAUSE.findall(messages[-1].get('content') or ''))
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: FakeLLMConfig = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': 'deepseek-chat', 'object': 'model'}, {'id': 'deepseek-reasoner', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        config = self.config
+        config.count()
+        count = min(config.completion_tokens, request.get('max_tokens') or config.completion_tokens)
+        tokens = _tokens(count)
+        prompt_tokens = sum(len(m.get('content') or '') for m in request.get('messages', [])) // 4
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': count, 'total_tokens': prompt_tokens + count}
+        model = request.get('model', 'deepseek-chat')
+        delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+        fault = config.fault()
+        if fault == 'error':
+            self._send_json(503, {'error': {'message': 'injected failure', 'type': 'server_error'}})
+            return
+        time.sleep(config.latency + (config.slow_latency if fault == 'slow' else 0.0))
+        tool_calls = _tool_calls(request)
+        if tool_calls:
+            tokens = []
+        if not request.get('stream'):
+            time.sleep(delay * count)
+            self._send_json(200, {
+                'id': 'bench', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens) or None,
+                                                     **({'tool_calls': tool_calls} if tool_calls else {})},
+                             'finish_reason': 'tool_calls' if tool_calls else 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write(data: bytes) -> None:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        def event(payload: dict) -> None:
+            write(f'data: {json.dumps(payload)}\n\n'.encode())
+
+        for token in tokens:
+            event({'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': model,
+                   'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]})
+            time.sleep(delay)
+        for index, call in enumerate(tool_calls):
+            # Id and name first, then the arguments in two pieces
+            arguments = call['function']['arguments']
+            half = len(arguments) // 2
+            for fragment in ({'id': call['id'], 'type': 'function', 'function': {'name': call['function']['name'], 'arguments': ''}},
+                             {'function': {'arguments': arguments[:half]}}, {'function': {'arguments': arguments[half:]}}):
+                event({'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': model,
+                       'choices': [{'index': 0, 'delta': {'tool_calls': [{'index': index, **fragment}]},
+                                    'finish_reason': None}]})
+        if (request.get('stream_options') or {}).get('include_usage'):
+            event({'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': model,
+                   'choices': [], 'usage': usage})
+        write(b'data: [DONE]\n\n')
+        write(b'')
+
+
+class FakeLLMServer:
+    """The stand-in server running in a background thread."""
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None, port: int = 0):
+        self.config = config or FakeLLMConfig()
+        handler = type('Handler', (_Handler,), {'config': self.config})
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-llm', daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self) -> 'FakeLLMServer':
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0)
+    parser.add_argument('--completion-tokens', type=int, default=40)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with 503')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of requests slowed down')
+    parser.add_argument('--slow-latency', type=float, default=2.0, help='extra seconds for slowed requests')
+    args = parser.parse_args()
+    server = FakeLLMServer(FakeLLMConfig(args.latency, args.tokens_per_second, args.completion_tokens,
+                                         args.error_rate, args.slow_rate, args.slow_latency), args.port)
+    print(f'Fake LLM listening on {server.base_url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
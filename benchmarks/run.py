@@ -0,0 +1,382 @@
+"""Offline benchmark of the Flask API against a fake DeepSeek server.
+
+Seeds a throwaway copy of the database (``rafpad.db`` in a temporary
+directory unless ``--workdir`` is given) and grows it through each requested
+scale (e.g. 1k, then 10k, then 100k notes and tasks). At every scale the
+scenarios below are driven concurrently through the WSGI app in-process. The
+chat scenarios talk to :mod:`benchmarks.fake_llm` on 127.0.0.1, so nothing
+leaves the machine.
+
+The report is JSON with p50/p95/p99, mean and max latency (ms), throughput
+and error count per scenario, plus the commit it ran on, so runs can be
+diffed between commits:
+
+    python -m benchmarks.run --scales 1k,10k --output bench.json
+    python -m benchmarks.run --scales 100k --scenarios list_tasks,list_notes,search
+    python -m benchmarks.run --scales 1k --scenarios chat --model auto   # with the router
+
+Write scenarios run last at each scale, so the next scale starts from a
+slightly larger database than its nominal size.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.fake_llm import FakeLLMConfig, FakeLLMServer  # noqa: E402
+
+SEARCH_TERMS = ('raport', 'klient', 'faktura spotkanie', 'plan', 'wdrożenie', 'budżet zespół')
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, duration: float, extra: Optional[Dict] = None) -> Dict:
+    values = sorted(latencies)
+    summary = {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(values) / duration, 2) if duration > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(values, 0.50) * 1000, 3),
+            'p95': round(percentile(values, 0.95) * 1000, 3),
+            'p99': round(percentile(values, 0.99) * 1000, 3),
+            'mean': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            'max': round(values[-1] * 1000, 3) if values else 0.0,
+        },
+    }
+    if extra:
+        summary.update(extra)
+    return summary
+
+
+class Context:
+    """Per-worker state handed to scenarios."""
+
+    def __init__(self, app, worker: int, max_task_id: int, max_note_id: int, project_tags: List[str]):
+        self.client = app.test_client()
+        self.rng = random.Random(worker)
+        self.worker = worker
+        self.max_task_id = max_task_id
+        self.max_note_id = max_note_id
+        self.project_tags = project_tags
+        self.etags: Dict[str, str] = {}
+        self.timings: Dict[str, List[float]] = {}
+        self.counter = 0
+
+    def record(self, name: str, value: float) -> None:
+        self.timings.setdefault(name, []).append(value)
+
+    def next_id(self) -> int:
+        self.counter += 1
+        return self.counter
+
+
+# Scenarios: each performs one request and returns True on success
+
+def list_tasks(ctx: Context) -> bool:
+    query = {'limit': 50}
+    if ctx.rng.random() < 0.5:
+        query['project_tag'] = ctx.rng.choice(ctx.project_tags)
+    return ctx.client.get('/api/tasks', query_string=query).status_code == 200
+
+
+def list_notes(ctx: Context) -> bool:
+    query = {'limit': 50}
+    if ctx.rng.random() < 0.5:
+        query['project_tag'] = ctx.rng.choice(ctx.project_tags)
+    return ctx.client.get('/api/notes', query_string=query).status_code == 200
+
+
+def list_tasks_revalidate(ctx: Context) -> bool:
+    """Polling an unchanged list with If-None-Match (304 path)."""
+    url = '/api/tasks?limit=50'
+    headers = {'If-None-Match': ctx.etags[url]} if url in ctx.etags else {}
+    response = ctx.client.get(url, headers=headers)
+    if response.headers.get('ETag'):
+        ctx.etags[url] = response.headers['ETag']
+    return response.status_code in (200, 304)
+
+
+def get_task(ctx: Context) -> bool:
+    task_id = ctx.rng.randint(1, ctx.max_task_id)
+    return ctx.client.get(f'/api/tasks/{task_id}').status_code in (200, 404)
+
+
+def search(ctx: Context) -> bool:
+    query = {'q': ctx.rng.choice(SEARCH_TERMS), 'limit': 20}
+    return ctx.client.get('/api/search', query_string=query).status_code == 200
+
+
+def bulk_tasks(ctx: Context) -> bool:
+    items = [{
+        'content': f'bench task {ctx.worker}-{ctx.next_id()}',
+        'project_tag': ctx.rng.choice(ctx.project_tags),
+        'subtasks': [{'content': 'bench subtask'}],
+    } for _ in range(100)]
+    return ctx.client.post('/api/tasks/bulk', json=items).status_code == 201
+
+
+def bulk_notes(ctx: Context) -> bool:
+    items = [{'content': f'bench note {ctx.worker}-{ctx.next_id()}', 'project_tag': ctx.rng.choice(ctx.project_tags)}
+             for _ in range(100)]
+    return ctx.client.post('/api/notes/bulk', json=items).status_code == 201
+
+
+def _chat_message(ctx: Context, text: str) -> str:
+    # Unique messages, so the response cache never answers; every fourth one
+    # asks for reasoning, which the auto router sends to the reasoner
+    number = ctx.next_id()
+    if number % 4 == 0:
+        return f'Wyjaśnij krok po kroku, dlaczego {text.lower()} {ctx.worker}-{number} trwa 3 * 4 minuty?'
+    return f'{text} {ctx.worker}-{number}'
+
+
+def chat(ctx: Context) -> bool:
+    payload = {'message': _chat_message(ctx, 'Benchmark pytanie'), 'session_id': f'bench-{ctx.worker}'}
+    return ctx.client.post('/api/chat', json=payload).status_code == 200
+
+
+def chat_stream(ctx: Context) -> bool:
+    payload = {'message': _chat_message(ctx, 'Benchmark strumień'), 'session_id': f'bench-s-{ctx.worker}'}
+    start = time.perf_counter()
+    response = ctx.client.post('/api/chat/stream', json=payload, buffered=False)
+    failed = False
+    try:
+        first = True
+        for chunk in response.response:
+            if first:
+                ctx.record('ttfb', time.perf_counter() - start)
+                first = False
+            # Errors are reported in-band once the stream has started
+            failed = failed or (b'event: error' in chunk if isinstance(chunk, bytes) else 'event: error' in chunk)
+    finally:
+        response.close()
+    return response.status_code == 200 and not failed
+
+
+SCENARIOS: Dict[str, Callable[[Context], bool]] = {
+    'list_tasks': list_tasks,
+    'list_notes': list_notes,
+    'list_tasks_revalidate': list_tasks_revalidate,
+    'get_task': get_task,
+    'search': search,
+    'chat': chat,
+    'chat_stream': chat_stream,
+    'bulk_tasks': bulk_tasks,
+    'bulk_notes': bulk_notes,
+}
+CHAT_SCENARIOS = ('chat', 'chat_stream')
+WRITE_SCENARIOS = ('bulk_tasks', 'bulk_notes')
+
+
+def run_scenario(app, name: str, requests: int, concurrency: int, warmup: int, ids: Dict, tags: List[str]) -> Dict:
+    scenario = SCENARIOS[name]
+    contexts = [Context(app, worker, ids['task'], ids['note'], tags) for worker in range(concurrency)]
+    for i in range(warmup):
+        scenario(contexts[i % concurrency])
+
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(ctx: Context) -> None:
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                ok = scenario(ctx)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    for ctx in contexts:
+        ctx.timings.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, contexts))
+    duration = time.perf_counter() - start
+
+    extra = {}
+    ttfb = sorted(t for ctx in contexts for t in ctx.timings.get('ttfb', []))
+    if ttfb:
+        extra['ttfb_ms'] = {
+            'p50': round(percentile(ttfb, 0.50) * 1000, 3),
+            'p95': round(percentile(ttfb, 0.95) * 1000, 3),
+            'p99': round(percentile(ttfb, 0.99) * 1000, 3),
+        }
+    return summarize(latencies, errors[0], duration, extra)
+
+
+def _git_revision() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def _configure_environment(workdir: str, base_url: str, llm_concurrency: int) -> None:
+    # Everything the app reads at import time; must run before `import app`
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'rafpad.db')
+    os.environ['LLM_BASE_URL'] = base_url
+    os.environ['DEEPSEEK_API_KEY'] = 'sk-benchmark'
+    os.environ['LLM_CACHE_ENABLED'] = '0'
+    os.environ['LLM_CACHE_PATH'] = os.path.join(workdir, 'llm_cache.db')
+    os.environ['CHAT_SESSIONS_PATH'] = os.path.join(workdir, 'chat_sessions.db')
+    os.environ['LLM_MAX_CONCURRENCY'] = str(llm_concurrency)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description='Offline API benchmark with a fake DeepSeek server.')
+    parser.add_argument('--scales', default='1k,10k', help='comma separated: 1k, 10k, 100k or a number')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated scenario names')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--chat-requests', type=int, default=40, help='requests per chat scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests before each scenario')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='fake LLM seconds to first token')
+    parser.add_argument('--llm-tokens-per-second', type=float, default=200.0)
+    parser.add_argument('--llm-completion-tokens', type=int, default=40)
+    parser.add_argument('--llm-concurrency', type=int, default=8, help='LLM_MAX_CONCURRENCY for the app')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='fake LLM share of 503 answers')
+    parser.add_argument('--llm-slow-rate', type=float, default=0.0, help='fake LLM share of slowed requests')
+    parser.add_argument('--llm-slow-latency', type=float, default=2.0, help='extra seconds for slowed requests')
+    parser.add_argument('--model', default='chat', choices=('chat', 'reasoner', 'auto'),
+                        help='default model for chat scenarios (auto: per-prompt routing)')
+    parser.add_argument('--workdir', help='directory for the database files (default: a temporary one)')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args(argv)
+
+    from benchmarks import seed as seeding
+    scales = [(label.strip(), seeding.parse_scale(label.strip())) for label in args.scales.split(',') if label.strip()]
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    # Reads first, writes last, so the write scenarios do not change what the reads measure
+    names.sort(key=lambda name: name in WRITE_SCENARIOS)
+
+    llm_config = FakeLLMConfig(args.llm_latency, args.llm_tokens_per_second, args.llm_completion_tokens,
+                               args.llm_error_rate, args.llm_slow_rate, args.llm_slow_latency)
+    server = FakeLLMServer(llm_config).start()
+    workdir_context = tempfile.TemporaryDirectory(prefix='kortex-bench-') if not args.workdir else None
+    workdir = args.workdir or workdir_context.name
+    os.makedirs(workdir, exist_ok=True)
+    _configure_environment(workdir, server.base_url, args.llm_concurrency)
+
+    import app as application
+    from models import db, Note, Task, Project
+    from sqlalchemy import func, select
+
+    flask_app = application.create_app()
+    application.limiter.enabled = False
+    if args.model == 'auto':
+        application.get_chat_manager().update_config(None, auto_route=True)
+    else:
+        application.get_chat_manager().update_config(None, model_type=args.model)
+
+    report = {
+        'meta': {
+            **_git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'chat_requests': args.chat_requests,
+            'model': args.model,
+            'fake_llm': {
+                'latency_s': args.llm_latency,
+                'tokens_per_second': args.llm_tokens_per_second,
+                'completion_tokens': args.llm_completion_tokens,
+                'error_rate': args.llm_error_rate,
+                'slow_rate': args.llm_slow_rate,
+                'slow_latency_s': args.llm_slow_latency,
+            },
+        },
+        'scales': {},
+    }
+    try:
+        for label, target in scales:
+            with flask_app.app_context():
+                current = db.session.execute(select(func.count()).select_from(Note)).scalar()
+                seed_start = time.perf_counter()
+                rows = seeding.seed(target - current) if target > current else seeding.row_counts()
+                seed_seconds = time.perf_counter() - seed_start
+                ids = {
+                    'task': db.session.execute(select(func.max(Task.id))).scalar() or 1,
+                    'note': db.session.execute(select(func.max(Note.id))).scalar() or 1,
+                }
+                tags = [tag for tag, in db.session.execute(select(Project.tag))]
+            print(f'[bench] scale {label}: {rows} (seeded in {seed_seconds:.1f}s)', file=sys.stderr)
+
+            results = {}
+            for name in names:
+                requests = args.chat_requests if name in CHAT_SCENARIOS else args.requests
+                warmup = min(args.warmup, 2) if name in CHAT_SCENARIOS else args.warmup
+                results[name] = run_scenario(flask_app, name, requests, args.concurrency, warmup, ids, tags)
+                latency = results[name]['latency_ms']
+                print(f"[bench]   {name}: p50={latency['p50']}ms p95={latency['p95']}ms "
+                      f"p99={latency['p99']}ms {results[name]['throughput_rps']} req/s "
+                      f"errors={results[name]['errors']}", file=sys.stderr)
+            report['scales'][label] = {'rows': rows, 'seed_seconds': round(seed_seconds, 2), 'scenarios': results}
+        # Retries, hedges and circuit breaker over the whole run (backend/resilience.py)
+        from backend import resilience
+        report['llm_upstream'] = resilience.stats()
+        if args.model == 'auto':
+            from backend.router import router
+            report['llm_router'] = {key: value for key, value in router.stats().items() if key != 'recent'}
+    finally:
+        server.stop()
+        application.get_chat_manager().sessions.close()
+        with flask_app.app_context():
+            db.engine.dispose()
+        if workdir_context is not None:
+            workdir_context.cleanup()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Seed a database with a synthetic workload of notes, tasks and subtasks.
+
+Rows are written with batched core INSERTs inside the application's context,
+so the schema, migrations and search triggers are exactly those of the app.
+A fixed random seed makes every run produce the same data.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import func, insert, select
+
+from models import db, Project, Note, Task, Subtask
+
+SCALES = {'1k': 1_000, '10k': 10_000, '100k': 100_000}
+PROJECT_COUNT = 20
+BATCH_SIZE = 5_000
+VOCABULARY = (
+    'kupić mleko chleb raport projekt spotkanie klient faktura kod przegląd test wdrożenie '
+    'plan budżet zespół termin prezentacja umowa dokumentacja analiza poprawka serwer '
+    'baza dane kampania newsletter rekrutacja szkolenie urlop podróż zakupy lekarz'
+).split()
+CATEGORIES = ('work', 'personal', 'ideas', None)
+PRIORITIES = ('low', 'medium', 'high', None)
+
+
+def parse_scale(scale: str) -> int:
+    if scale in SCALES:
+        return SCALES[scale]
+    return int(scale)
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def _insert_batched(model, rows) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def row_counts() -> Dict[str, int]:
+    return {
+        name: db.session.execute(select(func.count()).select_from(model)).scalar()
+        for name, model in (('projects', Project), ('notes', Note), ('tasks', Task), ('subtasks', Subtask))
+    }
+
+
+def seed(count: int, random_seed: int = 42) -> Dict[str, int]:
+    """Insert ``count`` notes, ``count`` tasks and about ``count`` subtasks.
+
+    Must run in an app context on an empty database (besides #inbox).
+    """
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+
+    existing = {tag for tag, in db.session.execute(select(Project.tag))}
+    tags = ['#inbox'] + [f'#projekt{i}' for i in range(1, PROJECT_COUNT)]
+    db.session.execute(insert(Project), [
+        {'tag': tag, 'name': tag.lstrip('#'), 'created_at': now} for tag in tags if tag not in existing
+    ])
+    project_ids = [project_id for project_id, in db.session.execute(select(Project.id).where(Project.tag.in_(tags)))]
+
+    def timestamps():
+        created = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+        return created, created + timedelta(seconds=rng.randint(0, 7 * 24 * 3600))
+
+    notes = []
+    for _ in range(count):
+        created, updated = timestamps()
+        notes.append({
+            'content': _text(rng, rng.randint(5, 40)),
+            'category': rng.choice(CATEGORIES),
+            'project_id': rng.choice(project_ids),
+            'created_at': created,
+            'updated_at': updated,
+            # ~5% soft deleted, like a real inbox
+            'deleted_at': updated if rng.random() < 0.05 else None,
+        })
+    _insert_batched(Note, notes)
+
+    first_task_id = (db.session.execute(select(func.coalesce(func.max(Task.id), 0))).scalar() or 0) + 1
+    tasks, subtasks = [], []
+    for offset in range(count):
+        created, updated = timestamps()
+        tasks.append({
+            'id': first_task_id + offset,
+            'content': _text(rng, rng.randint(3, 12)),
+            'category': rng.choice(CATEGORIES),
+            'priority': rng.choice(PRIORITIES),
+            'deadline': created + timedelta(days=rng.randint(1, 60)) if rng.random() < 0.6 else None,
+            'is_completed': rng.random() < 0.3,
+            'project_id': rng.choice(project_ids),
+            'created_at': created,
+            'updated_at': updated,
+            'deleted_at': updated if rng.random() < 0.05 else None,
+        })
+        for _ in range(rng.choice((0, 1, 1, 2))):
+            subtasks.append({
+                'task_id': first_task_id + offset,
+                'content': _text(rng, rng.randint(2, 6)),
+                'is_completed': rng.random() < 0.4,
+                'created_at': created,
+            })
+    _insert_batched(Task, tasks)
+    _insert_batched(Subtask, subtasks)
+    db.session.commit()
+    return row_counts()
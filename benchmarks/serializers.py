@@ -0,0 +1,102 @@
+"""CPU cost of the list read path: ORM objects + jsonify vs Core rows + fast JSON.
+
+Seeds a throwaway database and builds the full response body of
+``GET /api/notes`` and ``GET /api/tasks`` (every live row, with subtasks)
+both ways, reporting process CPU time normalized to 10k rows:
+
+    python -m benchmarks.serializers --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def _cpu_ms(function, repeat: int) -> float:
+    """Best of ``repeat`` runs, in CPU milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        function()
+        timings.append(time.process_time() - start)
+    return min(timings) * 1000
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description='CPU cost of the list endpoints read path.')
+    parser.add_argument('--rows', type=int, default=10_000, help='notes and tasks to seed')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.TemporaryDirectory(prefix='kortex-serializers-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir.name, 'rafpad.db')
+    os.environ['CHAT_SESSIONS_PATH'] = os.path.join(workdir.name, 'chat_sessions.db')
+    os.environ['LLM_CACHE_ENABLED'] = '0'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import app as application
+    from benchmarks import seed
+    from core import fast_json, queries
+    from models import db, Note, Task
+
+    flask_app = application.create_app()
+    with flask_app.app_context():
+        rows = seed.seed(args.rows)
+
+        def orm_notes():
+            notes = (Note.query.options(*queries._note_options()).filter(Note.deleted_at.is_(None))
+                     .order_by(Note.updated_at.desc(), Note.id.desc()).all())
+            body = flask_app.json.dumps([queries.note_to_dict(n) for n in notes])
+            db.session.remove()
+            return body
+
+        def orm_tasks():
+            tasks = (Task.query.options(*queries._task_options()).filter(Task.deleted_at.is_(None))
+                     .order_by(Task.updated_at.desc(), Task.id.desc()).all())
+            body = flask_app.json.dumps([queries.task_to_dict(t) for t in tasks])
+            db.session.remove()
+            return body
+
+        def core_notes():
+            body = fast_json.dumps(queries.list_notes()[0])
+            db.session.remove()
+            return body
+
+        def core_tasks():
+            body = fast_json.dumps(queries.list_tasks()[0])
+            db.session.remove()
+            return body
+
+        # Same data both ways (key order aside)
+        assert json.loads(orm_notes()) == json.loads(core_notes())
+        assert json.loads(orm_tasks()) == json.loads(core_tasks())
+
+        scale = 10_000 / args.rows
+        report = {
+            'rows': rows,
+            'json_encoder': 'orjson' if fast_json.orjson is not None else 'json',
+            'cpu_ms_per_10k_rows': {},
+        }
+        for name, orm, core in (('notes', orm_notes, core_notes), ('tasks', orm_tasks, core_tasks)):
+            orm_ms = _cpu_ms(orm, args.repeat) * scale
+            core_ms = _cpu_ms(core, args.repeat) * scale
+            report['cpu_ms_per_10k_rows'][name] = {
+                'orm_jsonify': round(orm_ms, 1),
+                'core_fast_json': round(core_ms, 1),
+                'saved': round(orm_ms - core_ms, 1),
+                'speedup': round(orm_ms / core_ms, 2) if core_ms else None,
+            }
+        db.engine.dispose()
+    workdir.cleanup()
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
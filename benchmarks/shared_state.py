@@ -0,0 +1,101 @@
+"""Throughput and correctness of the shared-state backend across processes.
+
+Several processes increment the same rate limit counter and append to the
+same chat history at once, as gunicorn workers would, then the totals are
+checked (no lost updates, history capped) and operations per second reported:
+
+    python -m benchmarks.shared_state --processes 4 --ops 2000
+    python -m benchmarks.shared_state --url redis://localhost:6379/15
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from core import shared_state  # noqa: E402
+
+MAX_LEN = 100
+
+
+def _worker(url: str, ops: int, start_event, results) -> None:
+    backend = shared_state.create_backend(url)
+    start_event.wait()
+    timings = {}
+    begin = time.perf_counter()
+    for _ in range(ops):
+        backend.incr('bench/limit', 60)
+    timings['incr'] = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for _ in range(ops):
+        backend.get('bench/limit')
+    timings['get'] = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for i in range(ops):
+        backend.list_append('bench/chat', [json.dumps({'n': i})], max_len=MAX_LEN)
+    timings['list_append'] = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for _ in range(ops):
+        backend.list_read('bench/chat')
+    timings['list_read'] = time.perf_counter() - begin
+    results.put(timings)
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description='Shared-state backend across processes.')
+    parser.add_argument('--url', default=None, help='SHARED_STATE_URL (default: temporary SQLite file)')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=2000, help='operations of each kind per process')
+    args = parser.parse_args(argv)
+
+    workdir = None
+    url = args.url
+    if url is None:
+        workdir = tempfile.TemporaryDirectory(prefix='kortex-shared-state-')
+        url = 'sqlite:///' + os.path.join(workdir.name, 'shared_state.db')
+    backend = shared_state.create_backend(url)
+    backend.clear_counter('bench/limit')
+    backend.list_delete('bench/chat')
+
+    context = multiprocessing.get_context('spawn')
+    start_event = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=_worker, args=(url, args.ops, start_event, results))
+               for _ in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    start_event.set()
+    timings = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    expected = args.processes * args.ops
+    counter = backend.get('bench/limit')
+    history = len(backend.list_read('bench/chat'))
+    report = {
+        'backend': backend.name,
+        'processes': args.processes,
+        'counter': {'expected': expected, 'actual': counter, 'lost_updates': expected - counter},
+        'history': {'expected': min(expected, MAX_LEN), 'actual': history},
+        'ops_per_second': {},
+        'mean_us': {},
+    }
+    for name in ('incr', 'get', 'list_append', 'list_read'):
+        # Processes run concurrently; aggregate throughput uses the slowest one
+        wall = max(t[name] for t in timings)
+        report['ops_per_second'][name] = round(expected / wall)
+        report['mean_us'][name] = round(sum(t[name] for t in timings) / expected * 1e6, 1)
+    if workdir is not None:
+        workdir.cleanup()
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == '__main__':
+    main()
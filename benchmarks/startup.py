@@ -0,0 +1,127 @@
+"""Cold start of the app: import time, create_app() and the first request.
+
+Each run is a fresh interpreter started with ``-X importtime``, as a newly
+scaled-out instance would be. The report has the median total import time
+of ``app``, the modules costing the most (cumulative, including their own
+imports), whether heavy optional modules were imported at startup at all,
+and the time to ``create_app()`` and to the first ``GET /api/tasks``:
+
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --max-import-ms 1000   # exit 1 above the budget
+
+The first run creates the database; later runs start from an up-to-date
+schema, which is the common case for an autoscaled instance.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.run import _git_revision  # noqa: E402
+
+# Modules that should only load on first use, not at startup
+DEFERRED_MODULES = ('openai', 'httpx', 'bleach')
+
+_CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+status = flask_app.test_client().get('/api/tasks').status_code
+served = time.perf_counter()
+app.jobs.queue.shutdown(wait=False)
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'first_request_status': status,
+    'deferred_loaded': sorted(m for m in %r if m in sys.modules),
+}))
+'''
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, int]]:
+    """``-X importtime`` lines -> {module: {'self_us', 'cumulative_us'}}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = {'self_us': int(self_us), 'cumulative_us': int(cumulative_us)}
+    return modules
+
+
+def run_once(env: Dict[str, str]) -> Dict:
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CHILD % (DEFERRED_MODULES,)],
+                               cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['modules'] = parse_importtime(completed.stderr)
+    return result
+
+
+def _top(runs: List[Dict], count: int) -> List[Dict]:
+    names = set().union(*(run['modules'] for run in runs))
+    rows = []
+    for name in names:
+        values = [run['modules'][name]['cumulative_us'] for run in runs if name in run['modules']]
+        rows.append({'module': name, 'cumulative_ms': round(statistics.median(values) / 1000, 1)})
+    # Top-level packages only, so a package and its submodules are not listed twice
+    rows = [row for row in rows if '.' not in row['module'] and row['module'] != 'app']
+    return sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:count]
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description='Cold start time of the app.')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters to start')
+    parser.add_argument('--top', type=int, default=15, help='heaviest top-level modules to list')
+    parser.add_argument('--max-import-ms', type=float, help='fail when the median import time exceeds this')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.TemporaryDirectory(prefix='kortex-startup-')
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir.name, 'rafpad.db'),
+        'CHAT_SESSIONS_PATH': os.path.join(workdir.name, 'chat_sessions.db'),
+        'LLM_CACHE_PATH': os.path.join(workdir.name, 'llm_cache.db'),
+        'ARCHIVE_INTERVAL_HOURS': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+    first = run_once(env)
+    runs = [run_once(env) for _ in range(max(args.repeat, 1))]
+    workdir.cleanup()
+
+    def median_ms(key: str, source=runs) -> float:
+        return round(statistics.median(run[key] for run in source), 1)
+
+    report = {
+        **_git_revision(),
+        'python': sys.version.split()[0],
+        'runs': len(runs),
+        'import_app_ms': round(statistics.median(run['modules']['app']['cumulative_us'] for run in runs) / 1000, 1),
+        'import_wall_ms': median_ms('import_ms'),
+        'create_app_ms': median_ms('create_app_ms'),
+        'create_app_new_database_ms': round(first['create_app_ms'], 1),
+        'first_request_ms': median_ms('first_request_ms'),
+        'deferred_loaded_at_startup': first['deferred_loaded'],
+        'heaviest_modules': _top(runs, args.top),
+    }
+    print(json.dumps(report, indent=2))
+    if args.max_import_ms is not None and report['import_app_ms'] > args.max_import_ms:
+        print(f"import time {report['import_app_ms']} ms exceeds the budget of {args.max_import_ms} ms",
+              file=sys.stderr)
+        raise SystemExit(1)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""Retention of soft-deleted rows: archive tables, compaction and restore.
+
+A soft delete only sets ``deleted_at``, so deleted notes, tasks and subtasks
+stay in the hot tables and their indexes for good. Compaction moves rows
+deleted more than ``ARCHIVE_RETENTION_DAYS`` ago into ``notes_archive``,
+``tasks_archive`` and ``subtasks_archive`` and deletes them from the live
+tables. Archive rows have their own key; the live id is kept as
+``original_id``, since SQLite can hand it to a new row later. An archived
+task takes all its subtasks with it (linked by ``archived_task_id``); the
+search triggers drop the deleted rows from the full-text index.
+
+Rows are moved in batches of ``ARCHIVE_BATCH_SIZE``, each in its own short
+transaction, so the writer lock is never held for long. Afterwards the freed
+pages are returned to the filesystem with ``PRAGMA incremental_vacuum`` (the
+database must use auto_vacuum=INCREMENTAL, see core/sqlite_profile.py) and
+the query planner statistics are refreshed with ``PRAGMA optimize``.
+
+Compaction runs as a background job (kind ``compact``, core/jobs.py) every
+``ARCHIVE_INTERVAL_HOURS``, and on demand through ``POST /api/admin/compact``
+or ``flask --app app compact-db``. :func:`restore` moves an archived row
+(by its archive id) back into the live tables.
+
+Configuration (environment variables):
+    ARCHIVE_RETENTION_DAYS   days a soft-deleted row stays in the live tables (default 30)
+    ARCHIVE_BATCH_SIZE       rows moved per transaction (default 500)
+    ARCHIVE_INTERVAL_HOURS   hours between scheduled compactions, 0 disables (default 24)
+    ARCHIVE_VACUUM_PAGES     pages freed per compaction, 0 frees all (default 0)
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select, update
+
+from models import db, Project, Note, Task, Subtask, ArchivedNote, ArchivedTask, ArchivedSubtask
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', 30))
+BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', 24))
+VACUUM_PAGES = int(os.environ.get('ARCHIVE_VACUUM_PAGES', 0))
+
+# element type (as in the API paths) -> (live model, archive model, columns copied);
+# the live id is stored as original_id
+TABLES: Dict[str, Tuple[type, type, Tuple[str, ...]]] = {
+    'notes': (Note, ArchivedNote,
+              ('id', 'content', 'category', 'created_at', 'updated_at', 'deleted_at', 'project_id')),
+    'tasks': (Task, ArchivedTask,
+              ('id', 'content', 'category', 'priority', 'deadline', 'is_completed',
+               'created_at', 'updated_at', 'deleted_at', 'project_id')),
+    'subtasks': (Subtask, ArchivedSubtask,
+                 ('id', 'content', 'is_completed', 'created_at', 'deleted_at', 'task_id')),
+}
+
+
+class RestoreConflict(Exception):
+    """The archived row cannot go back because what it belongs to is gone."""
+
+
+def expired_query(model, cutoff: datetime, limit: int):
+    """Ids of rows soft deleted before ``cutoff`` (served by ix_<table>_deleted_at)."""
+    return select(model.id).where(model.deleted_at < cutoff).order_by(model.deleted_at).limit(limit)
+
+
+def _copy(element_type: str, ids: List[int], now: datetime, with_task: bool = False) -> None:
+    """Copy live rows into the archive (caller deletes them and commits).
+
+    ``with_task``: subtasks archived together with their task, just copied.
+    """
+    model, archive, columns = TABLES[element_type]
+    values = [getattr(model, name) for name in columns]
+    targets = ['original_id', *columns[1:]]
+    if with_task:
+        # The task's archive row from this same compaction
+        values.append(select(func.max(ArchivedTask.id)).where(
+            ArchivedTask.original_id == Subtask.task_id, ArchivedTask.archived_at == now).scalar_subquery())
+        targets.append('archived_task_id')
+    copy = select(*values, literal(now, DateTime)).where(model.id.in_(ids))
+    db.session.execute(insert(archive).from_select([*targets, 'archived_at'], copy))
+
+
+def _delete(model, ids: List[int]) -> None:
+    db.session.execute(delete(model).where(model.id.in_(ids)), execution_options={'synchronize_session': False})
+
+
+def _archive_batches(element_type: str, cutoff: datetime, batch_size: int, now: datetime) -> Tuple[int, int]:
+    """Archive expired rows of one table batch by batch. Returns (rows, cascaded subtasks)."""
+    model = TABLES[element_type][0]
+    moved = cascaded = 0
+    while True:
+        ids = db.session.execute(expired_query(model, cutoff, batch_size)).scalars().all()
+        if not ids:
+            return moved, cascaded
+        try:
+            _copy(element_type, ids, now)
+            if model is Task:
+                # Copied after their tasks, so they can point at the tasks' archive rows,
+                # and deleted first, since they reference the task (foreign keys are on)
+                subtask_ids = db.session.execute(
+                    select(Subtask.id).where(Subtask.task_id.in_(ids))).scalars().all()
+                if subtask_ids:
+                    _copy('subtasks', subtask_ids, now, with_task=True)
+                    _delete(Subtask, subtask_ids)
+                cascaded += len(subtask_ids)
+            _delete(model, ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved += len(ids)
+
+
+def vacuum(engine, pages: int = VACUUM_PAGES, full: bool = False) -> Dict[str, object]:
+    """Return free pages to the filesystem and refresh planner statistics.
+
+    ``full`` runs a complete ``VACUUM`` instead (rewrites the whole file and
+    applies a changed auto_vacuum mode); it needs exclusive access for its
+    duration.
+    """
+    if engine.dialect.name != 'sqlite':
+        return {}
+    with engine.connect() as connection:
+        raw = connection.connection.dbapi_connection
+        free_before = raw.execute('PRAGMA freelist_count').fetchone()[0]
+        mode = raw.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if full:
+            raw.execute('VACUUM')
+        elif mode == 2:  # INCREMENTAL
+            # Each step of the statement frees pages; fetch all to run it to the end
+            raw.execute(f'PRAGMA incremental_vacuum({int(pages)})' if pages else 'PRAGMA incremental_vacuum').fetchall()
+        elif free_before:
+            logger.info("archive.vacuum_unavailable", extra={
+                "free_pages": free_before,
+                "hint": "auto_vacuum is not INCREMENTAL; run flask --app app compact-db --full-vacuum once"})
+        # Bounded ANALYZE of the tables whose statistics are stale
+        raw.execute('PRAGMA analysis_limit = 400')
+        raw.execute('PRAGMA optimize')
+        free_after = raw.execute('PRAGMA freelist_count').fetchone()[0]
+    return {'free_pages_before': free_before, 'free_pages_after': free_after, 'full_vacuum': full}
+
+
+def compact(retention_days: Optional[int] = None, batch_size: Optional[int] = None,
+            full_vacuum: bool = False, now: Optional[datetime] = None) -> Dict[str, object]:
+    """Archive rows soft deleted longer than the retention period, then vacuum.
+
+    Needs an app context. Returns the number of rows archived per table.
+    """
+    retention_days = RETENTION_DAYS if retention_days is None else int(retention_days)
+    if retention_days < 0:
+        raise ValueError('retention_days must not be negative')
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    batch_size = batch_size or BATCH_SIZE
+    start = time.perf_counter()
+
+    tasks, cascaded = _archive_batches('tasks', cutoff, batch_size, now)
+    # Subtasks deleted on their own, under a task that is still live (or recently deleted)
+    subtasks, _ = _archive_batches('subtasks', cutoff, batch_size, now)
+    notes, _ = _archive_batches('notes', cutoff, batch_size, now)
+    db.session.remove()
+
+    result = {
+        'cutoff': cutoff.isoformat(),
+        'archived': {'notes': notes, 'tasks': tasks, 'subtasks': subtasks + cascaded},
+        **vacuum(db.engine, full=full_vacuum),
+        'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+    logger.info("archive.compacted", extra=result)
+    return result
+
+
+def run_compact_job(payload: dict) -> Dict[str, object]:
+    """Job handler for 'compact'."""
+    return compact(payload.get('retention_days'))
+
+
+def _archived_dict(element_type: str, row) -> dict:
+    names = ('id', 'original_id') + TABLES[element_type][2][1:] + ('archived_at',)
+    if element_type == 'subtasks':
+        names += ('archived_task_id',)
+    data = {name: getattr(row, name) for name in names}
+    for name, value in data.items():
+        if isinstance(value, datetime):
+            data[name] = value.isoformat()
+    return data
+
+
+def list_archived(element_type: str, limit: int = 50, offset: int = 0) -> List[dict]:
+    """Archived rows of one type, most recently archived first."""
+    archive = TABLES[element_type][1]
+    rows = db.session.execute(select(archive).order_by(archive.archived_at.desc(), archive.id.desc())
+                              .limit(limit).offset(offset)).scalars().all()
+    return [_archived_dict(element_type, row) for row in rows]
+
+
+def _reinsert(element_type: str, row, **values) -> int:
+    """Insert an archived row back into its live table. Returns the live id.
+
+    The original id is kept unless a new row took it in the meantime
+    (SQLite hands out max(id) + 1), in which case a new id is assigned.
+    """
+    model, _, columns = TABLES[element_type]
+    data = {name: getattr(row, name) for name in columns[1:]}
+    data.update(values)
+    if db.session.get(model, row.original_id) is None:
+        data['id'] = row.original_id
+    return db.session.execute(insert(model).values(**data).returning(model.id)).scalar_one()
+
+
+def restore(element_type: str, item_id: int) -> dict:
+    """Move an archived note, task (with its archived subtasks) or subtask back.
+
+    ``item_id`` is the archive id (``id`` in :func:`list_archived`). The
+    restored row is live again (``deleted_at`` cleared). Subtasks that
+    were archived with their task keep their own ``deleted_at``. Raises
+    ``LookupError`` when the row is not archived and :class:`RestoreConflict`
+    when its project or task no longer exists.
+    """
+    _, archive, _ = TABLES[element_type]
+    row = db.session.get(archive, item_id)
+    if row is None:
+        raise LookupError(f'{element_type} {item_id} is not archived')
+    now = datetime.utcnow()
+    try:
+        if element_type == 'subtasks':
+            task = db.session.get(Task, row.task_id)
+            if task is None:
+                raise RestoreConflict(f'Task {row.task_id} is archived or gone; restore the task first')
+            new_id = _reinsert('subtasks', row, deleted_at=None)
+            # Subtasks have no updated_at; touch the task so its ETag changes
+            db.session.execute(update(Task).where(Task.id == row.task_id).values(updated_at=now))
+            restored = {'subtasks': 1}
+        else:
+            if db.session.get(Project, row.project_id) is None:
+                raise RestoreConflict(f'Project {row.project_id} no longer exists')
+            new_id = _reinsert(element_type, row, deleted_at=None, updated_at=now)
+            restored = {element_type: 1}
+            if element_type == 'tasks':
+                # Task first, so the search trigger indexes its live subtasks
+                subtasks = db.session.execute(
+                    select(ArchivedSubtask).where(ArchivedSubtask.archived_task_id == row.id)).scalars().all()
+                for subtask in subtasks:
+                    _reinsert('subtasks', subtask, task_id=new_id)
+                    db.session.delete(subtask)
+                restored['subtasks'] = len(subtasks)
+        db.session.delete(row)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info("archive.restored", extra={"type": element_type, "id": item_id, "new_id": new_id})
+    return {'type': element_type, 'id': new_id, 'archived_id': item_id, 'restored': restored}
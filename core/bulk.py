@@ -0,0 +1,210 @@
+"""Bulk creation of tasks and notes in a single transaction.
+
+Every item is validated on its own and gets its own result entry; the valid
+ones are written together. Project tags come from the tag cache (with at most
+one query for tags it does not know yet), missing projects are created with
+one multi-row INSERT, and rows and subtasks are inserted with batched
+executemany statements inside one commit.
+
+Row ids are allocated up front (``MAX(id) + 1 ...``) so subtasks can reference
+their task without RETURNING, which SQLite cannot return in parameter order
+and SQLAlchemy would otherwise fall back to one INSERT per row for. The
+transaction takes SQLite's write lock (``BEGIN IMMEDIATE``) before reading
+MAX, so no other writer can insert until the commit and the allocated ids
+stay free; concurrent writers wait on ``busy_timeout`` instead.
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+
+from core import projects
+from models import db, Project, Note, Task, Subtask
+
+MAX_BULK_ITEMS = 5000
+
+
+class BulkError(ValueError):
+    """The request as a whole cannot be processed."""
+
+
+def _begin_write() -> None:
+    """Take the database write lock now, before ids are allocated from MAX(id)."""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    # A transaction that already wrote holds the lock; otherwise start one that does
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _allocate_ids(model, count: int) -> List[int]:
+    start = db.session.execute(select(func.coalesce(func.max(model.id), 0))).scalar() + 1
+    return list(range(start, start + count))
+
+
+def _ensure_projects(tags: Iterable[str]) -> Dict[str, int]:
+    """Map tags to project ids, creating the missing projects in one statement."""
+    tag_ids = {}
+    unknown = set()
+    for tag in set(tags):
+        project_id = projects.cache.get(tag)
+        if project_id is None:
+            unknown.add(tag)
+        else:
+            tag_ids[tag] = project_id
+    if not unknown:
+        return tag_ids
+    rows = db.session.execute(select(Project.tag, Project.id).where(Project.tag.in_(unknown))).all()
+    tag_ids.update({tag: project_id for tag, project_id in rows})
+    projects.cache.update({tag: project_id for tag, project_id in rows})
+    missing = sorted(unknown - tag_ids.keys())
+    if missing:
+        now = datetime.utcnow()
+        project_ids = _allocate_ids(Project, len(missing))
+        db.session.execute(insert(Project), [
+            {'id': project_id, 'tag': tag, 'created_at': now, 'name': projects.default_name(tag)}
+            for project_id, tag in zip(project_ids, missing)
+        ])
+        for tag, project_id in zip(missing, project_ids):
+            projects.stage(tag, project_id)
+        tag_ids.update(zip(missing, project_ids))
+    return tag_ids
+
+
+def _check_items(items) -> None:
+    if not isinstance(items, list):
+        raise BulkError('Expected a JSON list of items')
+    if not items:
+        raise BulkError('No items given')
+    if len(items) > MAX_BULK_ITEMS:
+        raise BulkError(f'Too many items (max {MAX_BULK_ITEMS})')
+
+
+def _parse_task(item) -> dict:
+    if not isinstance(item, dict):
+        raise ValueError('Item must be an object')
+    content = (item.get('content') or '').strip()
+    if not content:
+        raise ValueError('Content cannot be empty')
+    deadline = None
+    if item.get('deadline'):
+        try:
+            deadline = datetime.fromisoformat(item['deadline'])
+        except (TypeError, ValueError):
+            raise ValueError('Invalid deadline format')
+    subtasks = []
+    for subtask in item.get('subtasks') or []:
+        text = (subtask.get('content') or '').strip() if isinstance(subtask, dict) else ''
+        if not text:
+            raise ValueError('Subtask content cannot be empty')
+        subtasks.append({'content': text, 'is_completed': bool(subtask.get('is_completed', False))})
+    return {
+        'content': content,
+        'category': item.get('category'),
+        'priority': item.get('priority'),
+        'deadline': deadline,
+        'is_completed': bool(item.get('is_completed', False)),
+        'project_tag': item.get('project_tag') or projects.DEFAULT_TAG,
+        'subtasks': subtasks,
+    }
+
+
+def _parse_note(item, sanitize: Callable[[str], str]) -> dict:
+    if not isinstance(item, dict):
+        raise ValueError('Item must be an object')
+    content = sanitize(item.get('content') or '').strip()
+    if not content:
+        raise ValueError('Content cannot be empty')
+    return {
+        'content': content,
+        'category': item.get('category'),
+        'project_tag': item.get('project_tag') or projects.DEFAULT_TAG,
+    }
+
+
+def _parse_all(items, parse) -> Tuple[List[Tuple[int, dict]], List[Optional[dict]]]:
+    valid, results = [], [None] * len(items)
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, parse(item)))
+        except (ValueError, AttributeError, TypeError) as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+    return valid, results
+
+
+def bulk_create_tasks(items) -> List[dict]:
+    """Create tasks (with subtasks) in one transaction. Returns per-item results."""
+    _check_items(items)
+    valid, results = _parse_all(items, _parse_task)
+    if not valid:
+        return results
+
+    try:
+        _begin_write()
+        tag_ids = _ensure_projects(data['project_tag'] for _, data in valid)
+        now = datetime.utcnow()
+        task_ids = _allocate_ids(Task, len(valid))
+        db.session.execute(insert(Task), [
+            {
+                'id': task_id,
+                'content': data['content'],
+                'category': data['category'],
+                'priority': data['priority'],
+                'deadline': data['deadline'],
+                'is_completed': data['is_completed'],
+                'project_id': tag_ids[data['project_tag']],
+                'created_at': now,
+                'updated_at': now,
+            }
+            for task_id, (_, data) in zip(task_ids, valid)
+        ])
+
+        subtask_rows = [
+            {**subtask, 'task_id': task_id, 'created_at': now}
+            for task_id, (_, data) in zip(task_ids, valid)
+            for subtask in data['subtasks']
+        ]
+        if subtask_rows:
+            db.session.execute(insert(Subtask), subtask_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for task_id, (index, data) in zip(task_ids, valid):
+        results[index] = {'index': index, 'status': 'created', 'id': task_id, 'project_tag': data['project_tag']}
+    return results
+
+
+def bulk_create_notes(items, sanitize: Callable[[str], str] = lambda text: text) -> List[dict]:
+    """Create notes in one transaction. Returns per-item results."""
+    _check_items(items)
+    valid, results = _parse_all(items, lambda item: _parse_note(item, sanitize))
+    if not valid:
+        return results
+
+    try:
+        _begin_write()
+        tag_ids = _ensure_projects(data['project_tag'] for _, data in valid)
+        now = datetime.utcnow()
+        note_ids = _allocate_ids(Note, len(valid))
+        db.session.execute(insert(Note), [
+            {
+                'id': note_id,
+                'content': data['content'],
+                'category': data['category'],
+                'project_id': tag_ids[data['project_tag']],
+                'created_at': now,
+                'updated_at': now,
+            }
+            for note_id, (_, data) in zip(note_ids, valid)
+        ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for note_id, (index, data) in zip(note_ids, valid):
+        results[index] = {'index': index, 'status': 'created', 'id': note_id, 'project_tag': data['project_tag']}
+    return results
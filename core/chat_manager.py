@@ -1,10 +1,17 @@
 from datetime import datetime
+import logging
 import os
 import random
-import re  # Add at the top of the file if not already imported
 
-from models import db, Task, Project
+from core import tools
 from backend.inference import LLMInference
+from backend.single_flight import SingleFlight
+from backend.resilience import UpstreamUnavailable
+from backend.llm_config import LLMConfig, create_config_store
+from backend.router import router
+from core.session_store import create_session_store
+
+logger = logging.getLogger(__name__)
 
 
 # Local ChatMessage class for chat history management
@@ -21,15 +28,30 @@ class ChatMessage:
             "timestamp": self.timestamp.isoformat()
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatMessage":
+        return cls(data["role"], data["content"], datetime.fromisoformat(data["timestamp"]))
+
 
 class ChatManager:
-    def __init__(self):
+    def __init__(self, sanitize=None):
         # For managing chat tasks and history
-        self.chat_histories = {}
-        self.max_history = 10
+        # Upper bound on stored messages; what is sent to the model is decided
+        # by the token-budgeted context builder in LLMInference
+        self.max_history = 100
+        # Bounded in-memory LRU with write-behind persistence, or the shared-state
+        # backend when several workers serve the app (core/session_store.py)
+        self.sessions = create_session_store(ChatMessage.from_dict, max_messages=self.max_history)
 
         # LLM instance for chat responses
         self.llm = LLMInference(api_key=os.environ.get("DEEPSEEK_API_KEY"))
+        # Per-session immutable configs (model, sampling, personalization) with the
+        # shared LLM's config as the default, in the same backend as the histories
+        # (backend/llm_config.py)
+        self.configs = create_config_store(self.llm.config, max_sessions=self.sessions.max_sessions)
+        # Identical requests in flight at once (double submit, several tabs) share one
+        # upstream call, one history entry and one tool run (backend/single_flight.py)
+        self.inflight = SingleFlight()
         self.fallback_responses = {
             'greeting': [
                 "Hi! How can I help?",
@@ -40,151 +62,153 @@ class ChatManager:
                 "I understand. What next?",
                 "How can I help?",
                 "Please let me know what you need."
+            ],
+            # LLM upstream down, slow past its deadline or circuit breaker open
+            'unavailable': [
+                "Asystent jest chwilowo niedostępny. Spróbuj ponownie za chwilę."
             ]
         }
-        # Flag to ensure tools are declared to LLM on first connection
-        self.tools_declared = False
-
-    def declare_tools(self) -> None:
-        tools_message = (
-            "[Tool Declaration]\n"
-            "Available Tools:\n"
-            "- add_task: Use this tool to add a new task to the system.\n"
-            "  Command usage: 'ADD TASK:' or 'DODAJ ZADANIE:' followed by the task description.\n"
-        )
-        print("[LLM] Declaring available tools to LLM:")
-        print(tools_message)
-        self.tools_declared = True
+        # Cleans task and note content written by the chat tools (the app passes its sanitize_input)
+        self.sanitize = sanitize or (lambda text: text)
+
+    def tool_options(self, config: LLMConfig) -> dict:
+        """
+        Tool definitions and their runner for a request. Only the chat model is
+        offered tools; the reasoner answers in text.
+        """
+        if config.model_type != "chat":
+            return {}
+        return {"tools": tools.DEFINITIONS, "run_tools": self.run_tools}
+
+    def run_tools(self, calls: list) -> list:
+        """
+        Run all tool calls of one LLM response in a single transaction (core/tools.py).
+        """
+        return tools.execute(calls, sanitize=self.sanitize)
 
     def generate_task_content_with_LLM(self, prompt: str) -> str:
         """
         Generate task content using LLM based on the provided prompt.
         For demonstration, returns a simulated task content string.
         """
-        print("[LLM] Generating task content using available tool 'add_task' with prompt:", prompt)
+        logger.info("tool.add_task.generate", extra={"prompt": prompt})
         return f"Generated task based on prompt: '{prompt}'"
 
-    def add_task(self, prompt: str) -> bool:
+    # Per-session LLM configuration
+    def config_for(self, session_id: str = None) -> LLMConfig:
         """
-        Add a task to the database by generating its content using LLM.
-        Finds or creates a default project with tag '#inbox' and associates the new task with it.
+        Return the config snapshot for a session (the default one if it has none).
         """
-        print("[DEBUG] add_task tool invoked with prompt:", prompt)
-        # Generate task content using LLM simulation
-        task_content = self.generate_task_content_with_LLM(prompt)
-        print(f"Task to add: {task_content}")
-        try:
-            # Find the default project with tag '#inbox'
-            project = Project.query.filter_by(tag="#inbox").first()
-            if not project:
-                project = Project(tag="#inbox", name="Inbox")
-                db.session.add(project)
-                db.session.commit()
-            
-            # Create a new Task record with generated content
-            new_task = Task(
-                content=task_content,
-                project_id=project.id
-            )
-            db.session.add(new_task)
-            db.session.commit()
-            print("Task successfully added to the database.")
-            return True
-        except Exception as e:
-            print(f"Error adding task: {e}")
-            db.session.rollback()
-            return False
-
-    def process_llm_response(self, llm_response: str) -> None:
-        """
-        Process the LLM response to detect a command for adding a task.
-        Looks for the keyword 'ADD TASK:' or 'DODAJ ZADANIE:' and extracts the prompt for task generation.
-        If the command is found, calls add_task to add the task to the system.
-        """
-        upper_response = llm_response.upper()
-        if "ADD TASK:" in upper_response or "DODAJ ZADANIE:" in upper_response:
-            print("[LLM] Detected potential add_task command in LLM response.")
-            if "ADD TASK:" in upper_response:
-                parts = llm_response.split("ADD TASK:")
-            else:
-                parts = llm_response.split("DODAJ ZADANIE:")
-            if len(parts) > 1:
-                prompt = parts[1].strip()
-                print("[LLM] User used request to add a new task. Forwarding to 'add_task' tool with prompt:", prompt)
-                if self.add_task(prompt):
-                    print("LLM successfully added the task.")
-                else:
-                    print("LLM failed to add the task.")
-            else:
-                print("No task prompt found in LLM response.")
-        else:
-            print("No add-task command detected in LLM response.")
+        return self.configs.get(session_id)
+
+    def update_config(self, session_id: str = None, **changes) -> LLMConfig:
+        """
+        Change settings for one session, or the default for all sessions without
+        their own config when session_id is None. Raises ValueError on invalid values.
+        """
+        config = self.configs.update(session_id, **changes)
+        if not session_id:
+            self.llm.config = config
+        return config
+
+    @staticmethod
+    def _route(prompt: str, config: LLMConfig) -> LLMConfig:
+        """
+        With auto routing on, the config with the model picked for this prompt.
+        """
+        return router.route(prompt, config) if config.auto_route else config
 
     # Chat functionality methods
     def get_chat_history(self, session_id: str) -> list:
         """
         Return the chat history for the given session as a list of dicts.
         """
-        history = self.chat_histories.get(session_id, [])
+        history = self.sessions.get(session_id)
         return [msg.to_dict() for msg in history]
 
     def clear_chat_history(self, session_id: str) -> None:
         """
         Clear the chat history for the given session.
         """
-        if session_id in self.chat_histories:
-            del self.chat_histories[session_id]
-
-    def filter_tool_command(self, response: str) -> str:
-        """
-        Filters out the tool command from the LLM response.
-        If the response contains the [add_task] command in the format:
-            [add_task]: "task content"
-        then extracts the task content, calls add_task, and returns a cleaned message.
-        If no tool command is found, returns the original response.
-        """
-        match = re.search(r'\[add_task\]:\s*"([^"]+)"', response, re.IGNORECASE)
-        if match:
-            task_text = match.group(1).strip()
-            if not task_text:
-                print("[ERROR] No task content provided in the add_task command.")
-                return "Nie podano treści zadania."
-            print("[FILTER] Detected add_task command with task content:", task_text)
-            if self.add_task(task_text):
-                return "Zadanie zostało dodane."
-            else:
-                return "Błąd przy dodawaniu zadania."
-        else:
-            return response
+        self.sessions.clear(session_id)
+
+    def _fallback_response(self, prompt: str, unavailable: bool = False) -> str:
+        if unavailable:
+            return random.choice(self.fallback_responses['unavailable'])
+        if any(word in prompt.lower() for word in ['hi', 'hello']):
+            return random.choice(self.fallback_responses['greeting'])
+        return random.choice(self.fallback_responses['default'])
+
+    def _finish_response(self, prompt: str, session_id: str, response: str) -> str:
+        """
+        Store the exchange in history and return the response to show to the user.
+        Tool calls have already run inside the LLM request (see run_tools).
+        """
+        self.sessions.append(session_id, ChatMessage("user", prompt), ChatMessage("assistant", response))
+        return response
 
     def generate_response(self, prompt: str, session_id: str, context: dict = None) -> str:
         """
         Generate a response using the LLM model and update the chat history.
-        Returns the generated response, after filtering out any internal tool commands.
+        Returns the generated response; tool calls are run before the final answer.
+        """
+        try:
+            history = self.sessions.get(session_id)
+            history_dicts = [msg.to_dict() for msg in history]
+            if self.llm and self.llm.model is not None:
+                config = self._route(prompt, self.config_for(session_id))
+                key = self.llm.request_key(prompt, history_dicts, session_id, config)
+                return self.inflight.do(key, lambda: self._finish_response(
+                    prompt, session_id,
+                    self.llm.generate_response(prompt, history_dicts, context, config, **self.tool_options(config))))
+            response = self._fallback_response(prompt)
+            return self._finish_response(prompt, session_id, response)
+        except UpstreamUnavailable as e:
+            # Fail fast to the fallback; the exchange is not stored in history
+            logger.warning("chat.upstream_unavailable", extra={"session_id": session_id, "error": str(e)})
+            return self._fallback_response(prompt, unavailable=True)
+        except Exception:
+            logger.exception("chat.response_failed", extra={"session_id": session_id})
+            return self._fallback_response(prompt)
+
+    def _stream_turn(self, prompt: str, session_id: str, history_dicts: list, context: dict = None,
+                     config: LLMConfig = None):
+        """
+        One streamed exchange with the LLM: its events, then ("done", response) after
+        history is stored.
+        """
+        parts = []
+        for kind, text in self.llm.generate_response_stream(prompt, history_dicts, context, config,
+                                                            **self.tool_options(config)):
+            if kind == "content":
+                parts.append(text)
+            yield kind, text
+        yield "done", self._finish_response(prompt, session_id, "".join(parts))
+
+    def generate_response_stream(self, prompt: str, session_id: str, context: dict = None):
+        """
+        Stream a response from the LLM as events.
+        Yields ("reasoning" | "content", text) pairs while tokens arrive and a final
+        ("done", response) once the full answer is known and stored in history. Tool
+        calls run between the model's tool call turn and the streamed follow-up answer.
         """
-        if not self.tools_declared:
-            self.declare_tools()
         try:
-            history = self.chat_histories.get(session_id, [])
+            history = self.sessions.get(session_id)
             history_dicts = [msg.to_dict() for msg in history]
             if self.llm and self.llm.model is not None:
-                response = self.llm.generate_response(prompt, history_dicts, context)
+                config = self._route(prompt, self.config_for(session_id))
+                key = self.llm.request_key(prompt, history_dicts, session_id, config)
+                yield from self.inflight.stream(
+                    key, lambda: self._stream_turn(prompt, session_id, history_dicts, context, config))
             else:
-                if any(word in prompt.lower() for word in ['hi', 'hello']):
-                    response = random.choice(self.fallback_responses['greeting'])
-                else:
-                    response = random.choice(self.fallback_responses['default'])
-            
-            # Filter out any tool commands from the response
-            response_to_show = self.filter_tool_command(response)
-            
-            # Append messages to history (store user's original prompt and the filtered response)
-            history.append(ChatMessage("user", prompt))
-            history.append(ChatMessage("assistant", response_to_show))
-            self.chat_histories[session_id] = history[-self.max_history:]
-            return response_to_show
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            if any(word in prompt.lower() for word in ['hi', 'hello']):
-                return random.choice(self.fallback_responses['greeting'])
-            return random.choice(self.fallback_responses['default']) 
\ No newline at end of file
+                response = self._fallback_response(prompt)
+                yield "content", response
+                yield "done", self._finish_response(prompt, session_id, response)
+        except UpstreamUnavailable as e:
+            logger.warning("chat.upstream_unavailable", extra={"session_id": session_id, "error": str(e)})
+            response = self._fallback_response(prompt, unavailable=True)
+            yield "content", response
+            yield "done", response
+        except Exception:
+            logger.exception("chat.stream_failed", extra={"session_id": session_id})
+            yield "done", self._fallback_response(prompt)
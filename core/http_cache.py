@@ -0,0 +1,169 @@
+"""Conditional GET and response compression for the JSON API.
+
+Validators are derived from the data, not from the serialized body: a
+collection's version is its live row count plus its newest ``updated_at``
+(an index-only count and one probe of the partial ``*_live_updated`` index),
+and a single item's version is its own ``updated_at``, also sent as
+Last-Modified. A poll that finds nothing changed is answered with 304 after
+one aggregate query, before anything is loaded or serialized.
+
+ETags are weak because the body is compressed per client; the query string
+is part of a collection ETag since filters and cursors select what is sent.
+Soft deletes bump ``updated_at`` through ``onupdate`` and drop the live count,
+and changes to subtasks touch their parent task, so both show up here.
+
+Configuration (environment variables):
+    HTTP_COMPRESS_MIN_SIZE   smallest body in bytes worth compressing (default 1024)
+    HTTP_COMPRESS_LEVEL      gzip level (default 6); brotli uses quality 4
+"""
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+from flask import Response, request
+from sqlalchemy import func, select
+
+from models import db, Project, Note, Task
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get("HTTP_COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.environ.get("HTTP_COMPRESS_LEVEL", 6))
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/css", "application/javascript", "text/javascript")
+
+Validators = Tuple[Optional[str], Optional[datetime]]
+
+
+def _etag(*parts) -> str:
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def collection_validators(model) -> Validators:
+    """ETag of all live rows of a notes/tasks table.
+
+    No Last-Modified: removing a row lowers the count without moving the
+    newest ``updated_at``, so a date alone cannot validate a collection.
+    """
+    live = model.deleted_at.is_(None)
+    # Separate subqueries: max() is then a single probe of the partial index
+    count, newest = db.session.execute(select(
+        select(func.count()).select_from(model).where(live).scalar_subquery(),
+        select(func.max(model.updated_at)).where(live).scalar_subquery(),
+    )).one()
+    return _etag(model.__tablename__, count, newest, request.query_string.decode()), None
+
+
+def projects_validators() -> Validators:
+    """Projects are only ever added, so the count and the newest id are enough."""
+    count, last_id = db.session.execute(select(func.count(), func.max(Project.id))).one()
+    return _etag("projects", count, last_id), None
+
+
+def item_validators(model, item_id: int) -> Validators:
+    """ETag and Last-Modified of a single row; (None, None) when it does not exist."""
+    last_modified = db.session.execute(
+        select(model.updated_at).where(model.id == item_id)
+    ).scalar_one_or_none()
+    if last_modified is None:
+        return None, None
+    return _etag(model.__tablename__, item_id, last_modified), last_modified
+
+
+def notes_validators() -> Validators:
+    return collection_validators(Note)
+
+
+def tasks_validators() -> Validators:
+    return collection_validators(Task)
+
+
+def note_validators(note_id: int) -> Validators:
+    return item_validators(Note, note_id)
+
+
+def task_validators(task_id: int) -> Validators:
+    return item_validators(Task, task_id)
+
+
+def _not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates have one second resolution
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def _set_validators(response: Response, etag: str, last_modified: Optional[datetime]) -> None:
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Let clients keep the body but revalidate every time
+    response.cache_control.no_cache = True
+
+
+def conditional(validators: Callable[..., Validators]):
+    """Answer GET with 304 when the client's validators still match.
+
+    ``validators`` receives the view arguments and must be cheaper than the
+    view itself; when it returns no ETag the view runs unconditionally.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = validators(*args, **kwargs)
+            if etag is None:
+                return view(*args, **kwargs)
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+                _set_validators(response, etag, last_modified)
+                return response
+            response = view(*args, **kwargs)
+            if isinstance(response, Response) and response.status_code == 200:
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def _choose_encoding() -> Optional[str]:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response: Response) -> Response:
+    """after_request hook: gzip/brotli-encode large text responses."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    if encoding == "br":
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app) -> None:
+    app.after_request(compress_response)
@@ -0,0 +1,304 @@
+"""In-process background job queue with persistent job records.
+
+Work that does not have to finish before the response (AI task generation,
+compaction of soft-deleted rows) is submitted as a job: a row in the ``jobs``
+table plus a call on a bounded thread pool. The request returns the job id
+right away and clients poll ``/api/jobs/<id>`` for the outcome. Chat tool
+calls are not jobs: they run in the request (core/tools.py), because their
+results go back to the model in the same exchange.
+
+Each job runs in its own app context (so its own database session) and is
+claimed with a conditional UPDATE, so the same job never runs twice at once.
+A handler that raises is retried with exponential backoff until it has used
+``max_attempts``; then the job is marked failed with the error.
+
+A claimed job records the claiming process (``worker_id``) and a lease
+(``lease_until``) that the process renews while the job runs. Several
+processes (gunicorn workers, an old and a new instance during a rolling
+restart) share the table, so a running job is only taken back when its
+lease has expired, i.e. its process stopped renewing it. Expired jobs are
+re-queued at startup by :meth:`JobQueue.init_app` (which also resumes jobs
+still queued from before) and then periodically by every running process.
+
+Job rows are written through the engine in their own short transactions,
+never through ``db.session``, so submitting a job neither commits nor rolls
+back the caller's pending changes.
+
+Configuration (environment variables):
+    JOBS_WORKERS        worker threads (default 2)
+    JOBS_MAX_ATTEMPTS   attempts per job before it fails (default 3)
+    JOBS_RETRY_DELAY    seconds before the first retry, doubled per attempt (default 1)
+    JOBS_LEASE_SECONDS  lease of a running job, renewed every third of it (default 60)
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import func, insert, select, update
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], Any]
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def to_dict(row) -> dict:
+    return {
+        'id': row.id,
+        'kind': row.kind,
+        'status': row.status,
+        'result': json.loads(row.result) if row.result else None,
+        'error': row.error,
+        'attempts': row.attempts,
+        'max_attempts': row.max_attempts,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+        'finished_at': row.finished_at.isoformat() if row.finished_at else None,
+    }
+
+
+class JobQueue:
+    def __init__(self, workers: int = 2, max_attempts: int = 3, retry_delay: float = 1.0, lease: float = 60.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        # Owner of the jobs this process claims
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.app = None
+        self._handlers: Dict[str, Handler] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._heartbeat: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'retried': 0, 'in_flight': 0,
+                       'reclaimed': 0}
+
+    def register(self, kind: str, handler: Handler) -> Handler:
+        """Register the function that runs jobs of ``kind``.
+
+        The handler gets the job payload and runs inside an app context; its
+        return value (JSON serializable) becomes the job result.
+        """
+        self._handlers[kind] = handler
+        return handler
+
+    def init_app(self, app) -> int:
+        """Start the workers and resume unfinished jobs. Returns how many were resumed."""
+        self.app = app
+        self._start()
+        with app.app_context():
+            job_ids = self._resume(queued=True)
+        if job_ids:
+            logger.info("jobs.resumed", extra={"count": len(job_ids)})
+        return len(job_ids)
+
+    def submit(self, kind: str, payload: dict, max_attempts: Optional[int] = None) -> int:
+        """Store a new job and hand it to the workers. Returns the job id."""
+        if kind not in self._handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        if self.app is None:
+            self.app = current_app._get_current_object()
+        self._start()
+        now = _utcnow()
+        with db.engine.begin() as connection:
+            job_id = connection.execute(insert(Job).values(
+                kind=kind, status=QUEUED, payload=json.dumps(payload, ensure_ascii=False),
+                attempts=0, max_attempts=max_attempts or self.max_attempts, created_at=now, updated_at=now,
+            ).returning(Job.id)).scalar_one()
+        with self._lock:
+            self._stats['submitted'] += 1
+        logger.info("jobs.submitted", extra={"job_id": job_id, "kind": kind})
+        self._dispatch(job_id)
+        return job_id
+
+    def schedule(self, kind: str, interval: float, payload: Optional[dict] = None) -> None:
+        """Submit a ``kind`` job every ``interval`` seconds, the first one after one interval.
+
+        A run is skipped while a job of the same kind is still queued or
+        running, so a slow job never piles up behind itself. Call after
+        :meth:`init_app`; stops with :meth:`shutdown`.
+        """
+        def tick():
+            with self._lock:
+                stopped = self._executor is None
+            if stopped:
+                return
+            try:
+                with self.app.app_context():
+                    if not self.pending(kind):
+                        self.submit(kind, payload or {})
+            except Exception as e:
+                logger.error("jobs.schedule_failed", extra={"kind": kind, "error": str(e)})
+            arm()
+
+        def arm():
+            timer = threading.Timer(interval, tick)
+            timer.daemon = True
+            timer.start()
+
+        arm()
+        logger.info("jobs.scheduled", extra={"kind": kind, "interval": interval})
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with db.engine.connect() as connection:
+            row = connection.execute(select(Job).where(Job.id == job_id)).first()
+        return to_dict(row) if row is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def pending(self, kind: Optional[str] = None) -> int:
+        query = select(func.count()).select_from(Job).where(Job.status.in_((QUEUED, RUNNING)))
+        if kind is not None:
+            query = query.where(Job.kind == kind)
+        with db.engine.connect() as connection:
+            return connection.execute(query).scalar()
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            heartbeat, self._heartbeat = self._heartbeat, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+        # Stopped after the workers, so jobs finishing during shutdown keep their lease
+        if heartbeat is not None:
+            heartbeat.set()
+
+    # Internals
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job-worker')
+            if self._heartbeat is None and self.app is not None:
+                self._heartbeat = threading.Event()
+                threading.Thread(target=self._renew_leases, args=(self._heartbeat,),
+                                 name='job-heartbeat', daemon=True).start()
+
+    def _resume(self, queued: bool = False) -> list:
+        """Re-queue and dispatch running jobs whose lease expired; ``queued`` also dispatches queued jobs.
+
+        Returns the ids dispatched.
+        """
+        now = _utcnow()
+        with db.engine.begin() as connection:
+            # Jobs from before leases existed have none and count as expired
+            reclaimed = connection.execute(
+                update(Job).where(Job.status == RUNNING,
+                                  (Job.lease_until.is_(None)) | (Job.lease_until < now))
+                .values(status=QUEUED, worker_id=None, lease_until=None, updated_at=now)
+                .returning(Job.id)).scalars().all()
+            job_ids = reclaimed
+            if queued:
+                job_ids = connection.execute(
+                    select(Job.id).where(Job.status == QUEUED).order_by(Job.id)).scalars().all()
+        if reclaimed:
+            with self._lock:
+                self._stats['reclaimed'] += len(reclaimed)
+            logger.warning("jobs.reclaimed", extra={"job_ids": reclaimed})
+        for job_id in job_ids:
+            self._dispatch(job_id)
+        return job_ids
+
+    def _renew_leases(self, stopped: threading.Event) -> None:
+        """Extend the leases of this process's running jobs; take over expired ones."""
+        while not stopped.wait(self.lease / 3):
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(update(Job).where(Job.status == RUNNING, Job.worker_id == self.worker_id)
+                                           .values(lease_until=_utcnow() + timedelta(seconds=self.lease)))
+                    self._resume()
+            except Exception as e:
+                logger.error("jobs.heartbeat_failed", extra={"error": str(e)})
+
+    def _dispatch(self, job_id: int) -> None:
+        with self._lock:
+            executor = self._executor
+        if executor is None:
+            # Shut down; the job stays queued and is resumed on the next start
+            return
+        try:
+            executor.submit(self._run, job_id)
+        except RuntimeError:
+            pass
+
+    def _retry_later(self, job_id: int, attempts: int) -> None:
+        timer = threading.Timer(self.retry_delay * 2 ** (attempts - 1), self._dispatch, (job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, job_id: int, **values) -> None:
+        # Only while this process still owns the job (its lease was not taken over)
+        with db.engine.begin() as connection:
+            connection.execute(update(Job).where(Job.id == job_id, Job.worker_id == self.worker_id)
+                               .values(updated_at=_utcnow(), worker_id=None, lease_until=None, **values))
+
+    def _run(self, job_id: int) -> None:
+        with self.app.app_context():
+            # Claim the job; another worker (or a finished earlier run) wins otherwise
+            with db.engine.begin() as connection:
+                job = connection.execute(
+                    update(Job).where(Job.id == job_id, Job.status == QUEUED)
+                    .values(status=RUNNING, attempts=Job.attempts + 1, updated_at=_utcnow(),
+                            worker_id=self.worker_id, lease_until=_utcnow() + timedelta(seconds=self.lease))
+                    .returning(Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+                ).first()
+            if job is None:
+                return
+            handler = self._handlers.get(job.kind)
+            if handler is None:
+                self._finish(job_id, status=FAILED, error=f'No handler for job kind {job.kind}',
+                             finished_at=_utcnow())
+                return
+
+            with self._lock:
+                self._stats['in_flight'] += 1
+            start = time.perf_counter()
+            try:
+                result = handler(json.loads(job.payload))
+            except Exception as e:
+                db.session.rollback()
+                retry = job.attempts < job.max_attempts
+                self._finish(job_id, status=QUEUED if retry else FAILED, error=str(e),
+                             finished_at=None if retry else _utcnow())
+                with self._lock:
+                    self._stats['retried' if retry else 'failed'] += 1
+                logger.warning("jobs.attempt_failed", extra={
+                    "job_id": job_id, "kind": job.kind, "attempt": job.attempts, "retry": retry, "error": str(e)})
+                if retry:
+                    self._retry_later(job_id, job.attempts)
+            else:
+                self._finish(job_id, status=SUCCEEDED, error=None, finished_at=_utcnow(),
+                             result=json.dumps(result, ensure_ascii=False, default=str))
+                with self._lock:
+                    self._stats['succeeded'] += 1
+                logger.info("jobs.succeeded", extra={
+                    "job_id": job_id, "kind": job.kind, "duration_s": round(time.perf_counter() - start, 4)})
+            finally:
+                with self._lock:
+                    self._stats['in_flight'] -= 1
+
+
+queue = JobQueue(
+    workers=int(os.environ.get('JOBS_WORKERS', 2)),
+    max_attempts=int(os.environ.get('JOBS_MAX_ATTEMPTS', 3)),
+    retry_delay=float(os.environ.get('JOBS_RETRY_DELAY', 1.0)),
+    lease=float(os.environ.get('JOBS_LEASE_SECONDS', 60)),
+)
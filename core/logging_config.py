@@ -0,0 +1,63 @@
+"""Structured logging for the application.
+
+Modules log through ``logging.getLogger(__name__)`` and pass their data as
+``extra`` fields instead of formatting it into the message, e.g.::
+
+    logger.info("llm.completion", extra={"model": model, "duration_s": 1.2})
+
+The root handler renders those fields either as ``key=value`` pairs (default,
+readable in a terminal) or as one JSON object per line for log collectors.
+
+Configuration (environment variables):
+    LOG_LEVEL    DEBUG / INFO / WARNING / ERROR (default INFO)
+    LOG_FORMAT   "text" or "json" (default text)
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def _extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S')
+        parts = [timestamp, record.levelname, record.name, record.getMessage()]
+        parts.extend(f'{key}={json.dumps(value, ensure_ascii=False, default=str)}'
+                     for key, value in _extra_fields(record).items())
+        line = ' '.join(parts)
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def configure() -> None:
+    """Install the structured handler on the root logger (once)."""
+    root = logging.getLogger()
+    if any(getattr(handler, '_structured', False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._structured = True
+    handler.setFormatter(JsonFormatter() if os.environ.get('LOG_FORMAT', 'text') == 'json' else KeyValueFormatter())
+    root.addHandler(handler)
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
@@ -0,0 +1,290 @@
+"""In-process metrics exposed in the Prometheus text format at ``/metrics``.
+
+A small registry of counters, gauges and histograms (no client library
+needed), plus the hooks that feed it:
+
+* Flask ``before_request``/``teardown_request``: latency per route, method
+  and status. Teardown runs after a streamed body is fully sent, so SSE
+  requests count their whole duration.
+* SQLAlchemy ``before/after_cursor_execute``: duration of every statement by
+  operation, and the number of statements and SQL time of each request.
+* :func:`observe_llm_call` for backend/inference.py: latency, time to first
+  token, tokens and outcome per model.
+
+Metrics are per process; with several workers, scrape each of them.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Sample lines in the text format, without the header."""
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}'
+
+
+class Gauge(_Metric):
+    """A gauge read from a callback at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self):
+        try:
+            value = self.function()
+        except Exception:
+            return
+        yield f'{self.name} {_format_number(value)}'
+
+
+class CallbackCounter(Gauge):
+    """A counter read from a callback at scrape time (a component's own running total)."""
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_number(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, function) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def callback_counter(self, name, documentation, function) -> CallbackCounter:
+        return self.register(CallbackCounter(name, documentation, function))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+http_request_duration = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route', 'status'))
+db_query_duration = REGISTRY.histogram(
+    'db_query_duration_seconds', 'Duration of single SQL statements.', ('operation',), SQL_BUCKETS)
+db_queries_per_request = REGISTRY.histogram(
+    'db_queries_per_request', 'SQL statements executed per HTTP request.', ('route',), COUNT_BUCKETS)
+db_time_per_request = REGISTRY.histogram(
+    'db_time_per_request_seconds', 'Total SQL time per HTTP request.', ('route',), SQL_BUCKETS)
+llm_request_duration = REGISTRY.histogram(
+    'llm_request_duration_seconds', 'LLM completion latency.', ('model', 'mode', 'outcome'), LLM_BUCKETS)
+llm_time_to_first_token = REGISTRY.histogram(
+    'llm_time_to_first_token_seconds', 'Time to the first streamed token.', ('model',), LLM_BUCKETS)
+llm_requests = REGISTRY.counter(
+    'llm_requests_total', 'LLM calls by outcome (ok, error, rejected, cached).', ('model', 'mode', 'outcome'))
+llm_tokens = REGISTRY.counter(
+    'llm_tokens_total', 'Tokens reported by the LLM API.', ('model', 'type'))
+llm_router_decisions = REGISTRY.counter(
+    'llm_router_decisions_total', 'Models picked by the auto router, by reason.', ('model', 'reason'))
+llm_tool_calls = REGISTRY.counter(
+    'llm_tool_calls_total', 'Chat tool calls executed, by tool and status (ok, error).', ('tool', 'status'))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def observe_llm_call(model: str, mode: str, outcome: str, duration: Optional[float] = None,
+                     first_token: Optional[float] = None, usage=None) -> None:
+    """Record one LLM call. ``usage`` is the API's usage object, if any."""
+    llm_requests.inc(model=model, mode=mode, outcome=outcome)
+    if duration is not None:
+        llm_request_duration.observe(duration, model=model, mode=mode, outcome=outcome)
+    if first_token is not None:
+        llm_time_to_first_token.observe(first_token, model=model)
+    if usage is not None:
+        llm_tokens.inc(getattr(usage, 'prompt_tokens', 0) or 0, model=model, type='prompt')
+        llm_tokens.inc(getattr(usage, 'completion_tokens', 0) or 0, model=model, type='completion')
+
+
+# Flask and SQLAlchemy hooks
+
+def _route() -> str:
+    # The URL rule, not the path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def _after_request(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _teardown_request(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    route = _route()
+    status = 500 if exc is not None else g.pop('metrics_status', 500)
+    http_request_duration.observe(time.perf_counter() - start, method=request.method,
+                                  route=route, status=str(status))
+    db_queries_per_request.observe(g.pop('db_queries', 0), route=route)
+    db_time_per_request.observe(g.pop('db_time', 0.0), route=route)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    db_query_duration.observe(elapsed, operation=operation)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+
+
+def _handle_error(context):
+    # after_cursor_execute is not called for failed statements
+    if context.connection is not None:
+        starts = context.connection.info.get('metrics_query_start')
+        if starts:
+            starts.pop()
+
+
+def init_app(app, engine) -> None:
+    """Install the request hooks on the app and the query hooks on the engine."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
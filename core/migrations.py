@@ -0,0 +1,335 @@
+"""Versioned schema migrations for the SQLite database.
+
+The schema version is kept in ``PRAGMA user_version``. Each migration is a
+list of SQL statements applied in one transaction, after which the version is
+bumped. Statements must be idempotent (``IF NOT EXISTS``) because a fresh
+database created by ``db.create_all()`` already has everything the models
+declare. A step that depends on the current table layout (rebuilding a
+table) is a callable taking the connection, and checks the layout itself.
+"""
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(connection, table: str) -> List[str]:
+    return [row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table})")]
+
+
+def _archive_surrogate_keys(connection) -> None:
+    """Rebuild the v4 archive tables, keyed by the live row id, with their own key.
+
+    Live ids are reused (a new row can take the id of an archived one), so
+    the archive keeps the live id in ``original_id`` and subtasks archived
+    with their task point at the task's archive row (``archived_task_id``).
+    """
+    if 'original_id' in _columns(connection, 'notes_archive'):
+        return  # created by create_all() from the current models
+    connection.exec_driver_sql(
+        "CREATE TABLE notes_archive_v5 ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "original_id INTEGER NOT NULL, "
+        "content TEXT NOT NULL, "
+        "category VARCHAR(50), "
+        "created_at DATETIME, "
+        "updated_at DATETIME, "
+        "deleted_at DATETIME, "
+        "project_id INTEGER NOT NULL, "
+        "archived_at DATETIME NOT NULL)")
+    connection.exec_driver_sql(
+        "CREATE TABLE tasks_archive_v5 ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "original_id INTEGER NOT NULL, "
+        "content TEXT NOT NULL, "
+        "category VARCHAR(50), "
+        "priority VARCHAR(20), "
+        "deadline DATETIME, "
+        "is_completed BOOLEAN, "
+        "created_at DATETIME, "
+        "updated_at DATETIME, "
+        "deleted_at DATETIME, "
+        "project_id INTEGER NOT NULL, "
+        "archived_at DATETIME NOT NULL)")
+    connection.exec_driver_sql(
+        "CREATE TABLE subtasks_archive_v5 ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "original_id INTEGER NOT NULL, "
+        "content VARCHAR(200) NOT NULL, "
+        "is_completed BOOLEAN, "
+        "created_at DATETIME, "
+        "deleted_at DATETIME, "
+        "task_id INTEGER NOT NULL, "
+        "archived_task_id INTEGER, "
+        "archived_at DATETIME NOT NULL)")
+    connection.exec_driver_sql(
+        "INSERT INTO notes_archive_v5 (original_id, content, category, created_at, updated_at, "
+        "deleted_at, project_id, archived_at) SELECT id, content, category, created_at, updated_at, "
+        "deleted_at, project_id, archived_at FROM notes_archive ORDER BY id")
+    connection.exec_driver_sql(
+        "INSERT INTO tasks_archive_v5 (original_id, content, category, priority, deadline, is_completed, "
+        "created_at, updated_at, deleted_at, project_id, archived_at) SELECT id, content, category, priority, "
+        "deadline, is_completed, created_at, updated_at, deleted_at, project_id, archived_at "
+        "FROM tasks_archive ORDER BY id")
+    # v4 ids were unique per live id, so a subtask's task_id names at most one archived task
+    connection.exec_driver_sql(
+        "INSERT INTO subtasks_archive_v5 (original_id, content, is_completed, created_at, deleted_at, "
+        "task_id, archived_task_id, archived_at) SELECT s.id, s.content, s.is_completed, s.created_at, "
+        "s.deleted_at, s.task_id, t.id, s.archived_at FROM subtasks_archive AS s "
+        "LEFT JOIN tasks_archive_v5 AS t ON t.original_id = s.task_id ORDER BY s.id")
+    for table in ('notes_archive', 'tasks_archive', 'subtasks_archive'):
+        connection.exec_driver_sql(f"DROP TABLE {table}")
+        connection.exec_driver_sql(f"ALTER TABLE {table}_v5 RENAME TO {table}")
+
+
+def _job_leases(connection) -> None:
+    """Owner and lease columns of running jobs (core/jobs.py)."""
+    columns = _columns(connection, 'jobs')
+    if 'worker_id' not in columns:
+        connection.exec_driver_sql("ALTER TABLE jobs ADD COLUMN worker_id VARCHAR(100)")
+    if 'lease_until' not in columns:
+        connection.exec_driver_sql("ALTER TABLE jobs ADD COLUMN lease_until DATETIME")
+
+
+# (version, description, statements)
+MIGRATIONS: List[Tuple[int, str, List[Union[str, Callable]]]] = [
+    (1, 'Indexes for the hot list query shapes', [
+        "CREATE INDEX IF NOT EXISTS ix_notes_project_deleted_updated "
+        "ON notes (project_id, deleted_at, updated_at)",
+        "CREATE INDEX IF NOT EXISTS ix_notes_live_updated "
+        "ON notes (updated_at, id) WHERE deleted_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_project_deleted_updated "
+        "ON tasks (project_id, deleted_at, updated_at)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_live_updated "
+        "ON tasks (updated_at, id) WHERE deleted_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_open_deadline "
+        "ON tasks (deadline) WHERE is_completed = 0",
+        "CREATE INDEX IF NOT EXISTS ix_subtasks_task_id ON subtasks (task_id)",
+    ]),
+    # Full-text index over live notes, tasks and subtasks (see core/search.py).
+    # rowid = id * 4 + kind code, so triggers can address a row without a lookup.
+    # project_id is denormalized so project filters need no join; subtasks
+    # follow their task when it is moved or soft deleted.
+    (2, 'FTS5 search index kept in sync by triggers', [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "content, kind UNINDEXED, item_id UNINDEXED, project_id UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')",
+
+        "CREATE TRIGGER IF NOT EXISTS search_notes_ai AFTER INSERT ON notes "
+        "WHEN new.deleted_at IS NULL BEGIN "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "VALUES (new.id * 4, new.content, 'note', new.id, new.project_id); END",
+        "CREATE TRIGGER IF NOT EXISTS search_notes_au "
+        "AFTER UPDATE OF content, deleted_at, project_id ON notes BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4; "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT new.id * 4, new.content, 'note', new.id, new.project_id WHERE new.deleted_at IS NULL; END",
+        "CREATE TRIGGER IF NOT EXISTS search_notes_ad AFTER DELETE ON notes BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4; END",
+
+        "CREATE TRIGGER IF NOT EXISTS search_tasks_ai AFTER INSERT ON tasks "
+        "WHEN new.deleted_at IS NULL BEGIN "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "VALUES (new.id * 4 + 1, new.content, 'task', new.id, new.project_id); END",
+        "CREATE TRIGGER IF NOT EXISTS search_tasks_au "
+        "AFTER UPDATE OF content, deleted_at, project_id ON tasks BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; "
+        "DELETE FROM search_index WHERE rowid IN (SELECT id * 4 + 2 FROM subtasks WHERE task_id = old.id); "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT new.id * 4 + 1, new.content, 'task', new.id, new.project_id WHERE new.deleted_at IS NULL; "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT id * 4 + 2, content, 'subtask', id, new.project_id FROM subtasks "
+        "WHERE task_id = new.id AND deleted_at IS NULL AND new.deleted_at IS NULL; END",
+        "CREATE TRIGGER IF NOT EXISTS search_tasks_ad AFTER DELETE ON tasks BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END",
+
+        "CREATE TRIGGER IF NOT EXISTS search_subtasks_ai AFTER INSERT ON subtasks "
+        "WHEN new.deleted_at IS NULL BEGIN "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT new.id * 4 + 2, new.content, 'subtask', new.id, project_id FROM tasks "
+        "WHERE id = new.task_id AND deleted_at IS NULL; END",
+        "CREATE TRIGGER IF NOT EXISTS search_subtasks_au AFTER UPDATE OF content, deleted_at ON subtasks BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; "
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT new.id * 4 + 2, new.content, 'subtask', new.id, project_id FROM tasks "
+        "WHERE id = new.task_id AND deleted_at IS NULL AND new.deleted_at IS NULL; END",
+        "CREATE TRIGGER IF NOT EXISTS search_subtasks_ad AFTER DELETE ON subtasks BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; END",
+
+        # Index the rows that already exist
+        "DELETE FROM search_index",
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT id * 4, content, 'note', id, project_id FROM notes WHERE deleted_at IS NULL",
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT id * 4 + 1, content, 'task', id, project_id FROM tasks WHERE deleted_at IS NULL",
+        "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+        "SELECT s.id * 4 + 2, s.content, 'subtask', s.id, t.project_id FROM subtasks AS s "
+        "JOIN tasks AS t ON t.id = s.task_id WHERE s.deleted_at IS NULL AND t.deleted_at IS NULL",
+    ]),
+    # Persistent records of the background job queue (see core/jobs.py)
+    (3, 'Background job records', [
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "kind VARCHAR(50) NOT NULL, "
+        "status VARCHAR(20) NOT NULL, "
+        "payload TEXT NOT NULL, "
+        "result TEXT, "
+        "error TEXT, "
+        "attempts INTEGER NOT NULL, "
+        "max_attempts INTEGER NOT NULL, "
+        "created_at DATETIME, "
+        "updated_at DATETIME, "
+        "finished_at DATETIME)",
+        "CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status)",
+    ]),
+    # Archive of rows deleted longer than the retention period (see core/archive.py).
+    # The partial indexes only hold soft-deleted rows, so finding what to
+    # archive does not scan the live rows.
+    (4, 'Archive tables and indexes of soft-deleted rows', [
+        "CREATE TABLE IF NOT EXISTS notes_archive ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "content TEXT NOT NULL, "
+        "category VARCHAR(50), "
+        "created_at DATETIME, "
+        "updated_at DATETIME, "
+        "deleted_at DATETIME, "
+        "project_id INTEGER NOT NULL, "
+        "archived_at DATETIME NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS tasks_archive ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "content TEXT NOT NULL, "
+        "category VARCHAR(50), "
+        "priority VARCHAR(20), "
+        "deadline DATETIME, "
+        "is_completed BOOLEAN, "
+        "created_at DATETIME, "
+        "updated_at DATETIME, "
+        "deleted_at DATETIME, "
+        "project_id INTEGER NOT NULL, "
+        "archived_at DATETIME NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS subtasks_archive ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "content VARCHAR(200) NOT NULL, "
+        "is_completed BOOLEAN, "
+        "created_at DATETIME, "
+        "deleted_at DATETIME, "
+        "task_id INTEGER NOT NULL, "
+        "archived_at DATETIME NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS ix_subtasks_archive_task_id ON subtasks_archive (task_id)",
+        "CREATE INDEX IF NOT EXISTS ix_notes_deleted_at ON notes (deleted_at) WHERE deleted_at IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_deleted_at ON tasks (deleted_at) WHERE deleted_at IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS ix_subtasks_deleted_at ON subtasks (deleted_at) WHERE deleted_at IS NOT NULL",
+    ]),
+    # Archive rows get their own key; the live id can be reused after archiving
+    (5, 'Surrogate keys for the archive tables', [
+        _archive_surrogate_keys,
+        "CREATE INDEX IF NOT EXISTS ix_notes_archive_original_id ON notes_archive (original_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_archive_original_id ON tasks_archive (original_id)",
+        "CREATE INDEX IF NOT EXISTS ix_subtasks_archive_original_id ON subtasks_archive (original_id)",
+        "CREATE INDEX IF NOT EXISTS ix_subtasks_archive_task_id ON subtasks_archive (task_id)",
+        "CREATE INDEX IF NOT EXISTS ix_subtasks_archive_archived_task_id ON subtasks_archive (archived_task_id)",
+    ]),
+    # Running jobs are owned by one process and leased, so several processes can share the queue
+    (6, 'Job owner and lease', [_job_leases]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def ensure_schema(db) -> List[int]:
+    """Bring the database to the latest schema; a no-op when it is already there.
+
+    A database at ``LATEST_VERSION`` costs one PRAGMA read at startup instead
+    of ``create_all()`` reflecting every table. Older or new databases get
+    ``create_all()`` (tables the models declare) and then :func:`upgrade`.
+    """
+    with db.engine.connect() as connection:
+        if get_version(connection) >= LATEST_VERSION:
+            return []
+    db.create_all()
+    return upgrade(db.engine)
+
+
+def upgrade(engine) -> List[int]:
+    """Apply all pending migrations in place. Returns the applied versions."""
+    applied = []
+    with engine.begin() as connection:
+        current = get_version(connection)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("db.migration", extra={"version": version, "description": description})
+        with engine.begin() as connection:
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.exec_driver_sql(statement)
+            # PRAGMA does not accept bound parameters
+            connection.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+        applied.append(version)
+    return applied
+
+
+def _bind_value(value):
+    # Match how SQLAlchemy stores DateTime columns in SQLite
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    return value
+
+
+def explain(connection, query) -> List[str]:
+    """Return the EXPLAIN QUERY PLAN lines for an ORM query or select()."""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=connection.dialect,
+                                 compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    positional = tuple(_bind_value(params[name]) for name in compiled.positiontup)
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional)
+    return [row[-1] for row in rows]
+
+
+def hot_query_checks():
+    """The queries the list endpoints issue, with their default options, and the index each must use.
+
+    Built with the same core/queries.py functions and request parsing as the
+    routes; needs an application context.
+    """
+    from models import Note, Task
+    from core import archive, queries
+
+    def params(fields, **args):
+        # As GET /api/notes and /api/tasks parse their query string
+        return queries.ListParams.from_args(args, fields)
+
+    return [
+        ('GET /api/notes', queries.notes_query(params(queries.NOTE_FIELDS)),
+         'ix_notes_live_updated'),
+        ('GET /api/notes?project_tag=', queries.notes_query(params(queries.NOTE_FIELDS, project_tag='#inbox')),
+         'ix_notes_project_deleted_updated'),
+        ('GET /api/tasks', queries.tasks_query(params(queries.TASK_FIELDS)),
+         'ix_tasks_live_updated'),
+        ('GET /api/tasks?project_tag=', queries.tasks_query(params(queries.TASK_FIELDS, project_tag='#inbox')),
+         'ix_tasks_project_deleted_updated'),
+        ('GET /api/tasks subtasks', queries.subtasks_query([1, 2, 3]),
+         'ix_subtasks_task_id'),
+        ('compaction: expired notes', archive.expired_query(Note, datetime.utcnow(), 500),
+         'ix_notes_deleted_at'),
+        ('compaction: expired tasks', archive.expired_query(Task, datetime.utcnow(), 500),
+         'ix_tasks_deleted_at'),
+    ]
+
+
+def check_query_plans(connection) -> List[Tuple[str, bool, List[str]]]:
+    """Run EXPLAIN QUERY PLAN for every hot query and report whether it hits its index."""
+    results = []
+    for name, query, index_name in hot_query_checks():
+        plan = explain(connection, query)
+        uses_index = any(index_name in line for line in plan)
+        results.append((name, uses_index, plan))
+    return results
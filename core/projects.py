@@ -0,0 +1,139 @@
+"""Project tag resolution with an in-process tag -> id cache.
+
+Every write names its project by tag, so resolving the tag used to cost one
+or two SELECTs per request (plus a commit and a re-query when the project
+was new). The cache is filled at startup and from then on most writes
+resolve their project without touching the database.
+
+Ids of projects created in the current transaction are held back in
+``session.info`` and published only after the commit, so a rollback can
+never leave the cache pointing at a row that does not exist. Deleting a
+project (or soft deleting it) drops its tag right away.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import object_session
+
+from models import db, Project
+
+DEFAULT_TAG = '#inbox'
+_STAGED_KEY = 'new_project_ids'
+
+
+class ProjectCache:
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tag: str) -> Optional[int]:
+        with self._lock:
+            return self._ids.get(tag)
+
+    def put(self, tag: str, project_id: int) -> None:
+        with self._lock:
+            self._ids[tag] = project_id
+
+    def update(self, ids: Dict[str, int]) -> None:
+        with self._lock:
+            self._ids.update(ids)
+
+    def invalidate(self, tag: Optional[str] = None) -> None:
+        """Forget one tag, or everything when no tag is given."""
+        with self._lock:
+            if tag is None:
+                self._ids.clear()
+            else:
+                self._ids.pop(tag, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._ids)
+
+
+cache = ProjectCache()
+
+
+def default_name(tag: str) -> str:
+    return 'Inbox' if tag == DEFAULT_TAG else tag.replace('#', '')
+
+
+def _staged(session) -> Dict[str, int]:
+    return session.info.setdefault(_STAGED_KEY, {})
+
+
+def stage(tag: str, project_id: int) -> None:
+    """Remember a project created in the current transaction; cached on commit."""
+    _staged(db.session())[tag] = project_id
+
+
+def warm() -> int:
+    """Load every project into the cache. Returns the number of cached tags."""
+    rows = db.session.execute(select(Project.tag, Project.id)).all()
+    cache.invalidate()
+    cache.update({tag: project_id for tag, project_id in rows})
+    return len(rows)
+
+
+def resolve(tag: str) -> Optional[int]:
+    """Return the project id for a tag, or None if there is no such project."""
+    project_id = cache.get(tag)
+    if project_id is not None:
+        return project_id
+    staged = _staged(db.session())
+    if tag in staged:
+        return staged[tag]
+    project_id = db.session.execute(select(Project.id).where(Project.tag == tag)).scalar()
+    if project_id is not None:
+        cache.put(tag, project_id)
+    return project_id
+
+
+def get_or_create(tag: str, name: Optional[str] = None) -> int:
+    """Return the project id for a tag, creating the project if needed.
+
+    A single INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement, run in
+    the caller's transaction, so the project is committed together with the
+    row that needs it and concurrent requests for the same tag agree on one id.
+    """
+    project_id = resolve(tag)
+    if project_id is not None:
+        return project_id
+    statement = insert(Project).values(tag=tag, name=name or default_name(tag), created_at=datetime.utcnow())
+    statement = statement.on_conflict_do_update(
+        index_elements=[Project.tag], set_={'tag': statement.excluded.tag}
+    ).returning(Project.id)
+    project_id = db.session.execute(statement).scalar_one()
+    stage(tag, project_id)
+    return project_id
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_staged(session):
+    staged = session.info.pop(_STAGED_KEY, None)
+    if staged:
+        cache.update(staged)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_staged(session):
+    session.info.pop(_STAGED_KEY, None)
+
+
+@event.listens_for(Project, 'after_insert')
+def _project_inserted(mapper, connection, project):
+    _staged(object_session(project))[project.tag] = project.id
+
+
+@event.listens_for(Project, 'after_update')
+def _project_updated(mapper, connection, project):
+    # Rare (nothing renames or soft deletes projects yet); start over from the database
+    cache.invalidate()
+
+
+@event.listens_for(Project, 'after_delete')
+def _project_deleted(mapper, connection, project):
+    cache.invalidate(project.tag)
@@ -0,0 +1,326 @@
+"""Read layer for the notes/tasks API.
+
+All list and detail endpoints load their rows through the functions below so
+the project tag and subtasks come in with a fixed number of queries instead of
+one lazy SELECT per row. List endpoints are ordered newest first on
+``(updated_at, id)`` and support keyset pagination, filters and field selection
+via ``ListParams``.
+
+Lists skip the ORM: Core ``select()``s fetch only the requested columns as
+tuples, which are zipped straight into dicts for core/fast_json.py. DateTime
+columns are read as their stored text and reshaped into ISO format with two
+string operations, so rows are never parsed into ``datetime`` and formatted
+back. Detail endpoints still load ORM objects, one row is not worth it.
+"""
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import String, and_, false, or_, select, true, type_coerce
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import db, Project, Note, Task, Subtask
+
+NOTE_FIELDS = ('id', 'content', 'category', 'project_tag', 'created_at', 'updated_at')
+TASK_FIELDS = ('id', 'content', 'category', 'priority', 'deadline', 'is_completed',
+               'project_tag', 'created_at', 'updated_at', 'subtasks')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(updated_at, row_id: int) -> str:
+    """``updated_at`` is a datetime or its ISO string."""
+    if isinstance(updated_at, datetime):
+        updated_at = updated_at.isoformat()
+    raw = f"{updated_at}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        updated_at, row_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(updated_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'Invalid boolean value: {value}')
+
+
+def _parse_datetime(value: str, name: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name} format')
+
+
+@dataclass
+class ListParams:
+    """Pagination, filter and projection options for a list endpoint."""
+    limit: Optional[int] = None
+    cursor: Optional[Tuple[datetime, int]] = None
+    fields: Optional[Tuple[str, ...]] = None
+    project_tag: Optional[str] = None
+    category: Optional[str] = None
+    is_completed: Optional[bool] = None
+    priority: Optional[str] = None
+    deadline_from: Optional[datetime] = None
+    deadline_to: Optional[datetime] = None
+
+    @classmethod
+    def from_args(cls, args, allowed_fields: Tuple[str, ...]) -> 'ListParams':
+        """Build params from request query args. Raises ValueError on bad input."""
+        params = cls()
+        if 'limit' in args or 'cursor' in args:
+            try:
+                limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+            except ValueError:
+                raise ValueError('Invalid limit')
+            params.limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if args.get('cursor'):
+            params.cursor = decode_cursor(args['cursor'])
+        if args.get('fields'):
+            fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+            unknown = [f for f in fields if f not in allowed_fields]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            # The client always needs the id to edit or delete a row
+            if 'id' not in fields:
+                fields.insert(0, 'id')
+            params.fields = tuple(fields)
+        params.project_tag = args.get('project_tag') or None
+        params.category = args.get('category') or None
+        params.priority = args.get('priority') or None
+        if args.get('is_completed'):
+            params.is_completed = _parse_bool(args['is_completed'])
+        if args.get('deadline_from'):
+            params.deadline_from = _parse_datetime(args['deadline_from'], 'deadline_from')
+        if args.get('deadline_to'):
+            params.deadline_to = _parse_datetime(args['deadline_to'], 'deadline_to')
+        return params
+
+    def wants(self, field: str) -> bool:
+        return self.fields is None or field in self.fields
+
+
+def _apply_page(query, model, params: ListParams):
+    """Filter by project/category, order by (updated_at, id) and apply the keyset."""
+    query = query.filter(model.deleted_at.is_(None))
+    if params.project_tag:
+        project_id = select(Project.id).where(Project.tag == params.project_tag).scalar_subquery()
+        query = query.filter(model.project_id == project_id)
+    if params.category:
+        query = query.filter(model.category == params.category)
+    if params.cursor:
+        updated_at, row_id = params.cursor
+        query = query.filter(or_(
+            model.updated_at < updated_at,
+            and_(model.updated_at == updated_at, model.id < row_id)
+        ))
+    query = query.order_by(model.updated_at.desc(), model.id.desc())
+    if params.limit:
+        # Fetch one extra row to find out whether another page exists
+        query = query.limit(params.limit + 1)
+    return query
+
+
+def _note_options():
+    # Many-to-one: a single INNER JOIN is the cheapest way to get the tag
+    return (joinedload(Note.project, innerjoin=True),)
+
+
+def _task_options(with_subtasks: bool = True):
+    # Subtasks are one-to-many, so load them with one extra IN (...) query
+    # rather than a JOIN that would multiply the task rows.
+    options = [joinedload(Task.project, innerjoin=True)]
+    if with_subtasks:
+        options.append(selectinload(Task.subtasks.and_(Subtask.deleted_at.is_(None))))
+    return tuple(options)
+
+
+def _project_tag(model):
+    # A correlated lookup rather than a JOIN: the planner cannot then pick projects
+    # as the outer loop and sort every row, and it only runs for the rows returned
+    return select(Project.tag).where(Project.id == model.project_id).scalar_subquery()
+
+
+def _stored_text(column):
+    # The DateTime column as SQLite stores it ('2024-05-01 12:00:00.000000'), unparsed
+    return type_coerce(column, String)
+
+
+def iso_text(value: Optional[str]) -> Optional[str]:
+    """Stored DateTime text as ``datetime.isoformat()`` would render it."""
+    if value is None:
+        return None
+    if value.endswith('.000000'):
+        value = value[:-7]
+    return value.replace(' ', 'T', 1)
+
+
+NOTE_COLUMNS = {
+    'id': Note.id,
+    'content': Note.content,
+    'category': Note.category,
+    'project_tag': _project_tag(Note),
+    'created_at': _stored_text(Note.created_at),
+    'updated_at': _stored_text(Note.updated_at),
+}
+TASK_COLUMNS = {
+    'id': Task.id,
+    'content': Task.content,
+    'category': Task.category,
+    'priority': Task.priority,
+    'deadline': _stored_text(Task.deadline),
+    'is_completed': Task.is_completed,
+    'project_tag': _project_tag(Task),
+    'created_at': _stored_text(Task.created_at),
+    'updated_at': _stored_text(Task.updated_at),
+}
+DATETIME_FIELDS = frozenset(('created_at', 'updated_at', 'deadline'))
+
+
+def _row_fields(columns: dict, params: ListParams) -> Tuple[str, ...]:
+    return tuple(f for f in (params.fields or tuple(columns)) if f in columns)
+
+
+def _list_select(model, columns: dict, params: ListParams):
+    fields = _row_fields(columns, params)
+    # The keyset of the row goes last, for the next page's cursor
+    query = select(*(columns[f] for f in fields),
+                   model.id.label('cursor_id'), _stored_text(model.updated_at).label('cursor_updated_at'))
+    return query.select_from(model)
+
+
+def notes_query(params: ListParams):
+    return _apply_page(_list_select(Note, NOTE_COLUMNS, params), Note, params)
+
+
+def tasks_query(params: ListParams):
+    query = _list_select(Task, TASK_COLUMNS, params)
+    if params.is_completed is not None:
+        # Literal 0/1 so the partial index on open tasks can match
+        query = query.filter(Task.is_completed == (true() if params.is_completed else false()))
+    if params.priority:
+        query = query.filter(Task.priority == params.priority)
+    if params.deadline_from:
+        query = query.filter(Task.deadline >= params.deadline_from)
+    if params.deadline_to:
+        query = query.filter(Task.deadline <= params.deadline_to)
+    return _apply_page(query, Task, params)
+
+
+def _fetch_page(query, fields: Tuple[str, ...], params: ListParams):
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if params.limit and len(rows) > params.limit:
+        rows = rows[:params.limit]
+        next_cursor = encode_cursor(iso_text(rows[-1][-1]), rows[-1][-2])
+    datetimes = [(index, field) for index, field in enumerate(fields) if field in DATETIME_FIELDS]
+    items = []
+    for row in rows:
+        # zip stops at the last field, the cursor columns are left out
+        item = dict(zip(fields, row))
+        for index, field in datetimes:
+            item[field] = iso_text(row[index])
+        items.append(item)
+    return items, next_cursor
+
+
+def subtasks_query(task_ids):
+    """Live subtasks of a page of tasks, in one query."""
+    return (select(Subtask.task_id, Subtask.id, Subtask.content, Subtask.is_completed)
+            .where(Subtask.task_id.in_(task_ids), Subtask.deleted_at.is_(None))
+            .order_by(Subtask.id))
+
+
+def _attach_subtasks(items: list) -> None:
+    by_task = {item['id']: [] for item in items}
+    if by_task:
+        rows = db.session.execute(subtasks_query(list(by_task)))
+        for task_id, subtask_id, content, is_completed in rows:
+            by_task[task_id].append({'id': subtask_id, 'content': content, 'is_completed': is_completed})
+    for item in items:
+        item['subtasks'] = by_task[item['id']]
+
+
+def list_notes(params: ListParams = None):
+    """Return a page of non-deleted notes (as dicts) and the cursor of the next page."""
+    params = params or ListParams()
+    return _fetch_page(notes_query(params), _row_fields(NOTE_COLUMNS, params), params)
+
+
+def list_tasks(params: ListParams = None):
+    """Return a page of non-deleted tasks (as dicts) and the cursor of the next page."""
+    params = params or ListParams()
+    items, next_cursor = _fetch_page(tasks_query(params), _row_fields(TASK_COLUMNS, params), params)
+    if params.wants('subtasks'):
+        _attach_subtasks(items)
+    return items, next_cursor
+
+
+def list_projects():
+    """All projects as dicts."""
+    rows = db.session.execute(select(Project.id, Project.tag, Project.name))
+    return [{'id': project_id, 'tag': tag, 'name': name} for project_id, tag, name in rows]
+
+
+def get_note_or_404(note_id: int) -> Note:
+    """Load a single note with its project in one query."""
+    return Note.query.options(*_note_options()).get_or_404(note_id)
+
+
+def get_task_or_404(task_id: int) -> Task:
+    """Load a single task with project and live subtasks."""
+    return Task.query.options(*_task_options()).get_or_404(task_id)
+
+
+def subtask_to_dict(subtask: Subtask) -> dict:
+    return {
+        'id': subtask.id,
+        'content': subtask.content,
+        'is_completed': subtask.is_completed
+    }
+
+
+def _select_fields(data: dict, fields: Optional[Tuple[str, ...]]) -> dict:
+    if fields is None:
+        return data
+    return {f: data[f] for f in fields}
+
+
+def note_to_dict(note: Note, fields: Optional[Tuple[str, ...]] = None) -> dict:
+    return _select_fields({
+        'id': note.id,
+        'content': note.content,
+        'category': note.category,
+        'project_tag': note.project.tag,
+        'created_at': note.created_at.isoformat(),
+        'updated_at': note.updated_at.isoformat()
+    }, fields)
+
+
+def task_to_dict(task: Task, fields: Optional[Tuple[str, ...]] = None) -> dict:
+    data = {
+        'id': task.id,
+        'content': task.content,
+        'category': task.category,
+        'priority': task.priority,
+        'deadline': task.deadline.isoformat() if task.deadline else None,
+        'is_completed': task.is_completed,
+        'project_tag': task.project.tag,
+        'created_at': task.created_at.isoformat(),
+        'updated_at': task.updated_at.isoformat()
+    }
+    # Only touch the relationship when requested, it may not be loaded
+    if fields is None or 'subtasks' in fields:
+        data['subtasks'] = [subtask_to_dict(s) for s in task.subtasks]
+    return _select_fields(data, fields)
@@ -0,0 +1,106 @@
+"""Full-text search over notes, tasks and subtasks (SQLite FTS5).
+
+The ``search_index`` table and the triggers that keep it in sync with
+``deleted_at`` and project moves are created by migration 2 in
+core/migrations.py. Subtask hits are reported together with their parent task.
+"""
+import html
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from models import db
+
+MAX_RESULTS = 100
+KINDS = ('note', 'task', 'subtask')
+
+# Private-use markers around matched terms; replaced after HTML escaping
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+_term = re.compile(r'\w+', re.UNICODE)
+
+# Rank and page inside FTS5 first, then join only the page rows
+_SEARCH_SQL = """
+SELECT page.kind, page.item_id, page.snippet, page.rank, st.task_id, p.tag AS project_tag
+FROM (
+    SELECT s.kind, s.item_id, s.project_id,
+           snippet(search_index, 0, :hl_start, :hl_end, '…', 12) AS snippet,
+           bm25(search_index) AS rank
+    FROM search_index AS s
+    WHERE search_index MATCH :query {filters}
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+) AS page
+JOIN projects AS p ON p.id = page.project_id
+LEFT JOIN subtasks AS st ON page.kind = 'subtask' AND st.id = page.item_id
+ORDER BY page.rank
+"""
+
+_REBUILD_SQL = [
+    "DELETE FROM search_index",
+    "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+    "SELECT id * 4, content, 'note', id, project_id FROM notes WHERE deleted_at IS NULL",
+    "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+    "SELECT id * 4 + 1, content, 'task', id, project_id FROM tasks WHERE deleted_at IS NULL",
+    "INSERT INTO search_index (rowid, content, kind, item_id, project_id) "
+    "SELECT s.id * 4 + 2, s.content, 'subtask', s.id, t.project_id FROM subtasks AS s "
+    "JOIN tasks AS t ON t.id = s.task_id WHERE s.deleted_at IS NULL AND t.deleted_at IS NULL",
+    "INSERT INTO search_index (search_index) VALUES ('optimize')",
+]
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    terms = _term.findall(query or '')
+    if not terms:
+        raise ValueError('Search query must contain at least one word')
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms[:16])
+
+
+def _render_snippet(snippet: str) -> str:
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>')
+
+
+def search(query: str, project_tag: Optional[str] = None, kinds: Optional[List[str]] = None,
+           limit: int = 20, offset: int = 0) -> List[dict]:
+    """Ranked search (bm25, best first) with HTML-safe snippets."""
+    params = {
+        'query': build_match_query(query),
+        'hl_start': _HIGHLIGHT_START,
+        'hl_end': _HIGHLIGHT_END,
+        'limit': max(1, min(limit, MAX_RESULTS)),
+        'offset': max(0, offset),
+    }
+    filters = []
+    if project_tag:
+        filters.append("AND s.project_id = (SELECT id FROM projects WHERE tag = :project_tag)")
+        params['project_tag'] = project_tag
+    if kinds:
+        unknown = [kind for kind in kinds if kind not in KINDS]
+        if unknown:
+            raise ValueError(f"Unknown kinds: {', '.join(unknown)}")
+        names = []
+        for i, kind in enumerate(kinds):
+            params[f'kind_{i}'] = kind
+            names.append(f':kind_{i}')
+        filters.append(f"AND s.kind IN ({', '.join(names)})")
+
+    rows = db.session.execute(text(_SEARCH_SQL.format(filters=' '.join(filters))), params).all()
+    return [{
+        'type': row.kind,
+        'id': row.item_id,
+        'task_id': row.task_id if row.kind == 'subtask' else None,
+        'project_tag': row.project_tag,
+        'snippet': _render_snippet(row.snippet),
+        'rank': round(row.rank, 4),
+    } for row in rows]
+
+
+def rebuild_index() -> int:
+    """Rebuild the index from the base tables. Returns the number of indexed rows."""
+    for statement in _REBUILD_SQL:
+        db.session.execute(text(statement))
+    db.session.commit()
+    return db.session.execute(text("SELECT count(*) FROM search_index")).scalar()
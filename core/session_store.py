@@ -0,0 +1,290 @@
+"""Bounded, persistent store of chat histories.
+
+Hot sessions live in an in-memory LRU capped by ``max_sessions`` and evicted
+after ``idle_ttl`` seconds without access. Changes are written behind to a
+SQLite table by a background flusher, and sessions that are not in memory are
+loaded lazily from disk on first access, so history survives restarts while
+memory stays flat no matter how many anonymous sessions come and go.
+
+That cache is per process. With ``SHARED_STATE_URL`` set (core/shared_state.py)
+histories are kept in the shared backend instead, by
+:class:`SharedSessionStore`, so every worker sees the same history; each read
+and append is a single atomic operation on the backend.
+
+Configuration (environment variables):
+    CHAT_SESSIONS_PATH        SQLite file (default instance/chat_sessions.db)
+    CHAT_SESSIONS_MAX         sessions kept in memory (default 1000)
+    CHAT_SESSIONS_IDLE_TTL    seconds before an idle session leaves memory (default 1800)
+    CHAT_SESSIONS_FLUSH       seconds between write-behind flushes (default 2)
+"""
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from core import shared_state
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            "instance", "chat_sessions.db")
+
+logger = logging.getLogger(__name__)
+
+
+class _Session:
+    __slots__ = ("messages", "last_access", "dirty")
+
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.last_access = time.monotonic()
+        self.dirty = False
+
+
+class SessionStore:
+    def __init__(self, message_factory: Callable[[dict], object], path: str = DEFAULT_PATH,
+                 max_sessions: int = 1000, idle_ttl: float = 1800, max_messages: int = 100,
+                 flush_interval: float = 2.0):
+        """
+        message_factory turns a stored dict back into a message object; stored
+        messages must provide ``to_dict()``.
+        """
+        self.message_factory = message_factory
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval
+
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        # Serialized sessions waiting to be written (evicted or cleared while dirty)
+        self._pending: Dict[str, Optional[str]] = {}
+        # Taken out of _pending by a flush whose write has not committed yet;
+        # still newer than the disk rows, so _load reads them from here
+        self._inflight: Dict[str, Optional[str]] = {}
+        self._lock = threading.RLock()
+        # One flush at a time, so _inflight belongs to a single write
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"hits": 0, "loads": 0, "evictions": 0, "flushes": 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_sessions ("
+                "session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="chat-session-flusher", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # Public API
+
+    def get(self, session_id: str) -> list:
+        """Return a copy of the session's messages, loading it from disk if needed."""
+        with self._lock:
+            return list(self._touch(session_id).messages)
+
+    def append(self, session_id: str, *messages) -> None:
+        with self._lock:
+            session = self._touch(session_id)
+            session.messages.extend(messages)
+            del session.messages[:-self.max_messages]
+            session.dirty = True
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            # None marks the row for deletion on the next flush
+            self._pending[session_id] = None
+
+    def flush(self) -> int:
+        """Write all dirty sessions to disk. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+                self._pending.clear()
+                for session_id, session in self._sessions.items():
+                    if session.dirty:
+                        batch[session_id] = self._serialize(session)
+                        session.dirty = False
+                self._inflight = batch
+            if not batch:
+                return 0
+            now = time.time()
+            conn = self._connection()
+            try:
+                with conn:
+                    conn.executemany(
+                        "DELETE FROM chat_sessions WHERE session_id = ?",
+                        [(sid,) for sid, data in batch.items() if data is None]
+                    )
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO chat_sessions (session_id, messages, updated_at) VALUES (?, ?, ?)",
+                        [(sid, data, now) for sid, data in batch.items() if data is not None]
+                    )
+            except sqlite3.Error as e:
+                logger.error("sessions.flush_failed", extra={"sessions": len(batch), "error": str(e)})
+                # Put the batch back so the next flush retries it (newer pending entries win)
+                with self._lock:
+                    for sid, data in batch.items():
+                        self._pending.setdefault(sid, data)
+                    self._inflight = {}
+                return 0
+            with self._lock:
+                # Only now is the disk row as new as the batch
+                self._inflight = {}
+                self._stats["flushes"] += 1
+            return len(batch)
+
+    def evict_idle(self) -> int:
+        """Drop sessions idle for longer than idle_ttl from memory."""
+        deadline = time.monotonic() - self.idle_ttl
+        evicted = 0
+        with self._lock:
+            # The LRU order means idle sessions are at the front
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.last_access > deadline:
+                    break
+                self._evict(session_id)
+                evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_memory": len(self._sessions),
+                    "pending": len(self._pending) + len(self._inflight)}
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    # Internals
+
+    def _touch(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._stats["hits"] += 1
+            self._sessions.move_to_end(session_id)
+        else:
+            session = _Session(self._load(session_id))
+            self._stats["loads"] += 1
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._evict(next(iter(self._sessions)))
+        session.last_access = time.monotonic()
+        return session
+
+    def _load(self, session_id: str) -> list:
+        if session_id in self._pending:
+            data = self._pending[session_id]
+        elif session_id in self._inflight:
+            data = self._inflight[session_id]
+        else:
+            row = self._connection().execute(
+                "SELECT messages FROM chat_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            data = row[0] if row else None
+        if not data:
+            return []
+        return [self.message_factory(item) for item in json.loads(data)]
+
+    def _evict(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        if session.dirty:
+            self._pending[session_id] = self._serialize(session)
+        self._stats["evictions"] += 1
+
+    @staticmethod
+    def _serialize(session: _Session) -> str:
+        return json.dumps([m.to_dict() for m in session.messages], ensure_ascii=False)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.evict_idle()
+                self.flush()
+            except Exception:
+                logger.exception("sessions.flusher_failed")
+
+
+class SharedSessionStore:
+    """Chat histories in a shared-state backend, one capped list per session.
+
+    Same interface as :class:`SessionStore`, without a local cache: every
+    worker reads and appends to the same list, and there is nothing to flush.
+    """
+
+    def __init__(self, message_factory: Callable[[dict], object], backend, max_messages: int = 100,
+                 max_sessions: int = 1000):
+        self.message_factory = message_factory
+        self.backend = backend
+        self.max_messages = max_messages
+        # Not a bound here; kept for the interface of SessionStore
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._stats = {"reads": 0, "appends": 0}
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"chat:{session_id}"
+
+    def get(self, session_id: str) -> list:
+        items = self.backend.list_read(self._key(session_id))
+        with self._lock:
+            self._stats["reads"] += 1
+        return [self.message_factory(json.loads(item)) for item in items]
+
+    def append(self, session_id: str, *messages) -> None:
+        self.backend.list_append(self._key(session_id),
+                                 [json.dumps(m.to_dict(), ensure_ascii=False) for m in messages],
+                                 max_len=self.max_messages)
+        with self._lock:
+            self._stats["appends"] += 1
+
+    def clear(self, session_id: str) -> None:
+        self.backend.list_delete(self._key(session_id))
+
+    def flush(self) -> int:
+        return 0
+
+    def evict_idle(self) -> int:
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_memory": 0, "pending": 0, "backend": self.backend.name}
+
+    def close(self) -> None:
+        pass
+
+
+def create_session_store(message_factory: Callable[[dict], object], max_messages: int = 100):
+    """Build a store configured from the environment."""
+    backend = shared_state.get_backend()
+    if backend is not None:
+        return SharedSessionStore(message_factory, backend, max_messages=max_messages,
+                                  max_sessions=int(os.environ.get("CHAT_SESSIONS_MAX", 1000)))
+    return SessionStore(
+        message_factory,
+        path=os.environ.get("CHAT_SESSIONS_PATH", DEFAULT_PATH),
+        max_sessions=int(os.environ.get("CHAT_SESSIONS_MAX", 1000)),
+        idle_ttl=float(os.environ.get("CHAT_SESSIONS_IDLE_TTL", 1800)),
+        max_messages=max_messages,
+        flush_interval=float(os.environ.get("CHAT_SESSIONS_FLUSH", 2.0)),
+    )
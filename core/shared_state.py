@@ -0,0 +1,325 @@
+"""State shared by all worker processes: rate limits, chat histories and settings.
+
+With several gunicorn workers, anything kept in process memory is per worker:
+each one applies its own rate limits and sees its own chat histories and
+chat settings. With ``SHARED_STATE_URL`` set, they live in one backend
+instead:
+
+    sqlite:///path/to/shared_state.db   a SQLite file on the local disk (one host)
+    redis://host:6379/0                 any Redis-protocol server (needs ``redis``)
+
+Both backends offer the same small set of operations, each a single atomic
+statement or round trip: counters with an expiry (``incr``/``get``/
+``get_expiry``) for flask-limiter, capped append-only lists
+(``list_append``/``list_read``) for chat histories and plain values
+(``value_get``/``value_set``) for per-session LLM settings.
+:class:`LimiterStorage` plugs the backend into flask-limiter under the
+``shared://`` scheme, core/session_store.py keeps histories in it and
+backend/llm_config.py the settings.
+
+Without ``SHARED_STATE_URL`` the app keeps its single-process setup
+(``memory://`` rate limits, the write-behind session store and in-memory
+settings).
+
+:class:`RedisState` accepts a ready client, so any object with the redis-py
+API (e.g. a local stand-in in tests) can replace a real server.
+
+Configuration (environment variables):
+    SHARED_STATE_URL      backend URL (default unset: per-process state)
+    SHARED_STATE_PREFIX   key prefix in Redis (default kortex:)
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from limits.storage import Storage
+
+try:
+    import redis
+except ImportError:  # redis is optional, only needed for redis:// URLs
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Counters whose window has passed are removed every this many increments
+_PURGE_EVERY = 1000
+
+
+class SQLiteState:
+    """Shared state in a SQLite file; safe across processes on the same host.
+
+    Connections are per thread and in autocommit mode, so every operation is
+    one implicit transaction. WAL with ``synchronous=NORMAL`` keeps writes
+    cheap (no fsync per commit); the state is soft anyway.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._increments = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS counters ("
+                     "key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS list_items ("
+                     "seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, value TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_list_items_key ON list_items (key, seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # Counters
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        """Add ``amount``; a missing or expired counter restarts with an ``expiry`` second window."""
+        now = time.time()
+        value = self._connection().execute(
+            "INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING value",
+            (key, amount, now + expiry, now, now)
+        ).fetchone()[0]
+        with self._lock:
+            self._increments += 1
+            purge = self._increments % _PURGE_EVERY == 0
+        if purge:
+            self._connection().execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        return value
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connection().execute("SELECT expires_at FROM counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def clear_counter(self, key: str) -> None:
+        self._connection().execute("DELETE FROM counters WHERE key = ?", (key,))
+
+    def reset_counters(self) -> int:
+        return self._connection().execute("DELETE FROM counters").rowcount
+
+    # Lists
+
+    def list_append(self, key: str, values: List[str], max_len: Optional[int] = None) -> None:
+        """Append values and keep only the newest ``max_len``, atomically."""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany("INSERT INTO list_items (key, value) VALUES (?, ?)", [(key, v) for v in values])
+            if max_len:
+                conn.execute(
+                    "DELETE FROM list_items WHERE key = ? AND seq <= ("
+                    "SELECT seq FROM list_items WHERE key = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                    (key, key, max_len))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def list_read(self, key: str) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT value FROM list_items WHERE key = ? ORDER BY seq", (key,)).fetchall()
+        return [row[0] for row in rows]
+
+    def list_delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM list_items WHERE key = ?", (key,))
+
+    # Values
+
+    def value_get(self, key: str) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def value_set(self, key: str, value: str) -> None:
+        self._connection().execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, value))
+
+    def ping(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @property
+    def errors(self) -> tuple:
+        return (sqlite3.Error,)
+
+
+class RedisState:
+    """Shared state on a Redis-protocol server; safe across processes and hosts.
+
+    Uses only basic commands (GET, SET, INCRBY, PTTL, RPUSH, LTRIM, LRANGE,
+    DEL, SCAN, MULTI/EXEC), so compatible servers and in-process stand-ins
+    work too.
+    """
+    name = 'redis'
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = 'kortex:'):
+        if client is None:
+            if redis is None:
+                raise RuntimeError('SHARED_STATE_URL=redis://... needs the redis package')
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _counter(self, key: str) -> str:
+        return f'{self.prefix}counter:{key}'
+
+    def _list(self, key: str) -> str:
+        return f'{self.prefix}list:{key}'
+
+    def _value(self, key: str) -> str:
+        return f'{self.prefix}value:{key}'
+
+    @staticmethod
+    def _text(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    # Counters
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        name = self._counter(key)
+        # One MULTI/EXEC: a missing counter is created together with its
+        # expiry, so it can never be left without one
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(name, 0, ex=max(1, int(expiry)), nx=True)
+        pipe.incrby(name, amount)
+        _, value = pipe.execute()
+        return int(value)
+
+    def get(self, key: str) -> int:
+        return int(self.client.get(self._counter(key)) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        ttl = self.client.pttl(self._counter(key))
+        return time.time() + max(ttl, 0) / 1000
+
+    def clear_counter(self, key: str) -> None:
+        self.client.delete(self._counter(key))
+
+    def reset_counters(self) -> int:
+        keys = list(self.client.scan_iter(match=self._counter('*')))
+        return self.client.delete(*keys) if keys else 0
+
+    # Lists
+
+    def list_append(self, key: str, values: List[str], max_len: Optional[int] = None) -> None:
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(self._list(key), *values)
+        if max_len:
+            pipe.ltrim(self._list(key), -max_len, -1)
+        pipe.execute()
+
+    def list_read(self, key: str) -> List[str]:
+        return [self._text(value) for value in self.client.lrange(self._list(key), 0, -1)]
+
+    def list_delete(self, key: str) -> None:
+        self.client.delete(self._list(key))
+
+    # Values
+
+    def value_get(self, key: str) -> Optional[str]:
+        value = self.client.get(self._value(key))
+        return self._text(value) if value is not None else None
+
+    def value_set(self, key: str, value: str) -> None:
+        self.client.set(self._value(key), value)
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception:
+            return False
+
+    @property
+    def errors(self) -> tuple:
+        return (redis.RedisError,) if redis is not None else (ConnectionError,)
+
+
+def create_backend(url: Optional[str]):
+    """Build the backend for a SHARED_STATE_URL; ``None`` means per-process state."""
+    if not url or url.startswith('memory://'):
+        return None
+    if url.startswith('sqlite:///'):
+        return SQLiteState(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisState(url, prefix=os.environ.get('SHARED_STATE_PREFIX', 'kortex:'))
+    raise ValueError(f'Unsupported SHARED_STATE_URL: {url}')
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_backend_loaded = False
+
+
+def get_backend():
+    """The process-wide backend configured by SHARED_STATE_URL (or ``None``)."""
+    global _backend, _backend_loaded
+    with _backend_lock:
+        if not _backend_loaded:
+            _backend = create_backend(os.environ.get('SHARED_STATE_URL'))
+            _backend_loaded = True
+            if _backend is not None:
+                logger.info("shared_state.backend", extra={"backend": _backend.name})
+        return _backend
+
+
+class LimiterStorage(Storage):
+    """flask-limiter storage (``shared://``) backed by :func:`get_backend`.
+
+    Supports the default fixed-window strategy.
+    """
+    STORAGE_SCHEME = ['shared']
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, backend=None, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.backend = backend or get_backend()
+        if self.backend is None:
+            raise ValueError('shared:// rate limit storage needs SHARED_STATE_URL')
+
+    @property
+    def base_exceptions(self):
+        return self.backend.errors
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self.backend.incr(key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        return self.backend.get(key)
+
+    def get_expiry(self, key: str) -> float:
+        return self.backend.get_expiry(key)
+
+    def check(self) -> bool:
+        return self.backend.ping()
+
+    def reset(self) -> Optional[int]:
+        return self.backend.reset_counters()
+
+    def clear(self, key: str) -> None:
+        self.backend.clear_counter(key)
+
+
+def limiter_storage_uri() -> str:
+    """``storage_uri`` for flask-limiter: shared when a backend is configured."""
+    return 'shared://' if get_backend() is not None else 'memory://'
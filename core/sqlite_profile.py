@@ -0,0 +1,157 @@
+"""SQLite engine profile: WAL, per-connection pragmas, pooling and busy handling.
+
+WAL lets readers run next to one writer without blocking each other, and
+``synchronous=NORMAL`` only syncs at checkpoints instead of on every commit
+(safe against corruption under WAL; a power loss can drop the last commits).
+``busy_timeout`` makes a second writer wait for the lock instead of failing
+with "database is locked".
+
+``journal_mode`` and ``auto_vacuum`` are stored in the database file, so they
+are set once at startup by :func:`self_check`; the other pragmas are per
+connection and are applied by a ``connect`` listener to every pooled
+connection. ``auto_vacuum=INCREMENTAL`` lets compaction (core/archive.py)
+hand freed pages back to the filesystem with ``PRAGMA incremental_vacuum``.
+SQLite only changes it on an empty database; an existing file keeps its mode
+until a full ``VACUUM`` (``flask --app app compact-db --full-vacuum``).
+
+Configuration (environment variables):
+    DATABASE_URL              SQLAlchemy URL (default sqlite:///rafpad.db in instance/)
+    SQLITE_JOURNAL_MODE       default WAL
+    SQLITE_SYNCHRONOUS        OFF / NORMAL / FULL / EXTRA (default NORMAL)
+    SQLITE_AUTO_VACUUM        NONE / FULL / INCREMENTAL (default INCREMENTAL)
+    SQLITE_CACHE_SIZE         page cache; negative = KiB (default -65536, 64 MiB)
+    SQLITE_MMAP_SIZE          bytes of memory-mapped I/O (default 268435456)
+    SQLITE_BUSY_TIMEOUT       milliseconds to wait for a lock (default 5000)
+    SQLITE_FOREIGN_KEYS       "0" disables foreign key enforcement (default on)
+    SQLITE_POOL_SIZE          pooled connections (default 10)
+    SQLITE_MAX_OVERFLOW       extra connections under load (default 20)
+    SQLITE_POOL_TIMEOUT       seconds to wait for a free connection (default 10)
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+DEFAULT_URL = 'sqlite:///rafpad.db'
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+AUTO_VACUUM_MODES = ('NONE', 'FULL', 'INCREMENTAL')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SQLiteProfile:
+    journal_mode: str = 'WAL'
+    synchronous: str = 'NORMAL'
+    auto_vacuum: str = 'INCREMENTAL'
+    cache_size: int = -65536
+    mmap_size: int = 268435456
+    busy_timeout: int = 5000
+    foreign_keys: bool = True
+    pool_size: int = 10
+    max_overflow: int = 20
+    pool_timeout: float = 10
+
+    @classmethod
+    def from_env(cls) -> 'SQLiteProfile':
+        synchronous = os.environ.get('SQLITE_SYNCHRONOUS', cls.synchronous).upper()
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SYNCHRONOUS_LEVELS)}")
+        auto_vacuum = os.environ.get('SQLITE_AUTO_VACUUM', cls.auto_vacuum).upper()
+        if auto_vacuum not in AUTO_VACUUM_MODES:
+            raise ValueError(f"SQLITE_AUTO_VACUUM must be one of {', '.join(AUTO_VACUUM_MODES)}")
+        return cls(
+            journal_mode=os.environ.get('SQLITE_JOURNAL_MODE', cls.journal_mode).upper(),
+            synchronous=synchronous,
+            auto_vacuum=auto_vacuum,
+            cache_size=int(os.environ.get('SQLITE_CACHE_SIZE', cls.cache_size)),
+            mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', cls.mmap_size)),
+            busy_timeout=int(os.environ.get('SQLITE_BUSY_TIMEOUT', cls.busy_timeout)),
+            foreign_keys=os.environ.get('SQLITE_FOREIGN_KEYS', '1') != '0',
+            pool_size=int(os.environ.get('SQLITE_POOL_SIZE', cls.pool_size)),
+            max_overflow=int(os.environ.get('SQLITE_MAX_OVERFLOW', cls.max_overflow)),
+            pool_timeout=float(os.environ.get('SQLITE_POOL_TIMEOUT', cls.pool_timeout)),
+        )
+
+    def connection_pragmas(self) -> List[Tuple[str, object]]:
+        return [
+            ('busy_timeout', self.busy_timeout),
+            ('synchronous', self.synchronous),
+            ('cache_size', self.cache_size),
+            ('mmap_size', self.mmap_size),
+            ('foreign_keys', 'ON' if self.foreign_keys else 'OFF'),
+            ('temp_store', 'MEMORY'),
+        ]
+
+    def engine_options(self) -> Dict:
+        """Value for SQLALCHEMY_ENGINE_OPTIONS."""
+        return {
+            'poolclass': QueuePool,
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.pool_timeout,
+            'pool_pre_ping': True,
+            'connect_args': {
+                # sqlite3's own lock wait, in seconds; matches busy_timeout
+                'timeout': self.busy_timeout / 1000,
+                # Pooled connections move between request threads
+                'check_same_thread': False,
+            },
+        }
+
+
+def database_url() -> str:
+    return os.environ.get('DATABASE_URL', DEFAULT_URL)
+
+
+def configure(app, profile: SQLiteProfile) -> None:
+    """Set the database URL and engine options on a Flask app before db.init_app()."""
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = profile.engine_options()
+
+
+def install(engine: Engine, profile: SQLiteProfile) -> None:
+    """Apply the per-connection pragmas to every new connection of the engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in profile.connection_pragmas():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+
+def self_check(engine: Engine, profile: SQLiteProfile) -> Dict[str, object]:
+    """Switch the journal and auto-vacuum modes, then read back and log the effective settings."""
+    if engine.dialect.name != 'sqlite':
+        return {}
+    with engine.connect() as connection:
+        raw = connection.connection.dbapi_connection
+        # Only takes effect before the first table is created (or after VACUUM)
+        raw.execute(f'PRAGMA auto_vacuum = {profile.auto_vacuum}')
+        journal_mode = raw.execute(f'PRAGMA journal_mode = {profile.journal_mode}').fetchone()[0]
+        effective = {'journal_mode': journal_mode.upper()}
+        effective['auto_vacuum'] = AUTO_VACUUM_MODES[raw.execute('PRAGMA auto_vacuum').fetchone()[0]]
+        for name, _ in profile.connection_pragmas():
+            effective[name] = raw.execute(f'PRAGMA {name}').fetchone()[0]
+    effective['synchronous'] = SYNCHRONOUS_LEVELS[effective['synchronous']]
+    effective['pool_size'] = profile.pool_size
+    effective['max_overflow'] = profile.max_overflow
+
+    logger.info("db.sqlite_profile", extra={"database": engine.url.database, **effective})
+    for name in ('journal_mode', 'synchronous', 'auto_vacuum'):
+        if effective[name] != getattr(profile, name):
+            # e.g. in-memory databases cannot use WAL; existing files keep
+            # their auto_vacuum mode until a full VACUUM
+            logger.warning("db.sqlite_profile_mismatch",
+                           extra={"pragma": name, "effective": effective[name], "wanted": getattr(profile, name)})
+    return effective
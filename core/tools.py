@@ -0,0 +1,272 @@
+"""Chat tools: OpenAI-style definitions and a transactional executor.
+
+The chat model gets :data:`DEFINITIONS` as ``tools`` and may answer with any
+number of tool calls at once (e.g. three tasks and a note from one message).
+:func:`execute` runs all of them in a single transaction: projects are
+resolved through the tag cache, rows are added together and committed once,
+and the results go back to the model in one follow-up turn (see
+``LLMInference.generate_response``).
+
+Every call is validated on its own and gets its own result, like the bulk
+endpoints: a call with bad arguments or a missing target reports an error
+while the valid ones are written. A database failure rolls the whole batch
+back and every call reports it.
+
+Tools:
+    add_task   new task (content, project_tag, priority, deadline, subtasks)
+    add_note   new note (content, project_tag, category)
+    move       move a task or note to another existing project
+    complete   mark a task as done (or not done)
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from core import metrics, projects
+from models import db, Note, Task, Subtask
+
+logger = logging.getLogger(__name__)
+
+MAX_TOOL_CALLS = 20
+PRIORITIES = ('low', 'medium', 'high')
+
+DEFINITIONS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "add_task",
+            "description": "Dodaje nowe zadanie użytkownika.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "content": {"type": "string", "description": "Treść zadania"},
+                    "project_tag": {"type": "string", "description": "Tag projektu, np. #praca (domyślnie #inbox)"},
+                    "priority": {"type": "string", "enum": list(PRIORITIES)},
+                    "deadline": {"type": "string", "description": "Termin w formacie ISO 8601"},
+                    "subtasks": {"type": "array", "items": {"type": "string"}, "description": "Treści podzadań"},
+                },
+                "required": ["content"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "add_note",
+            "description": "Dodaje nową notatkę użytkownika.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "content": {"type": "string", "description": "Treść notatki"},
+                    "project_tag": {"type": "string", "description": "Tag projektu, np. #praca (domyślnie #inbox)"},
+                    "category": {"type": "string"},
+                },
+                "required": ["content"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "move",
+            "description": "Przenosi zadanie lub notatkę do innego istniejącego projektu.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "element_type": {"type": "string", "enum": ["task", "note"]},
+                    "id": {"type": "integer"},
+                    "project_tag": {"type": "string", "description": "Tag projektu docelowego"},
+                },
+                "required": ["element_type", "id", "project_tag"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "complete",
+            "description": "Oznacza zadanie jako wykonane (lub z powrotem jako niewykonane).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "task_id": {"type": "integer"},
+                    "completed": {"type": "boolean", "description": "Domyślnie true"},
+                },
+                "required": ["task_id"],
+            },
+        },
+    },
+]
+
+NAMES = tuple(definition["function"]["name"] for definition in DEFINITIONS)
+
+
+class ToolError(ValueError):
+    """One tool call cannot be carried out (bad arguments or missing target)."""
+
+
+def _text(args: dict, name: str, required: bool = False) -> str:
+    value = args.get(name)
+    if value is None or value == "":
+        if required:
+            raise ToolError(f"Missing {name}")
+        return ""
+    if not isinstance(value, str):
+        raise ToolError(f"{name} must be a string")
+    return value.strip()
+
+
+def _integer(args: dict, name: str) -> int:
+    value = args.get(name)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ToolError(f"{name} must be an integer")
+    try:
+        return int(value)
+    except ValueError:
+        raise ToolError(f"{name} must be an integer")
+
+
+def _add_task(args: dict, now: datetime, sanitize: Callable[[str], str]) -> dict:
+    content = sanitize(_text(args, "content", required=True)).strip()
+    if not content:
+        raise ToolError("Missing content")
+    priority = _text(args, "priority") or None
+    if priority is not None and priority not in PRIORITIES:
+        raise ToolError(f"priority must be one of {', '.join(PRIORITIES)}")
+    deadline = None
+    if _text(args, "deadline"):
+        try:
+            deadline = datetime.fromisoformat(args["deadline"])
+        except ValueError:
+            raise ToolError("Invalid deadline format")
+    subtasks = args.get("subtasks") or []
+    if not isinstance(subtasks, list) or not all(isinstance(s, str) for s in subtasks):
+        raise ToolError("subtasks must be a list of non-empty strings")
+    subtasks = [sanitize(s).strip() for s in subtasks]
+    if not all(subtasks):
+        raise ToolError("subtasks must be a list of non-empty strings")
+    project_tag = _text(args, "project_tag") or projects.DEFAULT_TAG
+    task = Task(content=content, priority=priority, deadline=deadline,
+                project_id=projects.get_or_create(project_tag), created_at=now, updated_at=now)
+    task.subtasks = [Subtask(content=s[:200], created_at=now) for s in subtasks]
+    db.session.add(task)
+    return {"task": task, "project_tag": project_tag,
+            "message": f"Dodano zadanie \"{content}\" ({project_tag})."}
+
+
+def _add_note(args: dict, now: datetime, sanitize: Callable[[str], str]) -> dict:
+    content = sanitize(_text(args, "content", required=True)).strip()
+    if not content:
+        raise ToolError("Missing content")
+    project_tag = _text(args, "project_tag") or projects.DEFAULT_TAG
+    note = Note(content=content, category=_text(args, "category") or None,
+                project_id=projects.get_or_create(project_tag), created_at=now, updated_at=now)
+    db.session.add(note)
+    return {"note": note, "project_tag": project_tag,
+            "message": f"Dodano notatkę ({project_tag})."}
+
+
+def _move(args: dict, now: datetime, sanitize: Callable[[str], str]) -> dict:
+    element_type = _text(args, "element_type", required=True)
+    models = {"task": Task, "note": Note}
+    if element_type not in models:
+        raise ToolError("element_type must be task or note")
+    element_id = _integer(args, "id")
+    project_tag = _text(args, "project_tag", required=True)
+    element = db.session.get(models[element_type], element_id)
+    if element is None or element.is_deleted:
+        raise ToolError(f"{element_type} {element_id} not found")
+    project_id = projects.resolve(project_tag)
+    if project_id is None:
+        raise ToolError(f"Project {project_tag} not found")
+    element.project_id = project_id
+    element.updated_at = now
+    label = "zadanie" if element_type == "task" else "notatkę"
+    return {"id": element_id, "element_type": element_type, "project_tag": project_tag,
+            "message": f"Przeniesiono {label} #{element_id} do {project_tag}."}
+
+
+def _complete(args: dict, now: datetime, sanitize: Callable[[str], str]) -> dict:
+    task_id = _integer(args, "task_id")
+    completed = args.get("completed", True)
+    if not isinstance(completed, bool):
+        raise ToolError("completed must be a boolean")
+    task = db.session.get(Task, task_id)
+    if task is None or task.is_deleted:
+        raise ToolError(f"task {task_id} not found")
+    task.is_completed = completed
+    task.updated_at = now
+    state = "wykonane" if completed else "niewykonane"
+    return {"id": task_id, "is_completed": completed,
+            "message": f"Oznaczono zadanie #{task_id} jako {state}."}
+
+
+HANDLERS = {
+    "add_task": _add_task,
+    "add_note": _add_note,
+    "move": _move,
+    "complete": _complete,
+}
+
+
+def _error(call: Dict, message: str) -> dict:
+    return {"tool_call_id": call.get("id"), "name": call.get("name"), "status": "error", "error": message,
+            "message": f"Nie udało się wykonać {call.get('name')}: {message}"}
+
+
+def execute(calls: List[Dict], sanitize: Callable[[str], str] = lambda text: text) -> List[dict]:
+    """Run tool calls (``{"id", "name", "arguments"}``, arguments as JSON text) in one transaction.
+
+    Returns one result per call, in order, with ``tool_call_id``, ``name``,
+    ``status`` ("ok" or "error"), the tool's fields or ``error``, and a short
+    ``message`` for the user.
+    """
+    now = datetime.utcnow()
+    batch = calls[:MAX_TOOL_CALLS]
+    results, staged = [], []
+    try:
+        for call in batch:
+            handler = HANDLERS.get(call.get("name"))
+            if handler is None:
+                results.append(_error(call, "Unknown tool"))
+                continue
+            try:
+                args = json.loads(call.get("arguments") or "{}")
+                if not isinstance(args, dict):
+                    raise ToolError("Arguments must be an object")
+                outcome = handler(args, now, sanitize)
+            except (ToolError, json.JSONDecodeError) as e:
+                results.append(_error(call, str(e)))
+                continue
+            result = {"tool_call_id": call.get("id"), "name": call["name"], "status": "ok", **outcome}
+            results.append(result)
+            staged.append(result)
+
+        if staged:
+            # Flushed first, so the new rows' ids are known without a reload after the commit
+            db.session.flush()
+            for result in staged:
+                for key in ("task", "note"):
+                    row = result.pop(key, None)
+                    if row is not None:
+                        result["id"] = row.id
+            db.session.commit()
+    except Exception as e:
+        # A database failure (in a handler, the flush or the commit): nothing of the
+        # batch is saved, and the session is usable again for the rest of the request
+        db.session.rollback()
+        logger.error("tool.batch_failed", extra={"calls": len(batch), "error": str(e)})
+        results = [result if result["status"] == "error" else _error(call, f"Not saved: {e}")
+                   for call, result in zip(batch, results)]
+        results += [_error(call, f"Not saved: {e}") for call in batch[len(results):]]
+    for call in calls[MAX_TOOL_CALLS:]:
+        results.append(_error(call, f"Too many tool calls (max {MAX_TOOL_CALLS})"))
+
+    for result in results:
+        metrics.llm_tool_calls.inc(tool=result["name"] or "unknown", status=result["status"])
+    logger.info("tool.batch", extra={
+        "calls": len(calls), "ok": sum(1 for r in results if r["status"] == "ok"),
+        "tools": [r["name"] for r in results],
+    })
+    return results
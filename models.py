@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import relationship
-from sqlalchemy import DateTime, Integer, String, Text, Boolean, ForeignKey
+from sqlalchemy import DateTime, Integer, String, Text, Boolean, ForeignKey, Index, text
 
 db = SQLAlchemy()
 
@@ -24,6 +24,14 @@ class Project(db.Model):
 
 class Note(db.Model):
     __tablename__ = 'notes'
+    # Indeksy pod listy: filtr deleted_at IS NULL, grupowanie po projekcie, sortowanie po czasie
+    # (utrzymywane razem z core/migrations.py)
+    __table_args__ = (
+        Index('ix_notes_project_deleted_updated', 'project_id', 'deleted_at', 'updated_at'),
+        Index('ix_notes_live_updated', 'updated_at', 'id', sqlite_where=text('deleted_at IS NULL')),
+        # Tylko usunięte wiersze: kompaktowanie (core/archive.py) nie skanuje całej tabeli
+        Index('ix_notes_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+    )
     
     id = db.Column(Integer, primary_key=True)
     content = db.Column(Text, nullable=False)
@@ -41,6 +49,12 @@ class Note(db.Model):
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_project_deleted_updated', 'project_id', 'deleted_at', 'updated_at'),
+        Index('ix_tasks_live_updated', 'updated_at', 'id', sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_tasks_open_deadline', 'deadline', sqlite_where=text('is_completed = 0')),
+        Index('ix_tasks_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+    )
     
     id = db.Column(Integer, primary_key=True)
     content = db.Column(Text, nullable=False)
@@ -65,6 +79,9 @@ class Task(db.Model):
 
 class Subtask(db.Model):
     __tablename__ = 'subtasks'
+    __table_args__ = (
+        Index('ix_subtasks_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+    )
     
     id = db.Column(Integer, primary_key=True)
     content = db.Column(String(200), nullable=False)
@@ -73,8 +90,79 @@ class Subtask(db.Model):
     deleted_at = db.Column(DateTime, nullable=True)  # Soft delete
     
     # Klucz obcy do zadania
-    task_id = db.Column(Integer, ForeignKey('tasks.id'), nullable=False)
+    task_id = db.Column(Integer, ForeignKey('tasks.id'), nullable=False, index=True)
     
     @property
     def is_deleted(self):
-        return self.deleted_at is not None 
\ No newline at end of file
+        return self.deleted_at is not None
+
+# Archiwum: wiersze usunięte dawniej niż okres retencji (core/archive.py).
+# Te same kolumny co tabele główne plus archived_at, bez kluczy obcych,
+# żeby archiwum przetrwało usunięcie projektu lub zadania. Własny klucz
+# (id), bo id z tabeli głównej może zostać ponownie użyte (original_id).
+class ArchivedNote(db.Model):
+    __tablename__ = 'notes_archive'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(Integer, primary_key=True)
+    original_id = db.Column(Integer, nullable=False, index=True)
+    content = db.Column(Text, nullable=False)
+    category = db.Column(String(50))
+    created_at = db.Column(DateTime)
+    updated_at = db.Column(DateTime)
+    deleted_at = db.Column(DateTime)
+    project_id = db.Column(Integer, nullable=False)
+    archived_at = db.Column(DateTime, nullable=False)
+
+class ArchivedTask(db.Model):
+    __tablename__ = 'tasks_archive'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(Integer, primary_key=True)
+    original_id = db.Column(Integer, nullable=False, index=True)
+    content = db.Column(Text, nullable=False)
+    category = db.Column(String(50))
+    priority = db.Column(String(20))
+    deadline = db.Column(DateTime)
+    is_completed = db.Column(Boolean)
+    created_at = db.Column(DateTime)
+    updated_at = db.Column(DateTime)
+    deleted_at = db.Column(DateTime)
+    project_id = db.Column(Integer, nullable=False)
+    archived_at = db.Column(DateTime, nullable=False)
+
+class ArchivedSubtask(db.Model):
+    __tablename__ = 'subtasks_archive'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(Integer, primary_key=True)
+    original_id = db.Column(Integer, nullable=False, index=True)
+    content = db.Column(String(200), nullable=False)
+    is_completed = db.Column(Boolean)
+    created_at = db.Column(DateTime)
+    deleted_at = db.Column(DateTime)
+    task_id = db.Column(Integer, nullable=False, index=True)  # id zadania w tabeli głównej
+    # Wiersz archiwum zadania, gdy podzadanie zarchiwizowano razem z nim
+    archived_task_id = db.Column(Integer, index=True)
+    archived_at = db.Column(DateTime, nullable=False)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    # Kolejka zadań w tle (core/jobs.py); indeks pod wznawianie oczekujących po restarcie
+    __table_args__ = (
+        Index('ix_jobs_status', 'status'),
+    )
+
+    id = db.Column(Integer, primary_key=True)
+    kind = db.Column(String(50), nullable=False)  # np. ai_task, compact
+    status = db.Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(Text, nullable=False)  # JSON
+    result = db.Column(Text)  # JSON
+    error = db.Column(Text)
+    attempts = db.Column(Integer, nullable=False, default=0)
+    max_attempts = db.Column(Integer, nullable=False, default=3)
+    worker_id = db.Column(String(100))  # proces, który wykonuje zadanie
+    lease_until = db.Column(DateTime)  # odnawiane w trakcie; po upływie zadanie wraca do kolejki
+    created_at = db.Column(DateTime, default=datetime.utcnow)
+    updated_at = db.Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(DateTime)
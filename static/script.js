@@ -284,27 +284,122 @@ function clearForm() {
     currentElementType = null;
 }
 
+// Paginacja list (keyset cursor z nagłówka X-Next-Cursor)
+const PAGE_SIZE = 50;
+const NOTE_LIST_FIELDS = 'id,content,category,project_tag,created_at';
+const TASK_LIST_FIELDS = 'id,content,category,priority,deadline,project_tag,subtasks';
+const listState = {
+    notes: { cursor: null, loading: false },
+    tasks: { cursor: null, loading: false }
+};
+
+// Walidatory odpowiedzi GET (ETag): niezmienione dane wracają jako 304 bez treści
+const validatorCache = new Map();
+
+async function fetchWithValidators(url) {
+    const cached = validatorCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    // no-store: walidatory wysyłamy sami, więc pamięć przeglądarki nie jest potrzebna
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    if (response.status === 304 && cached) {
+        return { ...cached, notModified: true };
+    }
+    if (!response.ok) {
+        throw new Error(`Failed to load ${url}`);
+    }
+    const entry = {
+        data: await response.json(),
+        nextCursor: response.headers.get('X-Next-Cursor'),
+        etag: response.headers.get('ETag')
+    };
+    if (entry.etag) validatorCache.set(url, entry);
+    return { ...entry, notModified: false };
+}
+
+async function fetchPage(endpoint, fields, filters, cursor = null) {
+    const params = new URLSearchParams({ limit: PAGE_SIZE, fields: fields });
+    Object.entries(filters).forEach(([key, value]) => {
+        if (value) params.set(key, value);
+    });
+    if (cursor) params.set('cursor', cursor);
+
+    const result = await fetchWithValidators(`${endpoint}?${params.toString()}`);
+    return {
+        items: result.data,
+        nextCursor: result.nextCursor,
+        notModified: result.notModified
+    };
+}
+
+function getNoteFilters() {
+    return {
+        project_tag: document.getElementById('note-filter-project').value,
+        category: document.getElementById('note-filter-category').value
+    };
+}
+
+function getTaskFilters() {
+    return {
+        project_tag: document.getElementById('task-filter-project').value,
+        category: document.getElementById('task-filter-category').value
+    };
+}
+
+// Ładuje pierwszą stronę notatek lub dokleja kolejną
+async function loadNotes(append = false) {
+    const state = listState.notes;
+    if (append && (state.loading || !state.cursor)) return;
+    state.loading = true;
+    try {
+        const page = await fetchPage('/api/notes', NOTE_LIST_FIELDS, getNoteFilters(), append ? state.cursor : null);
+        // Odświeżenie bez zmian: zostaw listę (i doładowane strony) jak jest
+        if (!append && page.notModified) return;
+        state.cursor = page.nextCursor;
+        displayNotes(page.items, append);
+    } finally {
+        state.loading = false;
+    }
+}
+
+// Ładuje pierwszą stronę zadań lub dokleja kolejną
+async function loadTasks(append = false) {
+    const state = listState.tasks;
+    if (append && (state.loading || !state.cursor)) return;
+    state.loading = true;
+    try {
+        const page = await fetchPage('/api/tasks', TASK_LIST_FIELDS, getTaskFilters(), append ? state.cursor : null);
+        // Odświeżenie bez zmian: zostaw listę (i doładowane strony) jak jest
+        if (!append && page.notModified) return;
+        state.cursor = page.nextCursor;
+        displayTasks(page.items, append);
+    } finally {
+        state.loading = false;
+    }
+}
+
 // Dodaj infinite scroll
 function setupInfiniteScroll() {
-    const notesList = document.querySelector('.notes-list');
-    notesList.addEventListener('scroll', async () => {
-        if (notesList.scrollHeight - notesList.scrollTop === notesList.clientHeight) {
-            currentPage++;
-            const newElements = await loadElements(currentPage);
-            displayElements(newElements);
-        }
+    [['.notes-list', loadNotes], ['.tasks-list', loadTasks]].forEach(([selector, loadPage]) => {
+        const list = document.querySelector(selector);
+        list.addEventListener('scroll', () => {
+            if (list.scrollHeight - list.scrollTop - list.clientHeight < 50) {
+                loadPage(true).catch(error => console.error('Error loading next page:', error));
+            }
+        });
     });
 }
 
 // Wyświetlanie notatek
-function displayNotes(notes) {
+function displayNotes(notes, append = false) {
     const notesList = document.querySelector('.notes-list');
     const template = notesList.querySelector('.note-item.template');
     
     // Zachowaj template przed czyszczeniem
     const templateClone = template.cloneNode(true);
-    notesList.innerHTML = ''; // Wyczyść listę
-    notesList.appendChild(templateClone); // Przywróć template
+    if (!append) {
+        notesList.innerHTML = ''; // Wyczyść listę
+        notesList.appendChild(templateClone); // Przywróć template
+    }
     
     notes.forEach(note => {
         const noteElement = templateClone.cloneNode(true);
@@ -326,14 +421,16 @@ function displayNotes(notes) {
 }
 
 // Wyświetlanie zadań
-function displayTasks(tasks) {
+function displayTasks(tasks, append = false) {
     const tasksList = document.querySelector('.tasks-list');
     const template = tasksList.querySelector('.task-item.template');
     
     // Zachowaj template przed czyszczeniem
     const templateClone = template.cloneNode(true);
-    tasksList.innerHTML = ''; // Wyczyść listę
-    tasksList.appendChild(templateClone); // Przywróć template
+    if (!append) {
+        tasksList.innerHTML = ''; // Wyczyść listę
+        tasksList.appendChild(templateClone); // Przywróć template
+    }
     
     tasks.forEach(task => {
         const taskElement = templateClone.cloneNode(true);
@@ -371,8 +468,7 @@ function displayTasks(tasks) {
 // Funkcje do edycji i usuwania
 async function editNote(noteId) {
     try {
-        const response = await fetch(`/api/notes/${noteId}`);
-        const note = await response.json();
+        const note = (await fetchWithValidators(`/api/notes/${noteId}`)).data;
         
         const modalForm = document.getElementById('modal-form');
         modalForm.innerHTML = `
@@ -427,8 +523,7 @@ async function deleteNote(noteId) {
 
 async function editTask(taskId) {
     try {
-        const response = await fetch(`/api/tasks/${taskId}`);
-        const task = await response.json();
+        const task = (await fetchWithValidators(`/api/tasks/${taskId}`)).data;
         
         const modalForm = document.getElementById('modal-form');
         modalForm.innerHTML = `
@@ -499,8 +594,7 @@ async function deleteTask(taskId) {
 // Funkcja do ładowania projektów do filtrów
 async function loadProjectFilters() {
     try {
-        const response = await fetch('/api/projects');
-        const projects = await response.json();
+        const projects = (await fetchWithValidators('/api/projects')).data;
         
         const filterSelects = document.querySelectorAll('.filter-project');
         filterSelects.forEach(select => {
@@ -516,7 +610,7 @@ async function loadProjectFilters() {
     }
 }
 
-// Obsługa filtrowania
+// Obsługa filtrowania (po stronie serwera)
 function setupFilters() {
     // Filtrowanie notatek
     const noteProjectFilter = document.getElementById('note-filter-project');
@@ -524,9 +618,7 @@ function setupFilters() {
     
     [noteProjectFilter, noteCategoryFilter].forEach(filter => {
         filter.addEventListener('change', () => {
-            const projectTag = noteProjectFilter.value;
-            const category = noteCategoryFilter.value;
-            filterNotes(projectTag, category);
+            loadNotes().catch(error => console.error('Error filtering notes:', error));
         });
     });
     
@@ -536,9 +628,7 @@ function setupFilters() {
     
     [taskProjectFilter, taskCategoryFilter].forEach(filter => {
         filter.addEventListener('change', () => {
-            const projectTag = taskProjectFilter.value;
-            const category = taskCategoryFilter.value;
-            filterTasks(projectTag, category);
+            loadTasks().catch(error => console.error('Error filtering tasks:', error));
         });
     });
 }
@@ -560,6 +650,7 @@ document.addEventListener('DOMContentLoaded', () => {
     loadElements();
     loadProjectFilters();
     setupFilters();
+    setupInfiniteScroll();
 });
 
 // Funkcje do aktualizacji
@@ -595,49 +686,11 @@ async function updateTask(taskId, updatedData) {
     return await response.json();
 }
 
-// Funkcja do filtrowania notatek
-function filterNotes(projectTag, category) {
-    const notesList = document.querySelector('.notes-list');
-    const notes = notesList.querySelectorAll('.note-item:not(.template)');
-    
-    notes.forEach(note => {
-        const noteProjectTag = note.querySelector('.note-project-tag').textContent;
-        const noteCategory = note.querySelector('.note-category').textContent;
-        
-        const projectMatch = !projectTag || noteProjectTag === projectTag;
-        const categoryMatch = !category || noteCategory === category;
-        
-        note.style.display = projectMatch && categoryMatch ? 'block' : 'none';
-    });
-}
-
-// Funkcja do filtrowania zadań
-function filterTasks(projectTag, category) {
-    const tasksList = document.querySelector('.tasks-list');
-    const tasks = tasksList.querySelectorAll('.task-item:not(.template)');
-    
-    tasks.forEach(task => {
-        const taskProjectTag = task.querySelector('.task-project-tag').textContent;
-        const taskCategory = task.querySelector('.task-category').textContent;
-        
-        const projectMatch = !projectTag || taskProjectTag === projectTag;
-        const categoryMatch = !category || taskCategory === category;
-        
-        task.style.display = projectMatch && categoryMatch ? 'block' : 'none';
-    });
-}
-
 // Zmiana funkcji loadElements
 async function loadElements() {
     try {
-        // Pobierz notatki i zadania
-        const [notes, tasks] = await Promise.all([
-            fetch('/api/notes').then(r => r.json()),
-            fetch('/api/tasks').then(r => r.json())
-        ]);
-        
-        displayNotes(notes);
-        displayTasks(tasks);
+        // Pobierz pierwszą stronę notatek i zadań
+        await Promise.all([loadNotes(), loadTasks()]);
     } catch (error) {
         console.error('Error loading elements:', error);
     }
@@ -659,6 +712,7 @@ function addMessage(content, role) {
     messageDiv.textContent = content;
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
 }
 
 // Function to send a message to the API
@@ -687,28 +741,97 @@ async function sendMessage(message) {
     }
 }
 
-// Event listeners
-sendButton.addEventListener('click', async () => {
+// Function to stream a response from the API (Server-Sent Events over fetch)
+// Renders tokens into messageDiv as they arrive and returns the final response.
+async function sendMessageStream(message, messageDiv) {
+    const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            message: message,
+            session_id: sessionId
+        })
+    });
+    if (!response.ok || !response.body) {
+        throw new Error('Streaming not available');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let content = '';
+    let finalResponse = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) eventName = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            });
+            const payload = data ? JSON.parse(data) : {};
+
+            if (eventName === 'reasoning' && !content) {
+                messageDiv.classList.add('reasoning-message');
+                messageDiv.textContent += payload.content;
+            } else if (eventName === 'delta') {
+                if (!content) {
+                    messageDiv.classList.remove('reasoning-message');
+                    messageDiv.textContent = '';
+                }
+                content += payload.content;
+                messageDiv.textContent = content;
+            } else if (eventName === 'done') {
+                finalResponse = payload.response;
+            } else if (eventName === 'error') {
+                throw new Error(payload.error);
+            }
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+    }
+    return finalResponse !== null ? finalResponse : content;
+}
+
+async function handleSend() {
     const message = chatInput.value.trim();
-    if (message) {
-        addMessage(message, 'user');
-        chatInput.value = '';
-        
-        const response = await sendMessage(message);
-        addMessage(response, 'assistant');
+    if (!message) return;
+
+    addMessage(message, 'user');
+    chatInput.value = '';
+
+    const messageDiv = addMessage('', 'assistant');
+    try {
+        const response = await sendMessageStream(message, messageDiv);
+        messageDiv.classList.remove('reasoning-message');
+        messageDiv.textContent = response;
+    } catch (error) {
+        console.error('Error streaming message:', error);
+        messageDiv.classList.remove('reasoning-message');
+        // Fall back to the blocking endpoint only if nothing was streamed yet
+        messageDiv.textContent = messageDiv.textContent
+            ? 'Sorry, there was an error processing your message.'
+            : await sendMessage(message);
     }
-});
+}
+
+// Event listeners
+sendButton.addEventListener('click', handleSend);
 
 chatInput.addEventListener('keypress', async (e) => {
     if (e.key === 'Enter') {
-        const message = chatInput.value.trim();
-        if (message) {
-            addMessage(message, 'user');
-            chatInput.value = '';
-            
-            const response = await sendMessage(message);
-            addMessage(response, 'assistant');
-        }
+        await handleSend();
     }
 });
 
@@ -748,6 +871,7 @@ async function loadChatHistory() {
 // Initialize chat
 document.addEventListener('DOMContentLoaded', () => {
     loadChatHistory();
+    restoreAiSettings();
 });
 
 // Obsługa ustawień AI
@@ -791,6 +915,23 @@ function loadAiSettings() {
     }
 }
 
+// Ustawienia są przypisane do sesji czatu na serwerze, więc nowa sesja dostaje zapisane ustawienia
+async function restoreAiSettings() {
+    const savedSettings = localStorage.getItem('aiSettings');
+    if (!savedSettings) return;
+    try {
+        await fetch('/api/chat/settings', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ ...JSON.parse(savedSettings), session_id: sessionId })
+        });
+    } catch (error) {
+        console.error('Error restoring settings:', error);
+    }
+}
+
 // Funkcja do zapisywania ustawień
 function saveAiSettings() {
     const settings = {
@@ -838,7 +979,8 @@ aiSettingsSave.addEventListener('click', async () => {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify(settings)
+            // Ustawienia dotyczą tylko tej sesji czatu
+            body: JSON.stringify({ ...settings, session_id: sessionId })
         });
         
         if (response.ok) {